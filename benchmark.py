@@ -0,0 +1,437 @@
+import argparse
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from pathlib import Path
+from types import SimpleNamespace
+
+import cv2
+import numpy as np
+
+from contourlet_filter import ContourletTransform
+from dataset_paths import list_images
+
+
+# (height, width); the last one is a full-resolution panoramic radiograph
+DEFAULT_SIZES = [(128, 128), (256, 256), (512, 512), (640, 1280), (1024, 2048), (1536, 3072)]
+QUICK_SIZES = [(128, 128), (512, 512), (1024, 2048)]
+
+
+def summarize(samples):
+    """Timing statistics in milliseconds for a list of durations in seconds"""
+    ms = sorted(s * 1000 for s in samples)
+    return {
+        'runs': len(ms),
+        'mean_ms': statistics.fmean(ms),
+        'median_ms': statistics.median(ms),
+        'min_ms': ms[0],
+        'p95_ms': ms[min(len(ms) - 1, int(round(0.95 * (len(ms) - 1))))],
+        'stdev_ms': statistics.stdev(ms) if len(ms) > 1 else 0.0,
+    }
+
+
+def environment_info():
+    """Machine and code version the results were measured on"""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    return {
+        'commit': commit,
+        'timestamp': datetime.now(timezone.utc).isoformat(),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'cpu_count': os.cpu_count(),
+        'numpy': np.__version__,
+        'opencv': cv2.__version__,
+        'opencv_threads': cv2.getNumThreads(),
+    }
+
+
+def load_source_image(images_dir):
+    """First readable dataset image, or a synthetic radiograph-like image when there is none"""
+    for image_file in list_images(images_dir) if Path(images_dir).is_dir() else []:
+        image = cv2.imread(str(image_file), cv2.IMREAD_COLOR)
+        if image is not None:
+            return image, str(image_file)
+    
+    rng = np.random.default_rng(0)
+    synthetic = cv2.GaussianBlur(rng.integers(0, 256, (768, 1536), dtype=np.uint8), (0, 0), 6)
+    return cv2.cvtColor(synthetic, cv2.COLOR_GRAY2BGR), "synthetic"
+
+
+def time_call(fn, repeats, warmup):
+    for _ in range(warmup):
+        fn()
+    samples = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - start)
+    return samples
+
+
+def bench_contourlet(images_dir, sizes, levels, directions, filter_modes, repeats, warmup):
+    """
+    ContourletTransform.apply over a grid of image sizes and filter parameters
+    
+    Each size is the dataset image resized to it, so larger-than-dataset sizes
+    (synthetic panoramics) keep realistic radiograph content.
+    """
+    source, source_name = load_source_image(images_dir)
+    print(f"\nContourletTransform.apply (source: {source_name})")
+    results = []
+    for height, width in sizes:
+        image = cv2.resize(source, (width, height), interpolation=cv2.INTER_AREA)
+        for num_levels in levels:
+            for num_directions in directions:
+                for filter_mode in filter_modes:
+                    transform = ContourletTransform(
+                        num_levels=num_levels, num_directions=num_directions, filter_mode=filter_mode
+                    )
+                    stats = summarize(time_call(lambda: transform.apply(image), repeats, warmup))
+                    stats['megapixels_per_s'] = (height * width / 1e6) / (stats['median_ms'] / 1000)
+                    results.append({
+                        'name': f"contourlet/{height}x{width}/L{num_levels}/D{num_directions}/{filter_mode}",
+                        'height': height,
+                        'width': width,
+                        'num_levels': num_levels,
+                        'num_directions': num_directions,
+                        'filter_mode': filter_mode,
+                        **stats,
+                    })
+                    print(f"  {height:>5}x{width:<5} L{num_levels} D{num_directions:<2} {filter_mode:<7}"
+                          f" median {stats['median_ms']:9.2f} ms  p95 {stats['p95_ms']:9.2f} ms"
+                          f"  {stats['megapixels_per_s']:7.2f} MP/s")
+    return results
+
+
+def post_image(url, body, content_type):
+    request = urllib.request.Request(url, data=body, headers={'Content-Type': content_type}, method="POST")
+    try:
+        with urllib.request.urlopen(request, timeout=120) as response:
+            response.read()
+            return response.status, response.headers.get('Server-Timing')
+    except urllib.error.HTTPError as e:
+        # 503 from backpressure, 400/500 from the server: counted as errors
+        return e.code, e.headers.get('Server-Timing')
+
+
+def parse_server_timing(header):
+    """'decode;dur=1.2, total;dur=3.4' -> {'decode': 1.2, 'total': 3.4}"""
+    stages = {}
+    for entry in (header or "").split(","):
+        name, _, params = entry.strip().partition(";")
+        if params.startswith("dur="):
+            stages[name] = float(params[4:])
+    return stages
+
+
+def wait_for_server(server_url, timeout):
+    """
+    Poll /health until the server answers 200 (it answers 503 while warming up)
+    
+    Returns:
+        (health JSON, None) once ready, or (None, reason) on a connection
+        error or when the server is still not ready after `timeout` seconds
+    """
+    health_url = server_url.rstrip("/") + "/health"
+    deadline = time.monotonic() + timeout
+    announced = False
+    while True:
+        try:
+            with urllib.request.urlopen(health_url, timeout=5) as response:
+                return json.loads(response.read()), None
+        except urllib.error.HTTPError as e:
+            if time.monotonic() >= deadline:
+                return None, f"not ready after {timeout:g} s (/health answered {e.code})"
+            if not announced:
+                print(f"\nWaiting for {server_url} to finish warming up (/health answered {e.code})...")
+                announced = True
+        except (urllib.error.URLError, OSError) as e:
+            return None, f"server not reachable: {e}"
+        time.sleep(1)
+
+
+def bench_detect(server_url, images_dir, num_requests, concurrency_levels, unique, ready_timeout=120):
+    """
+    End-to-end POST /detect latency and throughput against a running server
+    
+    Images are sent as raw binary bodies. With `unique`, every request gets a
+    distinct body (a few trailing bytes appended, which JPEG/PNG decoders ignore)
+    so the server's result cache cannot answer it; otherwise repeats measure
+    the cached path. Per-stage server times are collected when the server runs
+    with SERVER_TIMING=1.
+    """
+    detect_url = server_url.rstrip("/") + "/detect"
+    health, reason = wait_for_server(server_url, ready_timeout)
+    if health is None:
+        print(f"\n/detect: {server_url} {reason}, skipping")
+        return [{'name': "detect", 'skipped': reason}]
+    
+    image_files = list_images(images_dir)
+    if not image_files:
+        return [{'name': "detect", 'skipped': f"no images in {images_dir}"}]
+    bodies = [f.read_bytes() for f in image_files]
+    content_types = ["image/png" if f.suffix.lower() == ".png" else "image/jpeg" for f in image_files]
+    
+    print(f"\nPOST /detect end-to-end ({server_url}, backend: {health.get('backend', 'unknown')})")
+    results = []
+    for concurrency in concurrency_levels:
+        salt = uuid.uuid4().bytes
+        
+        def one_request(idx):
+            body = bodies[idx % len(bodies)]
+            if unique:
+                body = body + salt + idx.to_bytes(4, "little")
+            start = time.perf_counter()
+            status, timing = post_image(detect_url, body, content_types[idx % len(bodies)])
+            return time.perf_counter() - start, status, timing
+        
+        # Warm-up request so model loading is not timed
+        one_request(num_requests)
+        
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=concurrency) as pool:
+            outcomes = list(pool.map(one_request, range(num_requests)))
+        wall = time.perf_counter() - started
+        
+        latencies = [latency for latency, status, _ in outcomes if status == 200]
+        errors = sum(1 for _, status, _ in outcomes if status != 200)
+        stage_totals = {}
+        for _, _, timing in outcomes:
+            for stage, ms in parse_server_timing(timing).items():
+                stage_totals.setdefault(stage, []).append(ms)
+        
+        entry = {
+            'name': f"detect/c{concurrency}{'' if unique else '/cached'}",
+            'concurrency': concurrency,
+            'requests': num_requests,
+            'errors': errors,
+            'requests_per_s': num_requests / wall,
+            **(summarize(latencies) if latencies else {}),
+        }
+        if stage_totals:
+            entry['server_stages_mean_ms'] = {
+                stage: statistics.fmean(values) for stage, values in stage_totals.items()
+            }
+        results.append(entry)
+        print(f"  concurrency {concurrency:<3} {entry['requests_per_s']:7.2f} req/s"
+              f"  median {entry.get('median_ms', float('nan')):8.2f} ms  p95 {entry.get('p95_ms', float('nan')):8.2f} ms"
+              f"  errors {errors}")
+    return results
+
+
+def bench_dataloader(data_config, imgsz, batch_size, workers, num_batches, filter_on_the_fly):
+    """Training dataloader throughput (images/s), optionally filtering on the fly"""
+    try:
+        from ultralytics.cfg import get_cfg
+        from ultralytics.data import build_dataloader, build_yolo_dataset
+        from ultralytics.data.utils import check_det_dataset
+    except ImportError as e:
+        print(f"\nDataloader: ultralytics not available ({e}), skipping")
+        return [{'name': "dataloader", 'skipped': f"ultralytics not available: {e}"}]
+    
+    data = check_det_dataset(data_config)
+    cfg = get_cfg(overrides={'imgsz': imgsz, 'batch': batch_size, 'workers': workers})
+    print(f"\nTraining dataloader ({data['train']}, imgsz {imgsz}, batch {batch_size}, {workers} workers)")
+    
+    results = []
+    for on_the_fly in ([False, True] if filter_on_the_fly else [False]):
+        if on_the_fly:
+            from contourlet_dataset import ContourletYOLODataset, detection_dataset_kwargs
+            # detection_dataset_kwargs only reads these trainer attributes
+            trainer = SimpleNamespace(args=cfg, model=None, data=data)
+            dataset = ContourletYOLODataset(**detection_dataset_kwargs(trainer, data['train'], "train", batch_size))
+        else:
+            dataset = build_yolo_dataset(cfg, data['train'], batch_size, data, mode="train")
+        loader = build_dataloader(dataset, batch_size, workers, shuffle=True)
+        
+        iterator = iter(loader)
+        next(iterator)  # worker start-up
+        images = 0
+        started = time.perf_counter()
+        for _ in range(num_batches):
+            try:
+                batch = next(iterator)
+            except StopIteration:
+                iterator = iter(loader)
+                batch = next(iterator)
+            images += len(batch['img'])
+        elapsed = time.perf_counter() - started
+        
+        name = "dataloader/contourlet_on_the_fly" if on_the_fly else "dataloader/prefiltered"
+        results.append({
+            'name': name,
+            'imgsz': imgsz,
+            'batch_size': batch_size,
+            'workers': workers,
+            'batches': num_batches,
+            'images_per_s': images / elapsed,
+        })
+        print(f"  {name:<34} {images / elapsed:8.2f} images/s")
+    return results
+
+
+def compare(results, baseline_file, tolerance):
+    """Print and return benchmarks that got slower than `baseline_file` by more than `tolerance`"""
+    with open(baseline_file, "r") as f:
+        baseline = {r['name']: r for r in json.load(f)['results'] if "skipped" not in r}
+    
+    regressions = []
+    print(f"\nComparison with {baseline_file} (tolerance {tolerance:.0%}):")
+    for result in results:
+        previous = baseline.get(result['name'])
+        if previous is None or "skipped" in result:
+            continue
+        if "median_ms" in result and "median_ms" in previous:
+            change = result['median_ms'] / previous['median_ms'] - 1
+        elif "images_per_s" in result and "images_per_s" in previous:
+            change = previous['images_per_s'] / result['images_per_s'] - 1
+        else:
+            continue
+        marker = "✗" if change > tolerance else "✓"
+        print(f"  {marker} {result['name']:<50} {change:+7.1%}")
+        if change > tolerance:
+            regressions.append({'name': result['name'], 'slowdown': change})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="Benchmark the Contourlet filter, the /detect path and the training dataloader"
+    )
+    parser.add_argument(
+        "--suite",
+        nargs="+",
+        choices=["contourlet", "detect", "dataloader"],
+        default=['contourlet'],
+        help="Benchmarks to run (default: contourlet)"
+    )
+    parser.add_argument(
+        "--images",
+        default="dataset/images",
+        help="Images used as benchmark input (default: dataset/images)"
+    )
+    parser.add_argument(
+        "--output",
+        default="benchmark_results.json",
+        help="JSON results file (default: benchmark_results.json)"
+    )
+    parser.add_argument(
+        "--quick",
+        action="store_true",
+        help="Fewer sizes and repeats, for a fast sanity check"
+    )
+    parser.add_argument("--repeats", type=int, default=None, help="Timed runs per case (default: 10, quick: 3)")
+    parser.add_argument("--warmup", type=int, default=1, help="Untimed runs per case (default: 1)")
+    parser.add_argument(
+        "--sizes",
+        nargs="+",
+        default=None,
+        help="Image sizes as HxW or N for NxN (default: 128 up to 1536x3072 panoramic)"
+    )
+    parser.add_argument("--levels", type=int, nargs="+", default=[2], help="Pyramid levels (default: 2)")
+    parser.add_argument("--directions", type=int, nargs="+", default=[8], help="Directional filters (default: 8)")
+    parser.add_argument(
+        "--filter-modes",
+        nargs="+",
+        choices=["auto", "spatial", "fft"],
+        default=['auto'],
+        help="Directional filtering modes (default: auto)"
+    )
+    parser.add_argument("--server", default="http://localhost:5000", help="Server for the detect suite")
+    parser.add_argument(
+        "--ready-timeout",
+        type=float,
+        default=120,
+        help="Seconds to wait for a warming-up server's /health to answer 200 (default: 120)"
+    )
+    parser.add_argument("--requests", type=int, default=50, help="Requests per concurrency level (default: 50)")
+    parser.add_argument(
+        "--concurrency",
+        type=int,
+        nargs="+",
+        default=[1, 4, 8],
+        help="Concurrent clients for the detect suite (default: 1 4 8)"
+    )
+    parser.add_argument(
+        "--allow-cached",
+        action="store_true",
+        help="Resend identical images so repeats can be served from the result cache"
+    )
+    parser.add_argument("--data", default="data.yaml", help="Data config for the dataloader suite")
+    parser.add_argument("--imgsz", type=int, default=640, help="Dataloader image size (default: 640)")
+    parser.add_argument("--batch-size", type=int, default=16, help="Dataloader batch size (default: 16)")
+    parser.add_argument("--workers", type=int, default=4, help="Dataloader workers (default: 4)")
+    parser.add_argument("--batches", type=int, default=20, help="Batches to time (default: 20)")
+    parser.add_argument(
+        "--filter-on-the-fly",
+        action="store_true",
+        help="Also time the dataloader with the Contourlet filter applied on the fly"
+    )
+    parser.add_argument("--compare", default=None, help="Previous results JSON to check for regressions")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.10,
+        help="Slowdown vs --compare counted as a regression (default: 0.10)"
+    )
+    args = parser.parse_args()
+    
+    if args.sizes:
+        sizes = []
+        for size in args.sizes:
+            height, _, width = size.lower().partition("x")
+            sizes.append((int(height), int(width or height)))
+    else:
+        sizes = QUICK_SIZES if args.quick else DEFAULT_SIZES
+    repeats = args.repeats or (3 if args.quick else 10)
+    
+    print("=" * 60)
+    print("Benchmarks")
+    print("=" * 60)
+    
+    results = []
+    if "contourlet" in args.suite:
+        results += bench_contourlet(
+            args.images, sizes, args.levels, args.directions, args.filter_modes, repeats, args.warmup
+        )
+    if "detect" in args.suite:
+        results += bench_detect(
+            args.server, args.images, 10 if args.quick else args.requests, args.concurrency,
+            unique=not args.allow_cached, ready_timeout=args.ready_timeout
+        )
+    if "dataloader" in args.suite:
+        results += bench_dataloader(
+            args.data, args.imgsz, args.batch_size, args.workers,
+            5 if args.quick else args.batches, args.filter_on_the_fly
+        )
+    
+    report = {'environment': environment_info(), 'results': results}
+    if args.compare:
+        report['regressions'] = compare(results, args.compare, args.tolerance)
+    
+    with open(args.output, "w") as f:
+        json.dump(report, f, indent=2)
+    print(f"\n✓ Results written to {args.output}")
+    
+    if report.get('regressions'):
+        print(f"✗ {len(report['regressions'])} regression(s) beyond {args.tolerance:.0%}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,106 @@
+import cv2
+import numpy as np
+from ultralytics.data import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils import colorstr
+
+from contourlet_filter import ContourletTransform
+from image_shards import resize_long_side
+
+
+class ContourletYOLODataset(YOLODataset):
+    """
+    YOLODataset that applies the Contourlet transform as images are loaded
+    
+    Filtering runs inside the dataloader worker processes, so no pre-filtered
+    copy of the dataset is needed on disk. Images are filtered at their native
+    resolution and then resized to the training resolution, the same order as
+    preprocess_dataset.py and the inference server's default, so the model
+    sees the same filter response in training and serving. With cache='ram'
+    the filtered uint8 images are what ends up in the RAM cache, so every
+    image is filtered only once.
+    """
+    
+    def __init__(self, *args, contourlet_params=None, **kwargs):
+        # Must exist before YOLODataset.__init__, which may fill the RAM cache
+        self.contourlet = ContourletTransform(**(contourlet_params or {}))
+        super().__init__(*args, **kwargs)
+    
+    def load_image(self, i, rect_mode=True):
+        """YOLODataset.load_image, with the filter applied before the resize"""
+        if self.ims[i] is not None:
+            # Already filtered: stored below (mosaic buffer) or by cache_images (RAM cache)
+            return self.ims[i], self.im_hw0[i], self.im_hw[i]
+        
+        f, fn = self.im_files[i], self.npy_files[i]
+        im = None
+        if fn.exists():
+            try:
+                im = np.load(fn)
+            except Exception:
+                fn.unlink(missing_ok=True)
+        if im is None:
+            im = cv2.imread(f)
+        if im is None:
+            raise FileNotFoundError(f"Image Not Found {f}")
+        
+        h0, w0 = im.shape[:2]
+        im = self.contourlet.apply(im)
+        if rect_mode:
+            im = resize_long_side(im, self.imgsz)
+        elif not (h0 == w0 == self.imgsz):
+            im = cv2.resize(im, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+        
+        if self.augment:
+            # Mosaic buffer, as in the base class
+            self.ims[i], self.im_hw0[i], self.im_hw[i] = im, (h0, w0), im.shape[:2]
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                j = self.buffer.pop(0)
+                if self.cache != "ram":
+                    self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+        return im, (h0, w0), im.shape[:2]
+
+
+def detection_dataset_kwargs(trainer, img_path, mode="train", batch=None):
+    """The YOLODataset arguments DetectionTrainer.build_dataset would use"""
+    model = getattr(trainer.model, "module", trainer.model)
+    stride = max(int(model.stride.max() if model else 0), 32)
+    return dict(
+        img_path=img_path,
+        imgsz=trainer.args.imgsz,
+        batch_size=batch,
+        augment=mode == "train",
+        hyp=trainer.args,
+        rect=mode == "val",
+        cache=trainer.args.cache or None,
+        single_cls=trainer.args.single_cls or False,
+        stride=stride,
+        pad=0.0 if mode == "train" else 0.5,
+        prefix=colorstr(f"{mode}: "),
+        task=trainer.args.task,
+        classes=trainer.args.classes,
+        data=trainer.data,
+        fraction=trainer.args.fraction if mode == "train" else 1.0,
+    )
+
+
+class ContourletDetectionTrainer(DetectionTrainer):
+    """DetectionTrainer whose train/val datasets filter images on the fly"""
+    
+    contourlet_params = {}
+    
+    def build_dataset(self, img_path, mode="train", batch=None):
+        return ContourletYOLODataset(
+            **detection_dataset_kwargs(self, img_path, mode, batch),
+            contourlet_params=self.contourlet_params,
+        )
+
+
+def make_contourlet_trainer(**contourlet_params):
+    """Return a ContourletDetectionTrainer subclass bound to the given filter parameters"""
+    return type(
+        "ContourletDetectionTrainer",
+        (ContourletDetectionTrainer,),
+        {"contourlet_params": dict(contourlet_params)},
+    )
@@ -1,18 +1,333 @@
+import os
+import threading
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from itertools import islice
+
 import cv2
 import numpy as np
-from scipy import ndimage
-from scipy.ndimage import gaussian_filter
+
+
+# Bump whenever a change alters the filter output, so on-disk caches of filtered
+# images (see filter_cache.py) stop matching entries written by older code
+CONTOURLET_VERSION = "1"
+
+# Directional kernel banks shared by every ContourletTransform in the process,
+# keyed by (num_directions, kernel_size, sigma_x, sigma_y)
+_KERNEL_BANK_CACHE = {}
+_KERNEL_BANK_LOCK = threading.Lock()
+
+# Frequency-domain kernel banks, keyed by kernel bank key + padded FFT shape.
+# LRU-bounded by total bytes because the server sees arbitrary upload sizes.
+_KERNEL_SPECTRUM_CACHE = OrderedDict()
+_KERNEL_SPECTRUM_LOCK = threading.Lock()
+KERNEL_SPECTRUM_CACHE_BYTES = 256 * 1024 * 1024
+
+FILTER_MODES = ('auto', 'spatial', 'fft')
+# Pyramid levels with at least this many pixels use the FFT path in 'auto' mode
+DEFAULT_FFT_THRESHOLD = 128 * 128
+
+# Thread pool shared by every ContourletTransform with max_threads > 1. OpenCV
+# releases the GIL inside filter2D/dft, so per-direction filtering runs truly in
+# parallel. Threads don't survive fork, so a forked child builds its own pool.
+_SHARED_EXECUTOR = None
+_SHARED_EXECUTOR_PID = None
+_SHARED_EXECUTOR_THREADS = 0
+_SHARED_EXECUTOR_LOCK = threading.Lock()
+
+# Idle workspaces a ContourletTransform keeps for reuse; more only exist while
+# that many apply() calls run concurrently
+MAX_IDLE_WORKSPACES = 4
+
+
+def build_gabor_kernel(angle, kernel_size=15, sigma_x=3.0, sigma_y=1.0):
+    """Build a single normalized Gabor-like kernel oriented at `angle`"""
+    x = np.linspace(-kernel_size // 2, kernel_size // 2, kernel_size)
+    y = np.linspace(-kernel_size // 2, kernel_size // 2, kernel_size)
+    X, Y = np.meshgrid(x, y)
+    
+    X_theta = X * np.cos(angle) + Y * np.sin(angle)
+    Y_theta = -X * np.sin(angle) + Y * np.cos(angle)
+    
+    gabor_kernel = np.exp(
+        -(X_theta**2 / (2 * sigma_x**2) + Y_theta**2 / (2 * sigma_y**2))
+    ) * np.cos(2 * np.pi * X_theta / 5)
+    
+    gabor_kernel = gabor_kernel / np.sum(np.abs(gabor_kernel))
+    
+    return gabor_kernel.astype(np.float32)
+
+
+def get_directional_kernel_bank(num_directions, kernel_size=15, sigma_x=3.0, sigma_y=1.0):
+    """
+    Return the cached bank of directional kernels for a filter configuration
+    
+    The same kernels are used at every pyramid level, so the bank only depends
+    on the direction count and kernel shape. Banks are built once per process
+    and shared read-only between all ContourletTransform instances.
+    
+    Returns:
+        Tuple of float32 kernels, one per direction
+    """
+    key = (num_directions, kernel_size, float(sigma_x), float(sigma_y))
+    bank = _KERNEL_BANK_CACHE.get(key)
+    if bank is not None:
+        return bank
+    
+    with _KERNEL_BANK_LOCK:
+        bank = _KERNEL_BANK_CACHE.get(key)
+        if bank is None:
+            kernels = []
+            for direction in range(num_directions):
+                angle = (direction / num_directions) * np.pi
+                kernel = build_gabor_kernel(angle, kernel_size, sigma_x, sigma_y)
+                kernel.setflags(write=False)
+                kernels.append(kernel)
+            bank = tuple(kernels)
+            _KERNEL_BANK_CACHE[key] = bank
+    
+    return bank
+
+
+def get_kernel_spectrum_bank(num_directions, fft_shape, kernel_size=15, sigma_x=3.0, sigma_y=1.0):
+    """
+    Return the cached real-FFT spectra of a directional kernel bank
+    
+    Each kernel is flipped (cv2.filter2D correlates, the spectral product convolves),
+    zero-padded to `fft_shape` and transformed with cv2.dft, which stores the
+    real FFT in OpenCV's packed CCS layout ready for cv2.mulSpectrums.
+    
+    Returns:
+        Tuple of float32 arrays of shape `fft_shape`, one per direction
+    """
+    key = (num_directions, kernel_size, float(sigma_x), float(sigma_y), tuple(fft_shape))
+    with _KERNEL_SPECTRUM_LOCK:
+        spectra = _KERNEL_SPECTRUM_CACHE.get(key)
+        if spectra is not None:
+            _KERNEL_SPECTRUM_CACHE.move_to_end(key)
+            return spectra
+    
+    bank = get_directional_kernel_bank(num_directions, kernel_size, sigma_x, sigma_y)
+    spectra = []
+    for kernel in bank:
+        padded_kernel = np.zeros(fft_shape, dtype=np.float32)
+        padded_kernel[:kernel_size, :kernel_size] = kernel[::-1, ::-1]
+        spectrum = cv2.dft(padded_kernel, nonzeroRows=kernel_size)
+        spectrum.setflags(write=False)
+        spectra.append(spectrum)
+    spectra = tuple(spectra)
+    
+    with _KERNEL_SPECTRUM_LOCK:
+        _KERNEL_SPECTRUM_CACHE[key] = spectra
+        _KERNEL_SPECTRUM_CACHE.move_to_end(key)
+        cached_bytes = sum(
+            sum(spectrum.nbytes for spectrum in entry) for entry in _KERNEL_SPECTRUM_CACHE.values()
+        )
+        while cached_bytes > KERNEL_SPECTRUM_CACHE_BYTES and len(_KERNEL_SPECTRUM_CACHE) > 1:
+            _, evicted = _KERNEL_SPECTRUM_CACHE.popitem(last=False)
+            cached_bytes -= sum(spectrum.nbytes for spectrum in evicted)
+    
+    return spectra
+
+
+def get_shared_executor(max_threads):
+    """
+    Return the process-wide filter thread pool, with at least `max_threads` threads
+    
+    The pool is replaced by a larger one if a transform asks for more threads
+    than it has.
+    """
+    global _SHARED_EXECUTOR, _SHARED_EXECUTOR_PID, _SHARED_EXECUTOR_THREADS
+    pid = os.getpid()
+    with _SHARED_EXECUTOR_LOCK:
+        if _SHARED_EXECUTOR_PID != pid:
+            # Inherited across fork: the object exists but its threads don't
+            _SHARED_EXECUTOR = None
+            _SHARED_EXECUTOR_THREADS = 0
+        if _SHARED_EXECUTOR is None or _SHARED_EXECUTOR_THREADS < max_threads:
+            # Not shut down: calls still running on the old pool keep it alive
+            # until they finish, then its threads exit with it
+            _SHARED_EXECUTOR = ThreadPoolExecutor(max_workers=max_threads, thread_name_prefix="contourlet")
+            _SHARED_EXECUTOR_PID = pid
+            _SHARED_EXECUTOR_THREADS = max_threads
+        return _SHARED_EXECUTOR
+
+
+def _map_ordered(executor, fn, tasks, window):
+    """
+    executor.map that keeps at most `window` tasks in flight
+    
+    Results are yielded in task order, so reductions over them happen in the
+    same order as a serial loop and give bit-identical output; the window
+    bounds how many per-task result buffers exist at once.
+    """
+    pending = deque()
+    for task in tasks:
+        if len(pending) >= window:
+            yield pending.popleft().result()
+        pending.append(executor.submit(fn, *task))
+    while pending:
+        yield pending.popleft().result()
+
+
+def _min_max(array):
+    """np.min and np.max of a 2D float32 array in a single pass"""
+    min_val, max_val, _, _ = cv2.minMaxLoc(array)
+    return np.float32(min_val), np.float32(max_val)
+
+
+def _to_gray(image, out=None):
+    """
+    Single-channel view or conversion of a 2D, (H, W, 1), BGR or BGRA image
+    
+    Raises ValueError for other channel counts.
+    """
+    if len(image.shape) == 2:
+        return image
+    channels = image.shape[2]
+    if channels == 1:
+        return image[:, :, 0]
+    if channels == 3:
+        return cv2.cvtColor(image, cv2.COLOR_BGR2GRAY, dst=out)
+    if channels == 4:
+        return cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY, dst=out)
+    raise ValueError(f"Unsupported number of channels: {channels}")
+
+
+def _rescale(array, min_val, max_val, out):
+    """(array - min_val) / (max_val - min_val + 1e-6), written to `out` (may be `array`)"""
+    np.subtract(array, min_val, out=out)
+    out /= max_val - min_val + 1e-6
+    return out
+
+
+class ContourletWorkspace:
+    """
+    Named scratch arrays reused across ContourletTransform.apply calls
+    
+    `array(name, shape, dtype)` returns a view of the flat buffer stored under
+    `name`, which is only reallocated when a larger array is asked for, so
+    after the first few images apply() runs without allocating image-sized
+    temporaries. A workspace belongs to one apply() call at a time.
+    """
+    
+    def __init__(self):
+        self.buffers = {}
+    
+    def array(self, name, shape, dtype=np.float32):
+        size = int(np.prod(shape))
+        buffer = self.buffers.get((name, np.dtype(dtype)))
+        if buffer is None or buffer.size < size:
+            buffer = np.empty(size, dtype=dtype)
+            self.buffers[(name, np.dtype(dtype))] = buffer
+        return buffer[:size].reshape(shape)
+    
+    @property
+    def nbytes(self):
+        return sum(buffer.nbytes for buffer in self.buffers.values())
 
 
 class ContourletTransform:
-    def __init__(self, num_levels=2, num_directions=8):
+    def __init__(self, num_levels=2, num_directions=8, kernel_size=15, sigma_x=3.0, sigma_y=1.0,
+                 filter_mode='auto', fft_threshold=DEFAULT_FFT_THRESHOLD, grayscale=False,
+                 max_threads=1, executor=None):
+        """
+        Args:
+            num_levels: Number of pyramid levels
+            num_directions: Number of directional filters
+            kernel_size: Size of the square directional kernels
+            sigma_x, sigma_y: Gaussian envelope of the directional kernels
+            filter_mode: 'spatial' (cv2.filter2D per direction), 'fft' (one real FFT per
+                level, directions applied as spectral masks) or 'auto'
+            fft_threshold: Minimum level size in pixels for 'auto' to pick the FFT path
+            grayscale: Grayscale-native mode: always return one channel, blended with the
+                input like the 3-channel path (for a gray radiograph this equals any one
+                channel of the 3-channel output), so callers can decode, filter and
+                cache single-channel images and expand only at the model
+            max_threads: Directional filters of all pyramid levels run on up to this many
+                threads (1 = serial, e.g. inside already-parallel dataset workers). The
+                output is identical for any value.
+            executor: ThreadPoolExecutor to run them on (default: a pool shared by all
+                transforms in the process)
+        """
+        if filter_mode not in FILTER_MODES:
+            raise ValueError(f"filter_mode must be one of {FILTER_MODES}, got {filter_mode!r}")
+        
         self.num_levels = num_levels
         self.num_directions = num_directions
+        self.kernel_size = kernel_size
+        self.sigma_x = sigma_x
+        self.sigma_y = sigma_y
+        self.filter_mode = filter_mode
+        self.fft_threshold = fft_threshold
+        self.grayscale = grayscale
+        self.max_threads = max(1, int(max_threads or 1))
+        self.executor = executor
+        self._idle_workspaces = []
+        self._workspace_lock = threading.Lock()
+    
+    def __getstate__(self):
+        # Pickled into dataloader workers: locks, thread pools and scratch buffers stay behind
+        state = dict(self.__dict__)
+        state['executor'] = None
+        del state['_idle_workspaces'], state['_workspace_lock']
+        return state
+    
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._idle_workspaces = []
+        self._workspace_lock = threading.Lock()
+    
+    def acquire_workspace(self):
+        """Take an idle workspace (or a new one) for one apply() call"""
+        with self._workspace_lock:
+            if self._idle_workspaces:
+                return self._idle_workspaces.pop()
+        return ContourletWorkspace()
+    
+    def release_workspace(self, workspace):
+        with self._workspace_lock:
+            if len(self._idle_workspaces) < MAX_IDLE_WORKSPACES:
+                self._idle_workspaces.append(workspace)
+    
+    def get_params(self):
+        """Parameters that determine the filter output, e.g. for cache keys"""
+        return {
+            "version": CONTOURLET_VERSION,
+            "num_levels": self.num_levels,
+            "num_directions": self.num_directions,
+            "kernel_size": self.kernel_size,
+            "sigma_x": float(self.sigma_x),
+            "sigma_y": float(self.sigma_y),
+            "filter_mode": self.filter_mode,
+            "fft_threshold": self.fft_threshold,
+            "grayscale": self.grayscale,
+        }
+    
+    @property
+    def kernel_bank(self):
+        """Directional kernels for this configuration (shared module-level cache)"""
+        return get_directional_kernel_bank(
+            self.num_directions, self.kernel_size, self.sigma_x, self.sigma_y
+        )
+    
+    def use_fft(self, shape):
+        """Decide whether a level of the given shape goes through the FFT path"""
+        if len(shape) != 2:
+            return False
+        if self.filter_mode == 'auto':
+            return shape[0] * shape[1] >= self.fft_threshold
+        return self.filter_mode == 'fft'
     
     def apply_laplacian_pyramid(self, image):
-        """Apply Laplacian pyramid decomposition"""
-        gaussian_pyramid = [image.copy().astype(np.float32)]
-        current = image.copy().astype(np.float32)
+        """
+        Apply Laplacian pyramid decomposition
+        
+        The first level is `image` itself when it already is float32 (no copy);
+        the pyramid only ever derives new arrays from it.
+        """
+        gaussian_pyramid = [np.asarray(image, dtype=np.float32)]
+        current = gaussian_pyramid[0]
         
         for i in range(self.num_levels - 1):
             if current.size == 0 or current.shape[0] < 2 or current.shape[1] < 2:
@@ -30,29 +345,9 @@ class ContourletTransform:
     
     def apply_directional_filter(self, image, direction, scale=1.0):
         """Apply directional Gabor-like filter"""
-        angle = (direction / self.num_directions) * np.pi
-        
-        kernel_size = 15
-        x = np.linspace(-kernel_size // 2, kernel_size // 2, kernel_size)
-        y = np.linspace(-kernel_size // 2, kernel_size // 2, kernel_size)
-        X, Y = np.meshgrid(x, y)
+        gabor_kernel = self.kernel_bank[direction]
         
-        sigma_x = 3.0
-        sigma_y = 1.0
-        
-        X_theta = X * np.cos(angle) + Y * np.sin(angle)
-        Y_theta = -X * np.sin(angle) + Y * np.cos(angle)
-        
-        gabor_kernel = np.exp(
-            -(X_theta**2 / (2 * sigma_x**2) + Y_theta**2 / (2 * sigma_y**2))
-        ) * np.cos(2 * np.pi * X_theta / 5)
-        
-        gabor_kernel = gabor_kernel / np.sum(np.abs(gabor_kernel))
-        
-        if len(image.shape) == 3:
-            filtered = cv2.filter2D(image, -1, gabor_kernel.astype(np.float32))
-        else:
-            filtered = cv2.filter2D(image, -1, gabor_kernel.astype(np.float32))
+        filtered = cv2.filter2D(image, -1, gabor_kernel)
         
         return filtered
     
@@ -89,24 +384,213 @@ class ContourletTransform:
                 return directional_responses[0]
             return np.zeros((1, 1), dtype=np.float32)
     
-    def enhance_edges(self, image):
-        """Enhance edges using Sobel operators"""
-        grad_x = cv2.Sobel(image, cv2.CV_32F, 1, 0, ksize=3)
-        grad_y = cv2.Sobel(image, cv2.CV_32F, 0, 1, ksize=3)
+    def iter_spatial_directional_responses(self, image):
+        """
+        Yield each direction's filter response computed with cv2.filter2D
+        
+        The yielded array is a scratch buffer reused for the next direction.
+        """
+        scratch = None
+        for kernel in self.kernel_bank:
+            scratch = cv2.filter2D(image, -1, kernel, dst=scratch)
+            yield scratch
+    
+    def fft_level_spectrum(self, image):
+        """
+        Real FFT of a reflect-padded level plus what is needed to filter it
         
-        magnitude = np.sqrt(grad_x**2 + grad_y**2)
+        The level is padded like cv2.filter2D's default BORDER_REFLECT_101 border
+        straight into a zero-filled buffer of the FFT size.
         
-        return magnitude
+        Returns:
+            (image spectrum, kernel spectra, output shape)
+        """
+        height, width = image.shape
+        kernel_size = self.kernel_size
+        anchor = kernel_size // 2
+        pad_after = kernel_size - 1 - anchor
+        fft_shape = (
+            cv2.getOptimalDFTSize(height + kernel_size - 1),
+            cv2.getOptimalDFTSize(width + kernel_size - 1),
+        )
+        spectra = get_kernel_spectrum_bank(
+            self.num_directions, fft_shape, kernel_size, self.sigma_x, self.sigma_y
+        )
+        
+        padded = np.zeros(fft_shape, dtype=np.float32)
+        padded_view = padded[:height + kernel_size - 1, :width + kernel_size - 1]
+        cv2.copyMakeBorder(
+            image, anchor, pad_after, anchor, pad_after, cv2.BORDER_REFLECT_101, dst=padded_view
+        )
+        image_spectrum = cv2.dft(padded, nonzeroRows=padded_view.shape[0])
+        return image_spectrum, spectra, image.shape
+    
+    def iter_fft_directional_responses(self, image):
+        """
+        Yield each direction's filter response computed in the frequency domain
+        
+        The level is transformed once with a real FFT (see fft_level_spectrum) and
+        every direction is applied as a cached spectral mask. The yielded array is
+        a view into a scratch buffer reused for the next direction.
+        """
+        image_spectrum, spectra, (height, width) = self.fft_level_spectrum(image)
+        product = np.empty_like(image_spectrum)
+        response = np.empty_like(image_spectrum)
+        offset = self.kernel_size - 1
+        for spectrum in spectra:
+            cv2.mulSpectrums(image_spectrum, spectrum, 0, c=product)
+            cv2.idft(product, dst=response, flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)
+            yield response[offset:offset + height, offset:offset + width]
+    
+    def combine_absolute_responses(self, responses, workspace=None, key=0):
+        """
+        Reduce a stream of per-direction responses to 0.6 * max + 0.4 * mean of |response|
+        
+        Responses are made absolute in place and the max/mean reductions are
+        accumulated in place, so only two image-sized buffers are used
+        regardless of the number of directions. With a workspace they are its
+        ('max', key) and ('mean', key) arrays, and the result is the former.
+        """
+        workspace = workspace or ContourletWorkspace()
+        max_response = None
+        mean_response = None
+        for response in responses:
+            np.abs(response, out=response)
+            if max_response is None:
+                max_response = workspace.array(('max', key), response.shape)
+                mean_response = workspace.array(('mean', key), response.shape)
+                np.copyto(max_response, response)
+                np.copyto(mean_response, response)
+            else:
+                np.maximum(max_response, response, out=max_response)
+                mean_response += response
+        
+        # combined = 0.6 * max + 0.4 * mean, reusing the max buffer for the result
+        mean_response /= len(self.kernel_bank)
+        mean_response *= 0.4
+        max_response *= 0.6
+        max_response += mean_response
+        
+        return max_response
+    
+    def apply_directional_filter_bank_combined(self, image, workspace=None, key=0):
+        """
+        Apply the whole directional filter bank and combine responses in one pass
+        
+        Equivalent to combine_directional_responses(apply_dft_directional_filter_bank(image)),
+        but responses are consumed one at a time (see combine_absolute_responses).
+        """
+        if not self.kernel_bank:
+            return np.zeros((1, 1), dtype=np.float32)
+        
+        image = np.ascontiguousarray(image, dtype=np.float32)
+        
+        if self.use_fft(image.shape):
+            responses = self.iter_fft_directional_responses(image)
+        else:
+            responses = self.iter_spatial_directional_responses(image)
+        
+        return self.combine_absolute_responses(responses, workspace, key)
+    
+    def _prepare_level(self, image):
+        """Per-level setup for the threaded path: ('fft', spectrum...) or ('spatial', image)"""
+        image = np.ascontiguousarray(image, dtype=np.float32)
+        if self.use_fft(image.shape):
+            return ('fft',) + self.fft_level_spectrum(image)
+        return ('spatial', image)
+    
+    def _direction_response(self, level, direction):
+        """One direction's response of a prepared level, in a buffer of its own"""
+        if level[0] == 'fft':
+            _, image_spectrum, spectra, (height, width) = level
+            product = cv2.mulSpectrums(image_spectrum, spectra[direction], 0)
+            response = cv2.idft(product, flags=cv2.DFT_SCALE | cv2.DFT_REAL_OUTPUT)
+            offset = self.kernel_size - 1
+            return response[offset:offset + height, offset:offset + width]
+        return cv2.filter2D(level[1], -1, self.kernel_bank[direction])
+    
+    def apply_directional_filter_banks(self, levels, workspace=None):
+        """
+        Combined directional response of every pyramid level
+        
+        With max_threads > 1 the levels are prepared (FFT path: padded and
+        transformed) and then all (level, direction) filters run on the thread
+        pool, at most max_threads at a time. Responses are reduced on the
+        calling thread in the same order as the serial path, so the output is
+        bit-identical to max_threads=1.
+        
+        Returns:
+            List with one combined response per level (None where filtering failed),
+            held in `workspace` if one is given
+        """
+        if self.max_threads > 1 and self.kernel_bank and len(levels):
+            try:
+                return self._apply_directional_filter_banks_threaded(levels, workspace)
+            except Exception:
+                # Redo serially, which skips just the level that fails
+                pass
+        
+        combined = []
+        for key, level in enumerate(levels):
+            try:
+                combined.append(self.apply_directional_filter_bank_combined(level, workspace, key))
+            except Exception:
+                combined.append(None)
+        return combined
+    
+    def _apply_directional_filter_banks_threaded(self, levels, workspace):
+        executor = self.executor or get_shared_executor(self.max_threads)
+        prepared = list(_map_ordered(
+            executor, self._prepare_level, [(level,) for level in levels], self.max_threads
+        ))
+        num_directions = len(self.kernel_bank)
+        responses = _map_ordered(
+            executor,
+            self._direction_response,
+            [(level, direction) for level in prepared for direction in range(num_directions)],
+            self.max_threads
+        )
+        return [
+            self.combine_absolute_responses(islice(responses, num_directions), workspace, key)
+            for key in range(len(prepared))
+        ]
+    
+    def enhance_edges(self, image, workspace=None):
+        """Enhance edges using Sobel operators (in the workspace's gradient buffers if given)"""
+        workspace = workspace or ContourletWorkspace()
+        grad_x = cv2.Sobel(image, cv2.CV_32F, 1, 0, ksize=3, dst=workspace.array('grad_x', image.shape))
+        grad_y = cv2.Sobel(image, cv2.CV_32F, 0, 1, ksize=3, dst=workspace.array('grad_y', image.shape))
+        
+        # sqrt(grad_x**2 + grad_y**2), accumulated in the grad_x buffer
+        np.multiply(grad_x, grad_x, out=grad_x)
+        np.multiply(grad_y, grad_y, out=grad_y)
+        grad_x += grad_y
+        np.sqrt(grad_x, out=grad_x)
+        
+        return grad_x
     
     def apply(self, image):
-        """Apply Contourlet-like transform to image"""
+        """
+        Apply Contourlet-like transform to image
+        
+        Everything between decoding and the final blend with the input works
+        in place on buffers of a reusable ContourletWorkspace, so repeated
+        calls allocate little beyond the returned image.
+        """
+        workspace = self.acquire_workspace()
         try:
-            if len(image.shape) == 3:
-                gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
-            else:
-                gray = image.copy()
+            return self._apply(image, workspace)
+        finally:
+            self.release_workspace(workspace)
+    
+    def _apply(self, image, workspace):
+        try:
+            if self.grayscale:
+                image = _to_gray(image)
+            gray_u8 = _to_gray(image, out=workspace.array('gray_u8', image.shape[:2], np.uint8))
             
-            gray = gray.astype(np.float32) / 255.0
+            # gray.astype(np.float32) / 255.0 without the intermediate copy
+            gray = np.divide(gray_u8, np.float32(255.0), out=workspace.array('gray', gray_u8.shape), dtype=np.float32)
             
             laplacian_pyramid = self.apply_laplacian_pyramid(gray)
             
@@ -114,66 +598,92 @@ class ContourletTransform:
                 return image
             
             contourlet_coefficients = None
-            valid_responses = []
+            normalized_levels = []
             
-            for level_img in laplacian_pyramid:
+            for key, level_img in enumerate(laplacian_pyramid):
                 if level_img is None or level_img.size == 0:
                     continue
                 
                 try:
-                    min_val = np.min(level_img)
-                    max_val = np.max(level_img)
+                    # The first level is `gray` itself, which the edge map still needs;
+                    # deeper levels are pyramid temporaries and normalized in place
+                    out = workspace.array(('level', key), level_img.shape) if key == 0 else level_img
+                    min_val, max_val = _min_max(level_img)
                     
                     if max_val - min_val < 1e-6:
-                        level_img_normalized = np.ones_like(level_img) * 0.5
+                        out.fill(0.5)
                     else:
-                        level_img_normalized = (level_img - min_val) / (max_val - min_val + 1e-6)
-                    
-                    directional_responses = self.apply_dft_directional_filter_bank(level_img_normalized)
-                    
-                    if directional_responses:
-                        combined_response = self.combine_directional_responses(directional_responses)
-                        if combined_response.size > 0:
-                            valid_responses.append(combined_response)
+                        _rescale(level_img, min_val, max_val, out)
+                    normalized_levels.append(out)
                 except Exception as e:
                     continue
             
+            valid_responses = [
+                response for response in self.apply_directional_filter_banks(normalized_levels, workspace)
+                if response is not None and response.size > 0
+            ]
+            
             if valid_responses:
-                if len(valid_responses) == 1:
-                    contourlet_coefficients = valid_responses[0]
-                else:
-                    try:
-                        contourlet_coefficients = np.mean(np.array(valid_responses), axis=0)
-                    except:
-                        contourlet_coefficients = valid_responses[0]
+                contourlet_coefficients = valid_responses[0]
+                if len(valid_responses) > 1 and all(
+                    response.shape == contourlet_coefficients.shape for response in valid_responses
+                ):
+                    # Mean over levels, summed in the first level's buffer (in the same
+                    # order as np.mean over the stacked levels); levels of different
+                    # sizes can't be averaged and the first one is used alone
+                    for response in valid_responses[1:]:
+                        contourlet_coefficients += response
+                    contourlet_coefficients /= len(valid_responses)
             else:
-                contourlet_coefficients = gray
+                contourlet_coefficients = workspace.array('coefficients', gray.shape)
+                np.copyto(contourlet_coefficients, gray)
             
-            edge_map = self.enhance_edges(gray)
+            edge_map = self.enhance_edges(gray, workspace)
             
-            min_coeff = np.min(contourlet_coefficients)
-            max_coeff = np.max(contourlet_coefficients)
+            min_coeff, max_coeff = _min_max(contourlet_coefficients)
             if max_coeff - min_coeff > 1e-6:
-                contourlet_coefficients = (contourlet_coefficients - min_coeff) / (max_coeff - min_coeff + 1e-6)
+                _rescale(contourlet_coefficients, min_coeff, max_coeff, contourlet_coefficients)
             else:
-                contourlet_coefficients = np.ones_like(contourlet_coefficients) * 0.5
+                contourlet_coefficients.fill(0.5)
             
-            min_edge = np.min(edge_map)
-            max_edge = np.max(edge_map)
+            min_edge, max_edge = _min_max(edge_map)
             if max_edge - min_edge > 1e-6:
-                edge_map = (edge_map - min_edge) / (max_edge - min_edge + 1e-6)
+                _rescale(edge_map, min_edge, max_edge, edge_map)
             else:
-                edge_map = np.ones_like(edge_map) * 0.5
-            
-            enhanced = 0.7 * contourlet_coefficients + 0.3 * edge_map
-            enhanced = np.clip(enhanced * 255, 0, 255).astype(np.uint8)
+                edge_map.fill(0.5)
             
-            if len(image.shape) == 3:
-                enhanced_color = cv2.cvtColor(enhanced, cv2.COLOR_GRAY2BGR)
-                enhanced_color = cv2.addWeighted(image, 0.4, enhanced_color, 0.6, 0)
-                return enhanced_color
+            # enhanced = clip((0.7 * coefficients + 0.3 * edges) * 255, 0, 255) as uint8
+            enhanced = contourlet_coefficients
+            enhanced *= 0.7
+            edge_map *= 0.3
+            enhanced += edge_map
+            enhanced *= 255
+            np.clip(enhanced, 0, 255, out=enhanced)
+            if self.grayscale or len(image.shape) == 3:
+                enhanced_u8 = workspace.array('enhanced', enhanced.shape, np.uint8)
             else:
-                return enhanced
+                # Returned as is, so it must not live in the workspace
+                enhanced_u8 = np.empty(enhanced.shape, dtype=np.uint8)
+            np.copyto(enhanced_u8, enhanced, casting='unsafe')
+            
+            if self.grayscale:
+                return cv2.addWeighted(image, 0.4, enhanced_u8, 0.6, 0)
+            if len(image.shape) == 2:
+                return enhanced_u8
+            channels = image.shape[2]
+            if channels == 1:
+                # Same blend as the gray channel of a BGR image, in the input's shape
+                return cv2.addWeighted(gray_u8, 0.4, enhanced_u8, 0.6, 0)[:, :, np.newaxis]
+            enhanced_color = cv2.cvtColor(
+                enhanced_u8, cv2.COLOR_GRAY2BGR, dst=workspace.array('enhanced_bgr', image.shape[:2] + (3,), np.uint8)
+            )
+            if channels == 3:
+                return cv2.addWeighted(image, 0.4, enhanced_color, 0.6, 0)
+            # BGRA: blend the colour channels and keep the alpha channel as is
+            blended = cv2.addWeighted(
+                cv2.cvtColor(image, cv2.COLOR_BGRA2BGR), 0.4, enhanced_color, 0.6, 0
+            )
+            return np.dstack([blended, image[:, :, 3]])
         
         except Exception as e:
             return image
@@ -0,0 +1,39 @@
+from pathlib import Path
+
+import yaml
+
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp')
+
+
+def list_images(images_dir):
+    """Image files directly inside a directory, sorted by path"""
+    return sorted(p for p in Path(images_dir).iterdir() if p.suffix.lower() in IMAGE_EXTENSIONS)
+
+
+def labels_dir_for(images_dir):
+    """YOLO convention: .../images/... -> .../labels/..."""
+    parts = list(Path(images_dir).parts)
+    for idx in range(len(parts) - 1, -1, -1):
+        if parts[idx] == 'images':
+            parts[idx] = 'labels'
+            return Path(*parts)
+    return Path(images_dir).parent / 'labels'
+
+
+def load_data_config(data_config):
+    """
+    Read a YOLO data.yaml
+    
+    Returns:
+        (parsed config, base directory its split paths are relative to): the
+        config's `path` (itself relative to the yaml file) or the yaml's directory
+    """
+    with open(data_config, 'r') as f:
+        data = yaml.safe_load(f)
+    
+    config_dir = Path(data_config).resolve().parent
+    base_dir = Path(data.get('path') or config_dir)
+    if not base_dir.is_absolute():
+        base_dir = config_dir / base_dir
+    return data, base_dir
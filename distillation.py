@@ -0,0 +1,447 @@
+import io
+import json
+from pathlib import Path
+
+import cv2
+import numpy as np
+from ultralytics.data import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+from ultralytics.utils import LOGGER
+
+from contourlet_dataset import ContourletYOLODataset, detection_dataset_kwargs
+from filter_cache import atomic_write_bytes, sha256_bytes
+from image_shards import resize_long_side
+
+
+# 2: the teacher sees images resized to its imgsz before filtering, like the student
+TEACHER_CACHE_VERSION = "3"
+DEFAULT_TEACHER_CACHE_DIR = ".teacher_cache"
+
+
+def _xywh_to_xyxy(boxes):
+    xyxy = np.empty_like(boxes)
+    xyxy[:, :2] = boxes[:, :2] - boxes[:, 2:] / 2
+    xyxy[:, 2:] = boxes[:, :2] + boxes[:, 2:] / 2
+    return xyxy
+
+
+def _pairwise_iou(a, b):
+    """IoU matrix between two sets of xyxy boxes"""
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    inter = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    return inter / (area_a[:, None] + area_b[None, :] - inter + 1e-9)
+
+
+class TeacherPredictionCache:
+    """
+    Teacher detections for training images, computed once and kept on disk
+    
+    Entries are keyed by image content plus the teacher checksum and
+    prediction settings, so every student run (any size, resolution or number
+    of epochs) against the same teacher reuses them, and retraining the
+    teacher invalidates them automatically. Each entry is a small .npz with
+    normalized xywh boxes, confidences and classes.
+    """
+    
+    def __init__(self, teacher_path, cache_dir=DEFAULT_TEACHER_CACHE_DIR, imgsz=640,
+                 conf_threshold=0.25, iou_threshold=0.7, device=None, contourlet_params=None):
+        self.teacher_path = str(teacher_path)
+        self.imgsz = imgsz
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.device = device
+        self.contourlet_params = contourlet_params
+        
+        with open(self.teacher_path, 'rb') as f:
+            teacher_checksum = sha256_bytes(f.read())
+        settings = json.dumps({
+            "version": TEACHER_CACHE_VERSION,
+            "teacher": teacher_checksum,
+            "imgsz": imgsz,
+            "conf": conf_threshold,
+            "iou": iou_threshold,
+            "contourlet": contourlet_params,
+        }, sort_keys=True)
+        self.cache_dir = Path(cache_dir) / sha256_bytes(settings.encode('utf-8'))[:16]
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+    
+    def path_for(self, image_hash):
+        return self.cache_dir / f"{image_hash}.npz"
+    
+    def load(self, image_hash):
+        """Cached (cls, xywhn, conf) for an image hash, or None"""
+        path = self.path_for(image_hash)
+        if not path.exists():
+            return None
+        with np.load(path) as entry:
+            return entry['cls'], entry['xywhn'], entry['conf']
+    
+    def store(self, image_hash, cls, xywhn, conf):
+        buffer = io.BytesIO()
+        np.savez(
+            buffer,
+            cls=np.asarray(cls, np.float32).reshape(-1, 1),
+            xywhn=np.asarray(xywhn, np.float32).reshape(-1, 4),
+            conf=np.asarray(conf, np.float32).reshape(-1),
+        )
+        atomic_write_bytes(self.path_for(image_hash), buffer.getvalue())
+    
+    def _read_teacher_input(self, image_file, transform):
+        # Filter at native resolution, then resize: the order ContourletYOLODataset uses for the student
+        image = cv2.imread(str(image_file), cv2.IMREAD_COLOR)
+        if image is None:
+            return None
+        if transform is not None:
+            image = transform.apply(image)
+        return resize_long_side(image, self.imgsz)
+    
+    def predict_all(self, image_files, batch_size=16):
+        """
+        Teacher predictions for every image, running the teacher only on cache misses
+        
+        Returns:
+            dict of image file -> (cls, xywhn, conf)
+        """
+        predictions = {}
+        missing = []
+        for image_file in image_files:
+            with open(image_file, 'rb') as f:
+                image_hash = sha256_bytes(f.read())
+            cached = self.load(image_hash)
+            if cached is None:
+                missing.append((image_file, image_hash))
+            else:
+                predictions[image_file] = cached
+        
+        if missing:
+            LOGGER.info(f"Teacher: predicting {len(missing)} images ({len(predictions)} cached) -> {self.cache_dir}")
+            # Loaded only when needed and released afterwards so it is never
+            # pickled into the dataloader workers along with the dataset
+            from ultralytics import YOLO
+            teacher = YOLO(self.teacher_path)
+            transform = None
+            if self.contourlet_params is not None:
+                from contourlet_filter import ContourletTransform
+                transform = ContourletTransform(**self.contourlet_params)
+            
+            for start in range(0, len(missing), batch_size):
+                chunk = missing[start:start + batch_size]
+                inputs = [(entry, self._read_teacher_input(entry[0], transform)) for entry in chunk]
+                inputs = [(entry, image) for entry, image in inputs if image is not None]
+                if not inputs:
+                    continue
+                results = teacher.predict(
+                    [image for _, image in inputs],
+                    imgsz=self.imgsz,
+                    conf=self.conf_threshold,
+                    iou=self.iou_threshold,
+                    device=self.device,
+                    verbose=False
+                )
+                for ((image_file, image_hash), _), result in zip(inputs, results):
+                    boxes = result.boxes
+                    cls = boxes.cls.cpu().numpy()
+                    xywhn = boxes.xywhn.cpu().numpy()
+                    conf = boxes.conf.cpu().numpy()
+                    self.store(image_hash, cls, xywhn, conf)
+                    predictions[image_file] = self.load(image_hash)
+            del teacher
+        else:
+            LOGGER.info(f"Teacher: all {len(predictions)} predictions cached in {self.cache_dir}")
+        
+        return predictions
+
+
+def merge_teacher_boxes(label, teacher_prediction, min_conf=0.5, match_iou=0.5):
+    """
+    Add confident teacher detections that no ground-truth box already covers (pseudo-labels)
+    
+    Ground truth always wins: teacher boxes overlapping an annotated box by
+    `match_iou` or more are dropped, so the teacher only contributes findings
+    the annotation missed. These are hard labels; the soft teacher signal
+    comes from DistillationLoss.
+    
+    Returns:
+        Number of teacher boxes added
+    """
+    if len(label.get('segments') or []):
+        # Polygon labels would need matching segments for every added box
+        return 0
+    cls, xywhn, conf = teacher_prediction
+    keep = conf >= min_conf
+    if not keep.any():
+        return 0
+    cls, xywhn = cls[keep], xywhn[keep]
+    
+    gt_boxes = label['bboxes']
+    if len(gt_boxes):
+        overlap = _pairwise_iou(_xywh_to_xyxy(xywhn), _xywh_to_xyxy(gt_boxes))
+        new = overlap.max(axis=1) < match_iou
+        cls, xywhn = cls[new], xywhn[new]
+    if not len(cls):
+        return 0
+    
+    label['cls'] = np.concatenate([label['cls'].reshape(-1, 1), cls.reshape(-1, 1)]).astype(np.float32)
+    label['bboxes'] = np.concatenate([gt_boxes.reshape(-1, 4), xywhn]).astype(np.float32)
+    return len(cls)
+
+
+class DistillationYOLODataset(YOLODataset):
+    """
+    YOLODataset whose labels are ground truth plus the teacher's pseudo-labels
+    
+    Teacher boxes are merged into the label dicts once, when the dataset is
+    built, so the usual augmentation pipeline (mosaic, flips, letterbox)
+    transforms them together with the annotations and each epoch costs no
+    more than normal training. They only add objects the annotation lacks,
+    so on images the teacher was trained on they rarely add anything.
+    """
+    
+    def __init__(self, *args, teacher=None, distill_conf=0.5, match_iou=0.5, **kwargs):
+        # get_labels runs inside YOLODataset.__init__
+        self._teacher = teacher
+        self.distill_conf = distill_conf
+        self.match_iou = match_iou
+        super().__init__(*args, **kwargs)
+    
+    def get_labels(self):
+        labels = super().get_labels()
+        teacher, self._teacher = self._teacher, None
+        if teacher is None:
+            return labels
+        
+        predictions = teacher.predict_all([label['im_file'] for label in labels])
+        added = 0
+        for label in labels:
+            prediction = predictions.get(label['im_file'])
+            if prediction is not None:
+                added += merge_teacher_boxes(label, prediction, self.distill_conf, self.match_iou)
+        LOGGER.info(f"{self.prefix}Added {added} teacher pseudo-label boxes (conf >= {self.distill_conf}) "
+                    f"to {len(labels)} images")
+        return labels
+
+
+class ContourletDistillationYOLODataset(DistillationYOLODataset, ContourletYOLODataset):
+    """Teacher-augmented labels with the Contourlet filter applied on the fly"""
+
+
+def response_distillation_loss(student_feats, teacher_feats, nc, reg_max, temperature=2.0):
+    """
+    Soft-target loss between the student's and the teacher's raw head outputs
+    
+    Both outputs must come from the same input batch and heads with the same
+    strides, so anchor i of the student and of the teacher look at the same
+    place. Class scores: BCE of the student's logits against the teacher's
+    probabilities, normalized by the teacher's total score like the detection
+    loss normalizes by its target scores. Boxes (DFL heads): KL divergence
+    between the per-side distance distributions, weighted per anchor by the
+    teacher's highest class probability so background anchors don't dominate.
+    Both are softened by `temperature` and scaled by its square.
+    
+    Args:
+        student_feats, teacher_feats: Lists of (batch, nc + 4 * reg_max, h, w) tensors, one per stride
+        nc: Number of classes
+        reg_max: DFL bins per box side
+        temperature: Softening temperature
+    
+    Returns:
+        Scalar loss tensor
+    """
+    import torch
+    import torch.nn.functional as F
+    
+    def split(feats):
+        batch_size = feats[0].shape[0]
+        flat = torch.cat([f.view(batch_size, nc + reg_max * 4, -1) for f in feats], 2).float()
+        return flat.split((reg_max * 4, nc), 1)
+    
+    student_dist, student_cls = split(student_feats)
+    teacher_dist, teacher_cls = split(teacher_feats)
+    teacher_scores = teacher_cls.sigmoid()
+    
+    cls_loss = F.binary_cross_entropy_with_logits(
+        student_cls / temperature, (teacher_cls / temperature).sigmoid(), reduction='sum'
+    ) / teacher_scores.sum().clamp(min=1.0)
+    if reg_max <= 1:
+        return cls_loss * temperature ** 2
+    
+    batch_size, _, anchors = student_dist.shape
+    student_log = F.log_softmax(student_dist.view(batch_size, 4, reg_max, anchors) / temperature, dim=2)
+    teacher_log = F.log_softmax(teacher_dist.view(batch_size, 4, reg_max, anchors) / temperature, dim=2)
+    box_kl = (teacher_log.exp() * (teacher_log - student_log)).sum(2).mean(1)
+    anchor_weight = teacher_scores.amax(1)
+    box_loss = (box_kl * anchor_weight).sum() / anchor_weight.sum().clamp(min=1.0)
+    
+    return (cls_loss + box_loss) * temperature ** 2
+
+
+class DistillationLoss:
+    """
+    Ultralytics detection loss plus a soft-target term against a teacher
+    
+    The teacher runs on the student's own (augmented, letterboxed, filtered)
+    training batch, so both see identical inputs and their anchors line up;
+    its output is compared with the student's by response_distillation_loss.
+    Returns the same (loss, loss items) pair as v8DetectionLoss, with the
+    distillation term included in the loss and its mean since the last
+    reset_stats() available as `distill_loss` for logging.
+    """
+    
+    def __init__(self, model, teacher, weight=1.0, temperature=2.0):
+        from ultralytics.utils.loss import v8DetectionLoss
+        self.detection_loss = v8DetectionLoss(model)
+        self.teacher = teacher
+        self.weight = weight
+        self.temperature = temperature
+        self.nc = self.detection_loss.nc
+        self.reg_max = self.detection_loss.reg_max
+        self._distill_sum = 0.0
+        self._steps = 0
+        
+        teacher_head = teacher.model[-1]
+        if teacher_head.nc != self.nc or teacher_head.reg_max != self.reg_max:
+            raise ValueError(
+                f"Teacher head (nc={teacher_head.nc}, reg_max={teacher_head.reg_max}) does not match "
+                f"the student (nc={self.nc}, reg_max={self.reg_max})"
+            )
+        if teacher_head.stride.tolist() != self.detection_loss.stride.tolist():
+            raise ValueError(
+                f"Teacher strides {teacher_head.stride.tolist()} differ from the student's "
+                f"{self.detection_loss.stride.tolist()}"
+            )
+    
+    @property
+    def distill_loss(self):
+        return float(self._distill_sum / self._steps) if self._steps else 0.0
+    
+    def reset_stats(self):
+        self._distill_sum = 0.0
+        self._steps = 0
+    
+    def __call__(self, preds, batch):
+        import torch
+        
+        loss, loss_items = self.detection_loss(preds, batch)
+        feats = preds[1] if isinstance(preds, tuple) else preds
+        with torch.no_grad():
+            teacher_feats = self.teacher(batch['img'])[1]
+        distill = response_distillation_loss(feats, teacher_feats, self.nc, self.reg_max, self.temperature)
+        
+        # Accumulated on the device; reading it every step would force a sync
+        self._distill_sum = self._distill_sum + distill.detach()
+        self._steps += 1
+        # loss.sum(): newer ultralytics returns the per-component vector and sums in the trainer
+        return loss.sum() + self.weight * distill * feats[0].shape[0], loss_items
+
+
+def _attach_distillation_loss(trainer):
+    """on_train_start: give the training model (not the EMA copy that is saved) the distillation loss"""
+    from ultralytics.nn.tasks import attempt_load_one_weight
+    from ultralytics.utils.torch_utils import de_parallel
+    
+    params = trainer.distill_params
+    if not params.get('distill_weight'):
+        return
+    teacher, _ = attempt_load_one_weight(params['teacher_path'], device=trainer.device)
+    for parameter in teacher.parameters():
+        parameter.requires_grad_(False)
+    model = de_parallel(trainer.model)
+    model.criterion = DistillationLoss(
+        model, teacher.eval(), weight=params['distill_weight'], temperature=params['distill_temperature']
+    )
+    LOGGER.info(f"Distillation: soft-target loss against {params['teacher_path']} "
+                f"(weight {params['distill_weight']}, temperature {params['distill_temperature']})")
+
+
+def _log_distillation_loss(trainer):
+    """on_train_epoch_end: report the epoch's mean distillation loss"""
+    from ultralytics.utils.torch_utils import de_parallel
+    
+    criterion = getattr(de_parallel(trainer.model), 'criterion', None)
+    if isinstance(criterion, DistillationLoss):
+        LOGGER.info(f"Epoch {trainer.epoch + 1}: distillation loss {criterion.distill_loss:.4f}")
+        criterion.reset_stats()
+
+
+class DistillationTrainer(DetectionTrainer):
+    """
+    DetectionTrainer that distills a teacher into the student
+    
+    The student's loss gets a soft-target term against the teacher's outputs
+    on every training batch (DistillationLoss), and its training labels get
+    the teacher's confident pseudo-labels (cached on disk). Only the training
+    model carries the teacher, so saved checkpoints are plain detection
+    models, and validation is always scored against the ground truth so
+    student mAP stays comparable to the teacher's.
+    """
+    
+    distill_params = {}
+    contourlet_params = None
+    
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.add_callback("on_train_start", _attach_distillation_loss)
+        self.add_callback("on_train_epoch_end", _log_distillation_loss)
+    
+    def build_dataset(self, img_path, mode="train", batch=None):
+        kwargs = detection_dataset_kwargs(self, img_path, mode, batch)
+        if self.contourlet_params is not None:
+            kwargs['contourlet_params'] = self.contourlet_params
+        
+        if mode != "train":
+            dataset_class = YOLODataset if self.contourlet_params is None else ContourletYOLODataset
+            return dataset_class(**kwargs)
+        
+        params = self.distill_params
+        teacher = TeacherPredictionCache(
+            params['teacher_path'],
+            contourlet_params=self.contourlet_params,
+            device=self.args.device,
+            **params['teacher_options']
+        )
+        dataset_class = DistillationYOLODataset if self.contourlet_params is None else ContourletDistillationYOLODataset
+        return dataset_class(
+            **kwargs, teacher=teacher, distill_conf=params['distill_conf'], match_iou=params['match_iou']
+        )
+
+
+def make_distillation_trainer(teacher_path, cache_dir=DEFAULT_TEACHER_CACHE_DIR, teacher_imgsz=640,
+                              teacher_conf=0.25, distill_conf=0.5, match_iou=0.5, contourlet_params=None,
+                              distill_weight=1.0, distill_temperature=2.0):
+    """
+    Return a DistillationTrainer subclass bound to a teacher and distillation settings
+    
+    Args:
+        teacher_path: Trained teacher weights; its head must match the student's
+            (classes, strides, DFL bins), e.g. any YOLOv8 size trained on the same data
+        cache_dir: Where the teacher's pseudo-label predictions are cached
+        teacher_imgsz: Image size the teacher predicts pseudo-labels at
+        teacher_conf: Confidence threshold of cached teacher predictions
+        distill_conf: Minimum confidence for a teacher box to become a pseudo-label
+        match_iou: Overlap with a ground-truth box above which a teacher box is dropped
+        contourlet_params: Filter images on the fly with these parameters
+        distill_weight: Weight of the soft-target loss (0 = pseudo-labels only)
+        distill_temperature: Softening temperature of the soft-target loss
+    """
+    return type(
+        "DistillationTrainer",
+        (DistillationTrainer,),
+        {
+            "distill_params": {
+                "teacher_path": str(teacher_path),
+                "teacher_options": {
+                    "cache_dir": cache_dir,
+                    "imgsz": teacher_imgsz,
+                    "conf_threshold": teacher_conf,
+                },
+                "distill_conf": distill_conf,
+                "match_iou": match_iou,
+                "distill_weight": distill_weight,
+                "distill_temperature": distill_temperature,
+            },
+            "contourlet_params": None if contourlet_params is None else dict(contourlet_params),
+        },
+    )
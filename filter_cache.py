@@ -0,0 +1,242 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+
+DEFAULT_CACHE_DIR = ".contourlet_cache"
+DEFAULT_MAX_BYTES = 2 * 1024 ** 3
+# Entries are stored losslessly so a cache hit is identical to recomputing
+CACHE_EXTENSION = ".png"
+
+
+def sha256_bytes(data):
+    """Hex SHA-256 digest of a bytes buffer"""
+    return hashlib.sha256(data).hexdigest()
+
+
+def atomic_write_bytes(path, data):
+    """Write bytes to `path` via a temporary file in the same directory and os.replace"""
+    path = Path(path)
+    fd, tmp_name = tempfile.mkstemp(prefix=f".{path.name}.", suffix=".tmp", dir=path.parent)
+    try:
+        with os.fdopen(fd, "wb") as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_name, path)
+    except BaseException:
+        if os.path.exists(tmp_name):
+            os.remove(tmp_name)
+        raise
+
+
+def filter_cache_key(source_hash, params):
+    """
+    Content address of a filtered image
+    
+    Args:
+        source_hash: SHA-256 of the encoded source image bytes
+        params: ContourletTransform.get_params() (includes the filter code version)
+    """
+    payload = json.dumps({"source": source_hash, "params": params}, sort_keys=True)
+    return sha256_bytes(payload.encode("utf-8"))
+
+
+def limit_size(image, max_size):
+    """Downscale so the longer side is at most `max_size` (never upscales; falsy keeps the image)"""
+    height, width = image.shape[:2]
+    if not max_size or max(height, width) <= max_size:
+        return image
+    scale = max_size / max(height, width)
+    size = (max(1, round(width * scale)), max(1, round(height * scale)))
+    return cv2.resize(image, size, interpolation=cv2.INTER_AREA)
+
+
+def decode_source(source_bytes, transform, max_size=None):
+    """Decode a source image the way `transform` expects it (one channel in grayscale mode)"""
+    flags = cv2.IMREAD_GRAYSCALE if getattr(transform, "grayscale", False) else cv2.IMREAD_COLOR
+    image = cv2.imdecode(np.frombuffer(source_bytes, dtype=np.uint8), flags)
+    if image is None:
+        raise ValueError("Could not decode source image")
+    return limit_size(image, max_size)
+
+
+class FilteredImageCache:
+    """
+    Content-addressed on-disk cache of Contourlet-filtered images
+    
+    Entries live at <cache_dir>/<key[:2]>/<key>.png and are shared by
+    preprocess_dataset.py, train_yolo.py and the inference server. The
+    directory is bounded to `max_bytes` by evicting least recently used
+    entries (recency is tracked through file mtimes, so it survives restarts
+    and works across processes).
+    """
+    
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = Path(cache_dir)
+        self.max_bytes = max_bytes
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._approx_bytes = None
+    
+    def key_for(self, source_bytes, transform, source_hash=None, max_size=None):
+        """Cache key for encoded `source_bytes` (downscaled to `max_size`, if given) filtered by `transform`"""
+        if source_hash is None:
+            source_hash = sha256_bytes(source_bytes)
+        params = transform.get_params()
+        if max_size:
+            params = dict(params, max_size=max_size)
+        return filter_cache_key(source_hash, params)
+    
+    def path_for(self, key):
+        return self.cache_dir / key[:2] / f"{key}{CACHE_EXTENSION}"
+    
+    def get_path(self, key):
+        """Return the entry path for `key` if cached (marking it recently used), else None"""
+        path = self.path_for(key)
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            with self._lock:
+                self.misses += 1
+            return None
+        with self._lock:
+            self.hits += 1
+        return path
+    
+    def get(self, key):
+        """Return the cached filtered image for `key`, or None"""
+        path = self.get_path(key)
+        if path is None:
+            return None
+        image = cv2.imread(str(path), cv2.IMREAD_UNCHANGED)
+        if image is None:
+            # Evicted or unreadable between the lookup and the read
+            with self._lock:
+                self.hits -= 1
+                self.misses += 1
+        return image
+    
+    def put(self, key, image):
+        """Store a filtered image under `key` and return its path"""
+        ok, encoded = cv2.imencode(CACHE_EXTENSION, image)
+        if not ok:
+            raise ValueError("Could not encode filtered image for the cache")
+        encoded = encoded.tobytes()
+        
+        path = self.path_for(key)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        atomic_write_bytes(path, encoded)
+        
+        with self._lock:
+            if self._approx_bytes is None:
+                self._approx_bytes = self._scan_size()
+            else:
+                self._approx_bytes += len(encoded)
+            over_budget = self._approx_bytes > self.max_bytes
+        if over_budget:
+            self.evict()
+        
+        return path
+    
+    def get_or_apply(self, source_bytes, transform, image=None, source_hash=None, max_size=None):
+        """
+        Return the filtered image for encoded `source_bytes`, computing it on a miss
+        
+        Args:
+            source_bytes: Encoded source image (the cache is keyed by its hash)
+            transform: ContourletTransform to apply on a miss
+            image: Already decoded image (BGR, or single-channel for a grayscale
+                transform), to skip decoding on a miss
+            source_hash: Precomputed SHA-256 of `source_bytes`
+            max_size: Longer-side limit the source was downscaled to before
+                filtering; leave it None when the image was not shrunk, so it
+                shares entries with full-resolution filtering
+        
+        Returns:
+            (filtered image, cache key)
+        """
+        key = self.key_for(source_bytes, transform, source_hash, max_size)
+        filtered = self.get(key)
+        if filtered is not None:
+            return filtered, key
+        
+        if image is None:
+            image = decode_source(source_bytes, transform, max_size)
+        filtered = transform.apply(image)
+        self.put(key, filtered)
+        return filtered, key
+    
+    def ensure_path(self, source_bytes, transform, source_hash=None):
+        """Like get_or_apply, but return the entry path without decoding it on a hit"""
+        key = self.key_for(source_bytes, transform, source_hash)
+        path = self.get_path(key)
+        if path is None:
+            path = self.put(key, transform.apply(decode_source(source_bytes, transform)))
+        return path
+    
+    def _iter_entries(self):
+        for shard in os.scandir(self.cache_dir):
+            if not shard.is_dir():
+                continue
+            for entry in os.scandir(shard.path):
+                if entry.name.endswith(CACHE_EXTENSION) and entry.is_file():
+                    yield entry
+    
+    def _scan_size(self):
+        total = 0
+        for entry in self._iter_entries():
+            try:
+                total += entry.stat().st_size
+            except FileNotFoundError:
+                pass
+        return total
+    
+    def evict(self):
+        """Delete least recently used entries until the cache is under 90% of its budget"""
+        entries = []
+        for entry in self._iter_entries():
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        
+        total = sum(size for _, size, _ in entries)
+        target = int(self.max_bytes * 0.9)
+        entries.sort()
+        for _, size, path in entries:
+            if total <= target:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+        
+        with self._lock:
+            self._approx_bytes = total
+    
+    def stats(self):
+        # The size is only known after a scan; take it lazily so a warm cache
+        # reports its size before this process writes its first entry
+        if self._approx_bytes is None:
+            size = self._scan_size()
+            with self._lock:
+                if self._approx_bytes is None:
+                    self._approx_bytes = size
+        with self._lock:
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "bytes": self._approx_bytes,
+                "max_bytes": self.max_bytes,
+            }
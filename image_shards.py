@@ -0,0 +1,360 @@
+import json
+import math
+import os
+from pathlib import Path
+
+import cv2
+import numpy as np
+import yaml
+
+from dataset_paths import labels_dir_for, list_images, load_data_config
+from filter_cache import atomic_write_bytes
+
+
+# 2: --filtered shards are filtered at native resolution, before the resize
+SHARD_VERSION = 2
+DEFAULT_SHARD_DIR = "dataset/shards"
+
+IMAGES_NAME = "images.bin"
+INDEX_NAME = "index.npy"
+LABELS_NAME = "labels.npy"
+META_NAME = "meta.json"
+
+# One row per image: where its pixels start in images.bin, the stored
+# (training-resolution) shape, the original shape and its slice of labels.npy
+INDEX_DTYPE = np.dtype([
+    ('offset', '<i8'),
+    ('height', '<i4'),
+    ('width', '<i4'),
+    ('channels', '<i4'),
+    ('orig_height', '<i4'),
+    ('orig_width', '<i4'),
+    ('label_start', '<i8'),
+    ('label_count', '<i4'),
+])
+
+
+def resize_long_side(image, imgsz):
+    """Resize so the longer side is `imgsz`, the way the YOLO dataloader does before augmentation"""
+    h0, w0 = image.shape[:2]
+    r = imgsz / max(h0, w0)
+    if r == 1:
+        return image
+    w, h = min(math.ceil(w0 * r), imgsz), min(math.ceil(h0 * r), imgsz)
+    return cv2.resize(image, (w, h), interpolation=cv2.INTER_LINEAR)
+
+
+def read_yolo_labels(label_file):
+    """
+    Parse a YOLO label file into (n, 5) float32 rows of class, x, y, w, h
+    
+    Polygon rows (class followed by x y pairs) are reduced to their bounding box.
+    """
+    rows = []
+    if not Path(label_file).exists():
+        return np.zeros((0, 5), dtype=np.float32)
+    with open(label_file, 'r') as f:
+        for line in f:
+            values = [float(v) for v in line.split()]
+            if len(values) < 5:
+                continue
+            if len(values) > 5:
+                points = np.asarray(values[1:], dtype=np.float32).reshape(-1, 2)
+                (x1, y1), (x2, y2) = points.min(axis=0), points.max(axis=0)
+                values = [values[0], (x1 + x2) / 2, (y1 + y2) / 2, x2 - x1, y2 - y1]
+            rows.append(values)
+    return np.asarray(rows, dtype=np.float32).reshape(-1, 5)
+
+
+class ImageShard:
+    """
+    Read-only view of a packed split: pre-decoded images plus YOLO labels
+    
+    images.bin holds every image's raw uint8 pixels back to back and is
+    memory-mapped on first access, so dataloader workers read straight from
+    the shared page cache instead of decoding JPEGs. The mapping is
+    copy-on-write: augmentations that modify an image in place only copy the
+    pages they touch. It is dropped when the shard is pickled (e.g. into
+    spawned dataloader workers) and reopened in the receiving process.
+    """
+    
+    def __init__(self, shard_dir):
+        self.shard_dir = Path(shard_dir)
+        with open(self.shard_dir / META_NAME, 'r') as f:
+            self.meta = json.load(f)
+        if self.meta.get("version") != SHARD_VERSION:
+            raise ValueError(
+                f"{self.shard_dir} has shard version {self.meta.get('version')}, expected {SHARD_VERSION}; repack it"
+            )
+        self.index = np.load(self.shard_dir / INDEX_NAME)
+        self.labels = np.load(self.shard_dir / LABELS_NAME)
+        self.im_files = list(self.meta["im_files"])
+        self._images = None
+    
+    def __len__(self):
+        return len(self.index)
+    
+    def __getstate__(self):
+        state = dict(self.__dict__)
+        state['_images'] = None
+        return state
+    
+    @property
+    def imgsz(self):
+        return self.meta["imgsz"]
+    
+    def _mapped(self):
+        if self._images is None:
+            if os.path.getsize(self.shard_dir / IMAGES_NAME) == 0:
+                self._images = np.zeros(0, dtype=np.uint8)
+            else:
+                self._images = np.memmap(self.shard_dir / IMAGES_NAME, dtype=np.uint8, mode='c')
+        return self._images
+    
+    def image(self, i):
+        """
+        Stored image i (HxWxC uint8, no copy) and its original (height, width)
+        """
+        row = self.index[i]
+        start = int(row['offset'])
+        shape = (int(row['height']), int(row['width']), int(row['channels']))
+        pixels = self._mapped()[start:start + shape[0] * shape[1] * shape[2]]
+        return pixels.reshape(shape), (int(row['orig_height']), int(row['orig_width']))
+    
+    def image_labels(self, i):
+        """Labels of image i as (cls (n, 1), normalized xywh boxes (n, 4))"""
+        row = self.index[i]
+        start = int(row['label_start'])
+        rows = self.labels[start:start + int(row['label_count'])]
+        return rows[:, :1].copy(), rows[:, 1:].copy()
+
+
+def write_shard(shard_dir, image_files, label_dir, imgsz=640, transform=None, grayscale=False, im_files=None):
+    """
+    Pack images and their YOLO labels into a shard directory
+    
+    Images are decoded once, Contourlet-filtered at native resolution if a
+    `transform` is given (like preprocess_dataset.py, on-the-fly filtering in
+    the dataloader and the inference server's default) and resized to the
+    training resolution. Files are written under temporary names and moved
+    into place at the end, meta.json last, so an interrupted run never leaves
+    a shard that looks complete.
+    
+    Args:
+        shard_dir: Output directory for this split
+        image_files: Images to pack, in order
+        label_dir: Directory with the matching <stem>.txt label files
+        imgsz: Training image size (longer side of the stored images)
+        transform: Optional ContourletTransform applied to every image
+        grayscale: Store single-channel images (expanded to 3 channels on read)
+        im_files: Paths recorded for each image (defaults to `image_files`);
+            training plots and logs refer to images by these
+    
+    Returns:
+        (number of images packed, list of files that could not be read)
+    """
+    shard_dir = Path(shard_dir)
+    shard_dir.mkdir(parents=True, exist_ok=True)
+    im_files = [str(f) for f in (im_files or image_files)]
+    flags = cv2.IMREAD_GRAYSCALE if grayscale else cv2.IMREAD_COLOR
+    
+    index, labels, packed_files, failed = [], [], [], []
+    label_start = 0
+    tmp_images = shard_dir / f".{IMAGES_NAME}.tmp"
+    with open(tmp_images, 'wb') as out:
+        offset = 0
+        for image_file, im_file in zip(image_files, im_files):
+            image = cv2.imread(str(image_file), flags)
+            if image is None:
+                failed.append(str(image_file))
+                continue
+            orig_height, orig_width = image.shape[:2]
+            if transform is not None:
+                image = transform.apply(image)
+            image = resize_long_side(image, imgsz)
+            image = np.ascontiguousarray(image, dtype=np.uint8)
+            if image.ndim == 2:
+                image = image[:, :, None]
+            
+            image_labels = read_yolo_labels(Path(label_dir) / f"{Path(image_file).stem}.txt")
+            index.append((offset, *image.shape, orig_height, orig_width, label_start, len(image_labels)))
+            labels.append(image_labels)
+            packed_files.append(im_file)
+            
+            out.write(image.data)
+            offset += image.nbytes
+            label_start += len(image_labels)
+    
+    tmp_index = shard_dir / f".{INDEX_NAME}.tmp"
+    tmp_labels = shard_dir / f".{LABELS_NAME}.tmp"
+    with open(tmp_index, 'wb') as f:
+        np.save(f, np.asarray(index, dtype=INDEX_DTYPE))
+    with open(tmp_labels, 'wb') as f:
+        np.save(f, np.concatenate(labels) if labels else np.zeros((0, 5), dtype=np.float32))
+    
+    meta_path = shard_dir / META_NAME
+    if meta_path.exists():
+        meta_path.unlink()
+    os.replace(tmp_images, shard_dir / IMAGES_NAME)
+    os.replace(tmp_index, shard_dir / INDEX_NAME)
+    os.replace(tmp_labels, shard_dir / LABELS_NAME)
+    meta = {
+        "version": SHARD_VERSION,
+        "imgsz": imgsz,
+        "grayscale": grayscale,
+        "filter": transform.get_params() if transform is not None else None,
+        "filter_resolution": "native" if transform is not None else None,
+        "im_files": packed_files,
+    }
+    atomic_write_bytes(meta_path, json.dumps(meta, indent=2).encode("utf-8"))
+    return len(packed_files), failed
+
+
+def pack_dataset(
+    data_config='data.yaml',
+    output_root=DEFAULT_SHARD_DIR,
+    imgsz=640,
+    source_images=None,
+    filtered=False,
+    num_levels=2,
+    num_directions=8,
+    grayscale=False
+):
+    """
+    Pack every split of a YOLO dataset into shards and write a matching data yaml
+    
+    Splits pointing at the same image directory (train and val in this
+    repo's data.yaml) share one shard.
+    
+    Args:
+        data_config: Path to data.yaml configuration
+        output_root: Directory receiving one shard per split and data.yaml
+        imgsz: Training image size the shards are stored at
+        source_images: Directory with the images to pack instead of the image
+            directories in `data_config` (e.g. dataset/images_original);
+            labels still come from `data_config`
+        filtered: Apply the Contourlet filter while packing
+        num_levels: Contourlet pyramid levels
+        num_directions: Contourlet directional filters
+        grayscale: Store single-channel images
+    
+    Returns:
+        Path to the generated data yaml
+    """
+    data, base_dir = load_data_config(data_config)
+    
+    transform = None
+    if filtered:
+        from contourlet_filter import ContourletTransform
+        transform = ContourletTransform(num_levels=num_levels, num_directions=num_directions, grayscale=grayscale)
+    
+    output_root = Path(output_root)
+    generated = dict(data)
+    generated['path'] = str(output_root.resolve())
+    split_dirs = {}
+    for split in ('train', 'val', 'test'):
+        if not data.get(split):
+            continue
+        images_dir = (base_dir / data[split]).resolve()
+        if images_dir in split_dirs:
+            generated[split] = split_dirs[images_dir]
+            continue
+        
+        image_source = Path(source_images) if source_images else images_dir
+        image_files = list_images(image_source)
+        # Record the dataset's own image paths, even when packing from source_images
+        im_files = [images_dir / p.name for p in image_files]
+        
+        packed, failed = write_shard(
+            output_root / split,
+            image_files,
+            labels_dir_for(images_dir),
+            imgsz=imgsz,
+            transform=transform,
+            grayscale=grayscale,
+            im_files=im_files
+        )
+        size_mb = os.path.getsize(output_root / split / IMAGES_NAME) / 1024 ** 2
+        print(f"  {split}: {packed} images ({size_mb:.1f} MB) -> {output_root / split}")
+        for name in failed:
+            print(f"    ✗ Could not read {name}")
+        generated[split] = split
+        split_dirs[images_dir] = split
+    
+    generated_config = output_root / 'data.yaml'
+    with open(generated_config, 'w') as f:
+        yaml.safe_dump(generated, f, sort_keys=False)
+    
+    return str(generated_config)
+
+
+def main():
+    import argparse
+    
+    parser = argparse.ArgumentParser(
+        description="Pack a YOLO dataset into memory-mapped, pre-decoded training shards"
+    )
+    parser.add_argument(
+        "--data",
+        default="data.yaml",
+        help="Dataset configuration to pack (default: data.yaml)"
+    )
+    parser.add_argument(
+        "--output",
+        default=DEFAULT_SHARD_DIR,
+        help=f"Output directory for the shards and their data.yaml (default: {DEFAULT_SHARD_DIR})"
+    )
+    parser.add_argument(
+        "--imgsz",
+        type=int,
+        default=640,
+        help="Training image size to store images at (default: 640)"
+    )
+    parser.add_argument(
+        "--source",
+        default=None,
+        help="Pack images from this directory instead (e.g. dataset/images_original)"
+    )
+    parser.add_argument(
+        "--filtered",
+        action="store_true",
+        help="Apply the Contourlet filter while packing"
+    )
+    parser.add_argument(
+        "--levels",
+        type=int,
+        default=2,
+        help="Contourlet pyramid levels for --filtered (default: 2)"
+    )
+    parser.add_argument(
+        "--directions",
+        type=int,
+        default=8,
+        help="Contourlet directional filters for --filtered (default: 8)"
+    )
+    parser.add_argument(
+        "--grayscale",
+        action="store_true",
+        help="Store single-channel images (a third of the size for radiographs)"
+    )
+    
+    args = parser.parse_args()
+    
+    print(f"Packing {args.data} at {args.imgsz}px "
+          f"({'Contourlet-filtered' if args.filtered else 'raw'}{', grayscale' if args.grayscale else ''})")
+    data_config = pack_dataset(
+        data_config=args.data,
+        output_root=args.output,
+        imgsz=args.imgsz,
+        source_images=args.source,
+        filtered=args.filtered,
+        num_levels=args.levels,
+        num_directions=args.directions,
+        grayscale=args.grayscale
+    )
+    print(f"\n✓ Shards written; train with: python train_yolo.py --shards {args.output}")
+    print(f"  Data config: {data_config}")
+
+
+if __name__ == "__main__":
+    main()
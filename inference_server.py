@@ -1,54 +1,338 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, g, stream_with_context
 from flask_cors import CORS
 import cv2
 import numpy as np
-import torch
 import base64
-from io import BytesIO
-from PIL import Image
-import ultralytics
-from ultralytics import YOLO
+import binascii
+import hmac
+import os
+import json
+import sys
+import threading
+import time
 from contourlet_filter import ContourletTransform
+from filter_cache import FilteredImageCache, DEFAULT_MAX_BYTES, limit_size, sha256_bytes
+from job_queue import JobManager, QueueFull
+from micro_batcher import MicroBatcher
+from model_registry import ModelRegistry, backend_for_path
+from onnx_backend import BoxArrays
+from tiled_inference import MERGE_METHODS, make_tiles, merge_tile_detections, needs_tiling
+from result_cache import ResultCache
+from server_metrics import BATCH_SIZE_BUCKETS, MetricsRegistry, StageTimer, process_memory_bytes
 
 app = Flask(__name__)
 CORS(app)  # Enable CORS for all routes
 
 # Load the trained model
-model_path = r'runs\detect\train\weights\best.pt'
-model = None
+model_path = os.environ.get('MODEL_PATH', os.path.join('runs', 'detect', 'train', 'weights', 'best.pt'))
+
+# Inference backend: 'ultralytics' (PyTorch best.pt) or 'onnx' (ONNX Runtime on
+# the exported best.onnx, no torch import). Output format is the same for both.
+inference_backend = os.environ.get('INFERENCE_BACKEND', 'ultralytics')
+onnx_model_path = os.environ.get('ONNX_MODEL_PATH', os.path.splitext(model_path)[0] + '.onnx')
+# Intra-op threads for the inference backend; None leaves the library default
+worker_threads = None
+
+# Model registry: the model above is registered as "default"; MODELS adds more
+# as name=path pairs (e.g. "raw=runs/detect/train2/weights/best.pt,int8=best_int8.onnx",
+# backend by extension) and requests pick one with ?model=<name> or X-Model.
+# Models are loaded on first use and hot-swapped only once a new version is warm.
+extra_models = os.environ.get('MODELS', '')
+# Seconds between checks for replaced model files, which are then reloaded
+# in the background in every worker (0 disables)
+model_watch_interval = float(os.environ.get('MODEL_WATCH_INTERVAL', 0))
+# Bearer token for POST /models/<name>/reload; the endpoint is disabled when unset
+model_admin_token = os.environ.get('MODEL_ADMIN_TOKEN')
+model_registry = None
+model_registry_lock = threading.Lock()
+
+CLASS_NAMES = ('No Endodontic Treatment', 'Incomplete Endodontic Treatment',
+               'Complete Endodontic Treatment', 'Total Endodontic Failure')
+# Detections below detect_conf_threshold are dropped and at most
+# detect_max_detections (highest confidence first) are returned per image
+detect_conf_threshold = float(os.environ.get('DETECT_CONF_THRESHOLD', 0.25))
+detect_max_detections = int(os.environ.get('DETECT_MAX_DETECTIONS', 300))
+
+# Tiled inference for large panoramics: images over 1.5 tiles are split into
+# overlapping tile_size squares that go through the batcher together with a
+# downscaled whole-image pass, and the boxes are merged with NMS or WBF
+tiled_inference = os.environ.get('TILED_INFERENCE', '0') == '1'
+tile_size = int(os.environ.get('TILE_SIZE', 640))
+tile_overlap = float(os.environ.get('TILE_OVERLAP', 0.2))
+tile_merge = os.environ.get('TILE_MERGE', 'nms')
+tile_merge_iou = float(os.environ.get('TILE_MERGE_IOU', 0.5))
 contourlet_filter = None
+filter_lock = threading.Lock()
 use_filter = True
+# Grayscale-native mode: radiographs are decoded, filtered and cached as one
+# channel and only expanded to 3 channels at the model input. Same detections
+# for grayscale radiographs, a third of the preprocessing memory traffic.
+grayscale_mode = os.environ.get('GRAYSCALE_MODE', '0') == '1'
 
-def load_model():
-    global model
-    if model is None:
-        try:
-            model = YOLO(model_path)
-            print("✓ Model loaded successfully")
-        except Exception as e:
-            print(f"✗ Error loading model: {e}")
-            return False
-    return True
+# Opt-in: downscale uploads so their longer side is at most preprocess_max_size
+# before filtering (0 = filter at the uploaded resolution, the default). The
+# filter's output depends on the resolution it runs at, and models trained on
+# images filtered at native resolution (preprocess_dataset.py, the filter
+# cache) see different inputs when it is enabled, so only enable it for a
+# model trained on images filtered at the same size. Detections are returned
+# normalized either way. Tiled inference needs the full resolution and skips it.
+preprocess_max_size = int(os.environ.get('PREPROCESS_MAX_SIZE', 0))
+
+# Threads one image's Contourlet directional filters are spread over (1 = serial).
+# The pool is shared by all requests in a worker process, so concurrent requests
+# queue on it instead of multiplying it; the output is identical for any value.
+# 0 = one per CPU (per worker process in production), at most 4.
+filter_threads = int(os.environ.get('FILTER_THREADS', 0))
+MAX_AUTO_FILTER_THREADS = 4
+
+# Optional on-disk cache of filtered images shared with preprocess_dataset.py and
+# train_yolo.py. Disabled unless CONTOURLET_CACHE_DIR is set, since it persists
+# uploaded radiographs to disk.
+filter_cache_dir = os.environ.get('CONTOURLET_CACHE_DIR')
+filter_cache_max_bytes = int(os.environ.get('CONTOURLET_CACHE_MAX_BYTES', DEFAULT_MAX_BYTES))
+filter_cache = None
+
+# Micro-batching: concurrent /detect requests arriving within batch_max_wait_ms
+# of each other share one YOLO forward pass of up to batch_max_size images
+batch_max_size = int(os.environ.get('DETECT_MAX_BATCH', 8))
+batch_max_wait_ms = float(os.environ.get('DETECT_MAX_WAIT_MS', 10))
+batcher = None
+batcher_lock = threading.Lock()
+
+# In-memory cache of detection results for repeat analyses of the same image,
+# keyed by image bytes + model checksum + filter settings. Budget 0 disables it.
+result_cache_max_bytes = int(os.environ.get('RESULT_CACHE_MAX_BYTES', 64 * 1024 * 1024))
+result_cache_ttl = float(os.environ.get('RESULT_CACHE_TTL', 3600))
+result_cache = ResultCache(result_cache_max_bytes, result_cache_ttl) if result_cache_max_bytes > 0 else None
+
+# Background warm-up: with BACKGROUND_WARMUP=1 the server binds and answers
+# /health immediately while a thread imports the backend, loads the model and
+# filter and runs a dummy forward pass; /health returns 503 "warming" until then
+background_warmup = os.environ.get('BACKGROUND_WARMUP', '0') == '1'
+warmup_thread = None
+warmup_lock = threading.Lock()
+WARMUP_IMAGE_SIZE = 640
+
+# Backpressure: at most max_pending_requests detection requests in flight per
+# worker process; beyond that requests get an immediate 503. 0 = unlimited.
+max_pending_requests = int(os.environ.get('MAX_PENDING_REQUESTS', 0))
+pending_requests = 0
+pending_lock = threading.Lock()
+DETECTION_ENDPOINTS = ('detect', 'detect_batch')
+JOB_ENDPOINTS = ('submit_job', 'job_status', 'cancel_job', 'job_events')
+
+def external_gunicorn_workers():
+    """
+    Worker count of a gunicorn master that loaded this module directly
+    (`gunicorn -w 4 inference_server:app`), or None when not run that way
+    """
+    if 'gunicorn' not in os.path.basename(sys.argv[0]):
+        return None
+    try:
+        from gunicorn.app.wsgiapp import WSGIApplication
+        # Reads the same command line, GUNICORN_CMD_ARGS and config file as the master
+        return WSGIApplication().cfg.workers
+    except (Exception, SystemExit) as e:
+        print(f"⚠️  Could not read the gunicorn worker count ({e})")
+        return None
+
+# Asynchronous jobs (/jobs): studies are queued as individual images on a
+# bounded in-process queue and processed by job_workers threads, whose
+# requests share micro-batches like concurrent /detect calls. Jobs live in the
+# process that accepted them, so /jobs is turned off whenever more than one
+# worker process serves requests (--production --workers N, or gunicorn
+# started directly with several workers); ENABLE_JOBS=0 turns it off everywhere
+jobs_enabled = os.environ.get('ENABLE_JOBS', '1') == '1'
+if jobs_enabled and (external_gunicorn_workers() or 1) > 1:
+    jobs_enabled = False
+    print("⚠️  /jobs disabled: jobs are kept per process and gunicorn runs several workers")
+job_workers = int(os.environ.get('JOB_WORKERS', 4))
+job_max_queued_images = int(os.environ.get('JOB_MAX_QUEUED_IMAGES', 256))
+job_ttl = float(os.environ.get('JOB_TTL', 3600))
+job_manager = None
+job_manager_lock = threading.Lock()
+# Seconds between keep-alive comments on idle event streams
+JOB_EVENTS_KEEPALIVE = 15
+
+# Prometheus metrics on /metrics (per worker process). With SERVER_TIMING=1
+# detection responses also carry a Server-Timing header with the stage breakdown.
+server_timing = os.environ.get('SERVER_TIMING', '0') == '1'
+metrics = MetricsRegistry()
+request_counter = metrics.counter(
+    'http_requests_total', 'HTTP requests by endpoint and status code', ('endpoint', 'status')
+)
+request_latency = metrics.histogram(
+    'http_request_duration_seconds', 'Request handling time by endpoint', ('endpoint',)
+)
+stage_latency = metrics.histogram(
+    'detect_stage_duration_seconds',
+    'Per-image time in each detection stage (read, cache, decode, preprocess, queue, inference, merge, postprocess, serialize)',
+    ('stage',)
+)
+batch_size_histogram = metrics.histogram(
+    'detect_batch_size', 'Images per model forward pass', buckets=BATCH_SIZE_BUCKETS
+)
+metrics.gauge('detect_requests_in_flight', 'Detection requests being handled', lambda: pending_requests)
+metrics.gauge(
+    'detect_batch_queue_depth', 'Images waiting for a forward pass',
+    lambda: batcher.pending() if batcher is not None else 0
+)
+metrics.gauge(
+    'job_queued_images', 'Job images waiting for a worker',
+    lambda: job_manager.queued_items() if job_manager is not None else 0
+)
+metrics.gauge(
+    'detect_model_loaded', '1 once the default model is loaded',
+    lambda: int(model_registry is not None and model_registry.is_loaded())
+)
+metrics.gauge('process_resident_memory_bytes', 'Resident memory of this worker process', process_memory_bytes)
+
+def cache_stats():
+    """{cache name: stats dict} for the enabled caches"""
+    stats = {}
+    if result_cache is not None:
+        stats['result'] = result_cache.stats()
+    if filter_cache is not None:
+        stats['filter'] = filter_cache.stats()
+    return stats
+
+metrics.counter_function(
+    'cache_lookups_total', 'Cache lookups by cache and outcome',
+    lambda: {
+        (name, outcome): stats[key]
+        for name, stats in cache_stats().items() for outcome, key in (('hit', 'hits'), ('miss', 'misses'))
+    },
+    ('cache', 'outcome')
+)
+metrics.gauge(
+    'cache_hit_ratio', 'Fraction of cache lookups that hit',
+    lambda: {
+        name: stats['hits'] / (stats['hits'] + stats['misses']) if stats['hits'] + stats['misses'] else 0.0
+        for name, stats in cache_stats().items()
+    },
+    ('cache',)
+)
+metrics.gauge(
+    'cache_size_bytes', 'Bytes held by each cache',
+    lambda: {name: stats['bytes'] for name, stats in cache_stats().items() if stats['bytes'] is not None},
+    ('cache',)
+)
+
+def load_backend_model(spec):
+    """Load a registry ModelSpec with its backend"""
+    if spec.backend == 'onnx':
+        from onnx_backend import OnnxDetector
+        return OnnxDetector(
+            spec.path,
+            conf_threshold=detect_conf_threshold,
+            max_det=detect_max_detections,
+            num_threads=worker_threads
+        )
+    from ultralytics import YOLO
+    return YOLO(spec.path)
+
+def parse_model_list(value):
+    """'name=path,name=path' -> [(name, path)]"""
+    models = []
+    for item in value.split(','):
+        if not item.strip():
+            continue
+        name, sep, path = item.partition('=')
+        if not sep or not name.strip() or not path.strip():
+            raise ValueError(f"Expected name=path in model list, got {item!r}")
+        models.append((name.strip(), path.strip()))
+    return models
+
+def get_model_registry():
+    global model_registry
+    if model_registry is None:
+        with model_registry_lock:
+            if model_registry is None:
+                registry = ModelRegistry(load_backend_model, warm_up_fn=warm_up_model)
+                registry.register(
+                    'default',
+                    onnx_model_path if inference_backend == 'onnx' else model_path,
+                    inference_backend
+                )
+                for name, path in parse_model_list(extra_models):
+                    registry.register(name, path)
+                model_registry = registry
+    return model_registry
+
+def load_model(name=None):
+    """
+    Current version of a registered model (the default one if `name` is None)
+    
+    Returns None if it fails to load; raises KeyError for unknown names.
+    """
+    registry = get_model_registry()
+    try:
+        return registry.get(name)
+    except KeyError:
+        raise
+    except Exception as e:
+        print(f"✗ Error loading model '{name or registry.default_name}': {e}")
+        return None
+
+def start_model_watcher():
+    if model_watch_interval > 0:
+        get_model_registry().watch(model_watch_interval)
 
 def load_filter():
     global contourlet_filter
-    if contourlet_filter is None:
+    if contourlet_filter is not None:
+        return True
+    with filter_lock:
+        if contourlet_filter is not None:
+            return True
         try:
-            contourlet_filter = ContourletTransform(num_levels=2, num_directions=8)
+            transform = ContourletTransform(
+                num_levels=2, num_directions=8, grayscale=grayscale_mode,
+                max_threads=filter_threads or min(MAX_AUTO_FILTER_THREADS, os.cpu_count() or 1)
+            )
+            # Build the directional kernel bank now rather than on the first request
+            transform.kernel_bank
+            contourlet_filter = transform
             print("✓ Contourlet filter initialized")
+            load_filter_cache()
         except Exception as e:
             print(f"⚠️  Error initializing filter: {e}")
             return False
     return True
 
-def apply_preprocessing(img_array):
-    """Apply Contourlet transform preprocessing"""
+def load_filter_cache():
+    global filter_cache
+    if filter_cache is None and filter_cache_dir:
+        try:
+            filter_cache = FilteredImageCache(filter_cache_dir, max_bytes=filter_cache_max_bytes)
+            print(f"✓ Filtered-image cache: {filter_cache_dir}")
+        except Exception as e:
+            print(f"⚠️  Error opening filtered-image cache: {e}")
+            return False
+    return True
+
+def apply_preprocessing(img_array, image_bytes=None, max_size=None):
+    """
+    Apply Contourlet transform preprocessing
+    
+    `max_size` is the longer-side limit `img_array` was downscaled to (None if
+    it is at the uploaded resolution), which keys the filtered-image cache.
+    """
     if not use_filter:
         return img_array
     
     if contourlet_filter is None:
         return img_array
     
+    if filter_cache is not None and image_bytes is not None:
+        try:
+            filtered, _ = filter_cache.get_or_apply(
+                image_bytes, contourlet_filter, image=img_array, max_size=max_size
+            )
+            return filtered
+        except Exception as e:
+            print(f"⚠️  Filtered-image cache error, filtering directly: {e}")
+    
     try:
         filtered = contourlet_filter.apply(img_array)
         return filtered
@@ -56,104 +340,935 @@ def apply_preprocessing(img_array):
         print(f"⚠️  Error applying filter: {e}")
         return img_array
 
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    if request.endpoint in DETECTION_ENDPOINTS:
+        g.timer = StageTimer(stage_latency)
+
+@app.before_request
+def admit_request():
+    """Reject detection requests with 503 once the worker's pending queue is full"""
+    global pending_requests
+    if request.endpoint not in DETECTION_ENDPOINTS:
+        return None
+    with pending_lock:
+        if max_pending_requests > 0 and pending_requests >= max_pending_requests:
+            response = jsonify({"error": "Server busy, retry later"})
+            response.headers['Retry-After'] = '1'
+            return response, 503
+        pending_requests += 1
+    g.admitted = True
+    return None
+
+@app.after_request
+def record_request_metrics(response):
+    endpoint = request.endpoint or 'unmatched'
+    elapsed = time.perf_counter() - g.get('request_start', time.perf_counter())
+    request_counter.inc(endpoint=endpoint, status=response.status_code)
+    request_latency.observe(elapsed, endpoint=endpoint)
+    
+    timer = g.get('timer')
+    if server_timing and timer is not None:
+        stages = timer.header()
+        total = f"total;dur={elapsed * 1000:.2f}"
+        response.headers['Server-Timing'] = f"{stages}, {total}" if stages else total
+        # Lets the browser's Resource Timing API read the header cross-origin
+        response.headers['Timing-Allow-Origin'] = '*'
+    return response
+
+@app.teardown_request
+def release_request(exc):
+    global pending_requests
+    if g.pop('admitted', False):
+        with pending_lock:
+            pending_requests -= 1
+
+def configure_worker_threads(num_threads):
+    """Limit backend intra-op threads so worker processes don't oversubscribe cores"""
+    global worker_threads
+    if not num_threads or num_threads <= 0:
+        return
+    worker_threads = num_threads
+    if any(spec.backend != 'onnx' for spec in get_model_registry().specs().values()):
+        import torch
+        torch.set_num_threads(num_threads)
+        try:
+            torch.set_num_interop_threads(1)
+        except RuntimeError:
+            # Already set, or parallel work has started in this process
+            pass
+
+def warm_up_model(version):
+    """
+    Run one dummy image through a model version
+    
+    The first forward pass pays for lazy initialization (kernel selection,
+    allocator pools, ONNX Runtime graph setup, the ultralytics predictor);
+    the registry runs it on every version before publishing it, so that
+    non-thread-safe setup never races real requests on the batcher thread.
+    It calls the model directly since nothing else can reach it yet.
+    """
+    shape = (WARMUP_IMAGE_SIZE, WARMUP_IMAGE_SIZE) if grayscale_mode else (WARMUP_IMAGE_SIZE, WARMUP_IMAGE_SIZE, 3)
+    run_detection_batch([(version, apply_preprocessing(np.zeros(shape, dtype=np.uint8)))])
+
+def warm_up(num_threads=None):
+    """Load the backend, filter and every registered model (which warms each one up)"""
+    start = time.perf_counter()
+    configure_worker_threads(num_threads)
+    if use_filter:
+        load_filter()
+    
+    ready = True
+    for name in get_model_registry().names():
+        if load_model(name) is None:
+            print(f"⚠️  Warm-up could not load model '{name}' (will retry on first request)")
+            ready = False
+    print(f"✓ Warm-up finished in {time.perf_counter() - start:.1f} s")
+    return ready
+
+def start_warmup(num_threads=None):
+    """Run warm_up in a daemon thread (once per process)"""
+    global warmup_thread
+    with warmup_lock:
+        if warmup_thread is None:
+            warmup_thread = threading.Thread(target=warm_up, args=(num_threads,), name="warmup", daemon=True)
+            warmup_thread.start()
+    return warmup_thread
+
+def server_state():
+    """'warming' during a background warm-up, then 'ready' once the model is loaded ('cold' before that)"""
+    if warmup_thread is not None and warmup_thread.is_alive():
+        return "warming"
+    return "ready" if model_registry is not None and model_registry.is_loaded() else "cold"
+
+def init_worker(num_threads):
+    """Per-worker-process setup after fork"""
+    # Threads don't survive fork, so each worker runs its own watcher and warm-up
+    start_model_watcher()
+    if background_warmup:
+        start_warmup(num_threads)
+        return
+    configure_worker_threads(num_threads)
+    for name, spec in get_model_registry().specs().items():
+        if spec.backend == 'onnx':
+            # ONNX Runtime thread pools do not survive fork, so each worker builds its own session
+            load_model(name)
+
 @app.route('/health', methods=['GET'])
 def health():
-    model_status = "loaded" if model is not None else "not_loaded"
+    state = server_state()
+    registry = get_model_registry()
+    model_status = "loaded" if registry.is_loaded() else "not_loaded"
     filter_status = "active" if (use_filter and contourlet_filter is not None) else "disabled"
-    return jsonify({
-        "status": "healthy",
+    response = {
+        "status": "warming" if state == "warming" else "healthy",
+        "state": state,
         "model": model_status,
-        "filter": filter_status
-    })
+        "backend": inference_backend,
+        "models": registry.status(),
+        "filter": filter_status,
+        "grayscale": grayscale_mode,
+        "tiled": tiled_inference,
+        "pid": os.getpid()
+    }
+    if max_pending_requests > 0:
+        response["pending_requests"] = pending_requests
+        response["max_pending_requests"] = max_pending_requests
+    if filter_cache is not None:
+        response["filter_cache"] = filter_cache.stats()
+    if result_cache is not None:
+        response["result_cache"] = result_cache.stats()
+    if job_manager is not None:
+        response["jobs"] = job_manager.stats()
+    # Load balancers keep traffic away until the warm-up has finished
+    return jsonify(response), 503 if state == "warming" else 200
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Prometheus text exposition of this worker's metrics"""
+    return Response(metrics.render(), content_type='text/plain; version=0.0.4; charset=utf-8')
+
+def decode_data_url(encoded):
+    """
+    Decode a base64 data URL (or bare base64 string) into raw image bytes
+    
+    Raises ValueError for anything that is not non-empty, valid base64.
+    """
+    if not isinstance(encoded, str):
+        raise ValueError("Image must be a base64 string")
+    if ',' in encoded:
+        encoded = encoded.split(',', 1)[1]
+    try:
+        image_data = base64.b64decode(encoded, validate=True)
+    except binascii.Error as e:
+        raise ValueError(f"Invalid base64 image data: {e}") from e
+    if not image_data:
+        raise ValueError("Empty image")
+    return image_data
+
+def read_request_images(json_key, form_key, multiple=False):
+    """
+    Extract encoded image bytes from the current request
+    
+    Accepts multipart/form-data file uploads, JSON bodies with base64 data URLs
+    (the original API), and raw binary bodies (application/octet-stream or
+    image/*) which are used as-is without any intermediate copy.
+    
+    Returns:
+        List of encoded images (empty if the request holds none)
+    
+    Raises ValueError for an empty upload or invalid base64 when a single
+    image is expected; in multiple mode bad entries fail later, one by one.
+    """
+    mimetype = request.mimetype
+    
+    if mimetype == 'multipart/form-data':
+        files = request.files.getlist(form_key)
+        if not files and not multiple:
+            files = list(request.files.values())[:1]
+        images = [f.read() for f in files]
+        if not multiple and images and not images[0]:
+            raise ValueError("Empty image upload")
+        return images
+    
+    if mimetype == 'application/json':
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or json_key not in data:
+            return []
+        values = data[json_key]
+        if multiple:
+            if not isinstance(values, list):
+                return []
+            return list(values)
+        return [decode_data_url(values)]
+    
+    body = request.get_data(cache=False)
+    return [body] if body else []
+
+def decode_image(image_data):
+    """
+    Decode encoded image bytes straight into a BGR (or, in grayscale mode, single-channel) NumPy array
+    
+    Raises ValueError for empty or undecodable data.
+    """
+    if not image_data:
+        raise ValueError("Empty image")
+    flags = cv2.IMREAD_GRAYSCALE if grayscale_mode else cv2.IMREAD_COLOR
+    try:
+        img_array = cv2.imdecode(np.frombuffer(image_data, dtype=np.uint8), flags)
+    except cv2.error as e:
+        raise ValueError(f"Could not decode image: {e}") from e
+    if img_array is None:
+        raise ValueError("Could not decode image")
+    return img_array
+
+def preprocess_size_limit():
+    """Longer-side limit applied before filtering, or 0 for none"""
+    return 0 if tiled_inference else preprocess_max_size
+
+def prepare_image(image_data, timer):
+    """Decode image bytes, bound their size and apply preprocessing, returning the model input array"""
+    with timer.stage('decode'):
+        img_array = decode_image(image_data)
+    
+    # Filter cost grows with the pixel count, so shrink oversized uploads first
+    max_size = preprocess_size_limit()
+    with timer.stage('resize'):
+        resized = limit_size(img_array, max_size)
+    
+    # Apply Contourlet preprocessing
+    with timer.stage('preprocess'):
+        return apply_preprocessing(resized, image_data, max_size if resized is not img_array else None)
+
+def result_cache_key(image_data, version):
+    """Cache key covering the image bytes, the model version and the filter settings"""
+    if use_filter and contourlet_filter is not None:
+        filter_settings = contourlet_filter.get_params()
+    else:
+        filter_settings = None
+    settings = json.dumps({
+        "model": version.checksum,
+        "filter": filter_settings,
+        "grayscale": grayscale_mode,
+        "max_size": preprocess_size_limit(),
+        "conf": detect_conf_threshold,
+        "max_det": detect_max_detections,
+        "tiling": [tile_size, tile_overlap, tile_merge, tile_merge_iou] if tiled_inference else None
+    }, sort_keys=True)
+    return sha256_bytes(image_data) + ':' + sha256_bytes(settings.encode('utf-8'))
+
+def result_box_arrays(result):
+    """Convert one ultralytics result into backend-neutral BoxArrays"""
+    # One device-to-host copy of the (n, 6) x1, y1, x2, y2, conf, cls tensor
+    data = result.boxes.data.cpu().numpy()
+    return BoxArrays(data[:, :4], data[:, -2], data[:, -1].astype(np.int64))
+
+def format_box_arrays(boxes, img_array):
+    """Convert backend-neutral BoxArrays (pixel xyxy, conf, cls) into the JSON detection list"""
+    conf = np.asarray(boxes.conf, dtype=np.float64)
+    keep = np.flatnonzero(conf >= detect_conf_threshold)
+    if len(keep) > detect_max_detections:
+        keep = keep[np.argsort(-conf[keep], kind='stable')[:detect_max_detections]]
+    if not len(keep):
+        return []
+    
+    # Normalized x, y, width, height for the whole batch of boxes at once
+    img_height, img_width = img_array.shape[:2]
+    xyxy = np.asarray(boxes.xyxy, dtype=np.float64)[keep]
+    bbox = np.concatenate([xyxy[:, :2], xyxy[:, 2:] - xyxy[:, :2]], axis=1)
+    bbox /= np.array([img_width, img_height, img_width, img_height], dtype=np.float64)
+    
+    class_ids = np.asarray(boxes.cls)[keep].astype(np.int64)
+    return [
+        {
+            'bbox': box,
+            'class': CLASS_NAMES[class_id] if 0 <= class_id < len(CLASS_NAMES) else f"class_{class_id}",
+            'score': score
+        }
+        for box, class_id, score in zip(bbox.tolist(), class_ids.tolist(), conf[keep].tolist())
+    ]
+
+def run_model(version, img_arrays):
+    """One forward pass of a model version over preprocessed images, returning BoxArrays"""
+    if version.backend == 'onnx':
+        return version.model(list(img_arrays))
+    # The ONNX backend letterboxes grayscale input as one channel itself;
+    # ultralytics gets 3 channels, expanded only here at the model boundary
+    inputs = [cv2.cvtColor(a, cv2.COLOR_GRAY2BGR) if a.ndim == 2 else a for a in img_arrays]
+    results = version.model(
+        inputs, verbose=False, conf=detect_conf_threshold, max_det=detect_max_detections
+    )
+    return [result_box_arrays(result) for result in results]
+
+def run_detection_batch(items):
+    """
+    Run the batched forward passes for (model version, preprocessed image) items
+    
+    Items for different models (or versions, around a hot swap) end up in
+    the same batch only if requests for them arrive together; each model
+    gets one forward pass over its share of the batch.
+    
+    Returns:
+        One (BoxArrays in image pixels, batch timings) pair per item; the
+        timings dict is shared by all items of one forward pass
+    """
+    groups = {}
+    for idx, (version, img_array) in enumerate(items):
+        groups.setdefault(id(version), (version, []))[1].append(idx)
+    
+    outcomes = [None] * len(items)
+    for version, indices in groups.values():
+        batch_size_histogram.observe(len(indices))
+        start = time.perf_counter()
+        boxes = run_model(version, [items[idx][1] for idx in indices])
+        timings = {'inference': time.perf_counter() - start}
+        for idx, image_boxes in zip(indices, boxes):
+            outcomes[idx] = (image_boxes, timings)
+    return outcomes
+
+def submit_detection(img_array, version):
+    """
+    Queue one preprocessed image for a model version on the batcher
+    
+    Large images are split into tiles (plus the whole image) when tiled
+    inference is on; they are queued together so they share forward passes.
+    
+    Returns:
+        Handle for collect_detections
+    """
+    submitted_at = time.perf_counter()
+    if tiled_inference and needs_tiling(img_array.shape, tile_size):
+        tiles = make_tiles(img_array, tile_size, tile_overlap)
+        futures = get_batcher().submit_many([(version, tile.image) for tile in tiles] + [(version, img_array)])
+        return tiles, futures, submitted_at
+    return None, [get_batcher().submit((version, img_array))], submitted_at
+
+def collect_detections(handle, img_array, timer):
+    """Wait for a submit_detection handle and return the JSON detection list"""
+    tiles, futures, submitted_at = handle
+    outcomes = [future.result() for future in futures]
+    
+    # Tiles may have been spread over several batches; count each batch once
+    batch_timings = {id(timings): timings for _, timings in outcomes}.values()
+    inference = sum(timings['inference'] for timings in batch_timings)
+    timer.add('inference', inference)
+    timer.add('queue', max(0.0, time.perf_counter() - submitted_at - inference))
+    
+    if tiles is None:
+        boxes = outcomes[0][0]
+    else:
+        with timer.stage('merge'):
+            boxes = merge_tile_detections(
+                [tile_boxes for tile_boxes, _ in outcomes[:-1]],
+                tiles,
+                full_image_detections=outcomes[-1][0],
+                iou_threshold=tile_merge_iou,
+                method=tile_merge
+            )
+    
+    with timer.stage('postprocess'):
+        return format_box_arrays(boxes, img_array)
+
+def get_batcher():
+    global batcher
+    if batcher is None:
+        with batcher_lock:
+            if batcher is None:
+                batcher = MicroBatcher(
+                    run_detection_batch,
+                    max_batch_size=batch_max_size,
+                    max_wait_ms=batch_max_wait_ms
+                )
+    return batcher
+
+def ensure_ready():
+    """
+    Load the requested model and the filter on demand
+    
+    The model is picked with ?model=<name> or an X-Model header (default model otherwise).
+    
+    Returns:
+        (model version, None) or (None, error response)
+    """
+    name = request.args.get('model') or request.headers.get('X-Model')
+    try:
+        version = load_model(name)
+    except KeyError as e:
+        return None, (jsonify({"error": str(e.args[0])}), 404)
+    if version is None:
+        return None, (jsonify({"error": "Model failed to load"}), 500)
+    
+    # Load filter if using filtering
+    if use_filter and not load_filter():
+        print("⚠️  Filter initialization failed, continuing without filter")
+    return version, None
+
+def run_detection(image_data, timer, version):
+    """
+    Full pipeline for one encoded image: result cache, decode, preprocess, detect
+    
+    Inference is coalesced with concurrent requests into shared forward passes.
+    Raises ValueError for images that cannot be decoded.
+    """
+    cache_key = None
+    if result_cache is not None:
+        with timer.stage('cache'):
+            cache_key = result_cache_key(image_data, version)
+            detections = result_cache.get(cache_key)
+        if detections is not None:
+            return detections
+    
+    img_array = prepare_image(image_data, timer)
+    detections = collect_detections(submit_detection(img_array, version), img_array, timer)
+    if cache_key is not None:
+        result_cache.put(cache_key, detections)
+    return detections
 
 @app.route('/detect', methods=['POST'])
 def detect():
     try:
-        # Load model if not loaded
-        if not load_model():
-            return jsonify({"error": "Model failed to load"}), 500
+        version, error = ensure_ready()
+        if error is not None:
+            return error
+        
+        timer = g.timer
         
-        # Load filter if using filtering
-        if use_filter and not load_filter():
-            print("⚠️  Filter initialization failed, continuing without filter")
-
         # Get image from request
-        data = request.get_json()
-        if not data or 'image' not in data:
+        try:
+            with timer.stage('read'):
+                images = read_request_images('image', 'image')
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        if not images:
             return jsonify({"error": "No image provided"}), 400
+        
+        try:
+            detections = run_detection(images[0], timer, version)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        with timer.stage('serialize'):
+            return jsonify({"detections": detections})
+    
+    except Exception as e:
+        print(f"Error during detection: {e}")
+        return jsonify({"error": str(e)}), 500
 
-        # Decode base64 image
-        image_data = base64.b64decode(data['image'].split(',')[1])
-        image = Image.open(BytesIO(image_data))
-
-        # Convert to numpy array
-        img_array = np.array(image)
+@app.route('/detect/batch', methods=['POST'])
+def detect_batch():
+    try:
+        version, error = ensure_ready()
+        if error is not None:
+            return error
+        
+        timer = g.timer
+        with timer.stage('read'):
+            images = read_request_images('images', 'images', multiple=True)
+        if not images:
+            return jsonify({"error": "No images provided"}), 400
+        
+        # Preprocess every image first so the whole request can share batches;
+        # a bad image only fails its own entry
+        responses = [None] * len(images)
+        prepared = {}
+        cache_keys = {}
+        for idx, encoded in enumerate(images):
+            try:
+                if isinstance(encoded, str):
+                    encoded = decode_data_url(encoded)
+                if result_cache is not None:
+                    with timer.stage('cache'):
+                        cache_keys[idx] = result_cache_key(encoded, version)
+                        detections = result_cache.get(cache_keys[idx])
+                    if detections is not None:
+                        responses[idx] = {"detections": detections}
+                        continue
+                prepared[idx] = prepare_image(encoded, timer)
+            except Exception as e:
+                responses[idx] = {"error": str(e)}
+        
+        handles = {idx: submit_detection(img_array, version) for idx, img_array in prepared.items()}
+        for idx, handle in handles.items():
+            try:
+                detections = collect_detections(handle, prepared[idx], timer)
+                responses[idx] = {"detections": detections}
+                if idx in cache_keys:
+                    result_cache.put(cache_keys[idx], detections)
+            except Exception as e:
+                responses[idx] = {"error": str(e)}
         
-        # Apply Contourlet preprocessing
-        img_array = apply_preprocessing(img_array)
-
-        # Run inference
-        results = model(img_array)
-
-        # Process results
-        detections = []
-        for result in results:
-            boxes = result.boxes
-            for box in boxes:
-                # Get bounding box coordinates
-                x1, y1, x2, y2 = box.xyxy[0].cpu().numpy()
-                confidence = float(box.conf[0].cpu().numpy())
-                class_id = int(box.cls[0].cpu().numpy())
-
-                # Convert to normalized coordinates
-                img_height, img_width = img_array.shape[:2]
-                x = x1 / img_width
-                y = y1 / img_height
-                width = (x2 - x1) / img_width
-                height = (y2 - y1) / img_height
-
-                # Map class ID to name
-                class_names = ['No Endodontic Treatment', 'Incomplete Endodontic Treatment',
-                             'Complete Endodontic Treatment', 'Total Endodontic Failure']
-                class_name = class_names[class_id] if class_id < len(class_names) else f"class_{class_id}"
-
-                detections.append({
-                    'bbox': [x, y, width, height],
-                    'class': class_name,
-                    'score': confidence
-                })
-
-        return jsonify({"detections": detections})
+        with timer.stage('serialize'):
+            return jsonify({"results": responses})
+    
+    except Exception as e:
+        print(f"Error during batch detection: {e}")
+        return jsonify({"error": str(e)}), 500
+
+def process_job_image(item):
+    """Job worker: run one queued (model version, image) through the detection pipeline"""
+    version, encoded = item
+    if isinstance(encoded, str):
+        encoded = decode_data_url(encoded)
+    return {"detections": run_detection(encoded, StageTimer(stage_latency), version)}
 
+def get_job_manager():
+    global job_manager
+    if job_manager is None:
+        with job_manager_lock:
+            if job_manager is None:
+                job_manager = JobManager(
+                    process_job_image,
+                    num_workers=job_workers,
+                    max_queued_items=job_max_queued_images,
+                    ttl_seconds=job_ttl
+                )
+    return job_manager
+
+@app.before_request
+def require_jobs_enabled():
+    """Answer /jobs requests with 501 when jobs are turned off"""
+    if request.endpoint in JOB_ENDPOINTS and not jobs_enabled:
+        return jsonify({
+            "error": "Jobs are disabled on this server; they need a single worker process (--workers 1)"
+        }), 501
+    return None
+
+def job_urls(job_id):
+    return {
+        "status_url": f"/jobs/{job_id}",
+        "events_url": f"/jobs/{job_id}/events"
+    }
+
+@app.route('/jobs', methods=['POST'])
+def submit_job():
+    """Queue a study (several images) and return a job ID immediately"""
+    try:
+        version, error = ensure_ready()
+        if error is not None:
+            return error
+        
+        images = read_request_images('images', 'images', multiple=True)
+        if not images:
+            return jsonify({"error": "No images provided"}), 400
+        
+        try:
+            # The whole study is analysed by the model version current at submission
+            job = get_job_manager().submit([(version, image) for image in images])
+        except QueueFull as e:
+            response = jsonify({"error": f"Job queue full, retry later ({e})"})
+            response.headers['Retry-After'] = '5'
+            return response, 503
+        
+        response = jsonify({"job_id": job.id, "status": job.status, "total": job.total, **job_urls(job.id)})
+        response.headers['Location'] = f"/jobs/{job.id}"
+        return response, 202
+    
     except Exception as e:
-        print(f"Error during detection: {e}")
+        print(f"Error submitting job: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/jobs/<job_id>', methods=['GET'])
+def job_status(job_id):
+    """Poll a job: per-image results so far (null while pending)"""
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify({**job.snapshot(), **job_urls(job_id)})
+
+@app.route('/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Skip a job's remaining images"""
+    if not get_job_manager().cancel(job_id):
+        return jsonify({"error": "Unknown or expired job"}), 404
+    return jsonify(get_job_manager().get(job_id).snapshot())
+
+@app.route('/jobs/<job_id>/events', methods=['GET'])
+def job_events(job_id):
+    """
+    Server-sent events: one `result` event per finished image, then `done`
+    
+    Event IDs count finished images, so a reconnecting EventSource (which
+    sends Last-Event-ID) only receives what it missed; `?since=N` does the
+    same for other clients.
+    """
+    job = get_job_manager().get(job_id)
+    if job is None:
+        return jsonify({"error": "Unknown or expired job"}), 404
+    try:
+        since = int(request.headers.get('Last-Event-ID') or request.args.get('since', 0))
+    except ValueError:
+        since = 0
+    
+    def stream(since):
+        while True:
+            new, ended = job.wait_for_results(since, timeout=JOB_EVENTS_KEEPALIVE)
+            for sequence, index, result in new:
+                payload = json.dumps({"index": index, **result})
+                yield f"id: {sequence + 1}\nevent: result\ndata: {payload}\n\n"
+            since += len(new)
+            if ended:
+                payload = json.dumps({"status": job.status, "total": job.total, "completed": job.completed})
+                yield f"event: done\ndata: {payload}\n\n"
+                return
+            if not new:
+                yield ": keep-alive\n\n"
+    
+    response = Response(stream_with_context(stream(since)), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
+
+@app.route('/models', methods=['GET'])
+def list_models():
+    """Registered models, their loaded versions and last reloads (this worker)"""
+    registry = get_model_registry()
+    return jsonify({"default": registry.default_name, "models": registry.status()})
+
+@app.route('/models/<name>/reload', methods=['POST'])
+def reload_model(name):
+    """
+    Hot-swap a model: load and warm up a new version in the background, then switch
+    
+    Body (optional): {"path": "...", "backend": "ultralytics" | "onnx"}; without
+    a path the current file is reloaded, with one a new name is registered.
+    Requires `Authorization: Bearer <MODEL_ADMIN_TOKEN>`.
+    """
+    if not model_admin_token:
+        return jsonify({"error": "Model administration is disabled (set MODEL_ADMIN_TOKEN)"}), 403
+    supplied = request.headers.get('Authorization', '')
+    if not hmac.compare_digest(supplied.encode('utf-8'), f"Bearer {model_admin_token}".encode('utf-8')):
+        return jsonify({"error": "Unauthorized"}), 401
+    
+    body = request.get_json(silent=True) or {}
+    backend = body.get('backend')
+    if backend not in (None, 'ultralytics', 'onnx'):
+        return jsonify({"error": "backend must be 'ultralytics' or 'onnx'"}), 400
+    path = body.get('path')
+    if path is not None and not os.path.isfile(path):
+        return jsonify({"error": f"Model file not found: {path}"}), 400
+    
+    registry = get_model_registry()
+    try:
+        registry.reload(name, path=path, backend=backend)
+    except KeyError as e:
+        return jsonify({"error": str(e.args[0])}), 404
+    except RuntimeError as e:
+        return jsonify({"error": str(e)}), 409
+    return jsonify({"model": name, "reload": registry.reload_status(name)}), 202
+
+def serve_production(host='0.0.0.0', port=5000, workers=2, inference_threads=None):
+    """
+    Serve with multiple worker processes
+    
+    Uses gunicorn (gthread workers) where available: the model and filter are
+    loaded once in the master and the workers are forked afterwards, sharing
+    that memory copy-on-write (the ONNX backend loads per worker instead). Falls back to a single waitress process (e.g. on
+    Windows). Each worker gets enough threads to hold max_pending_requests
+    in-flight requests plus a couple for /health and fast 503 responses.
+    """
+    global max_pending_requests
+    cpu_count = os.cpu_count() or 1
+    if inference_threads is None:
+        inference_threads = max(1, cpu_count // max(1, workers))
+    if max_pending_requests <= 0:
+        max_pending_requests = 2 * batch_max_size
+    request_threads = max_pending_requests + 2
+    
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        BaseApplication = None
+    
+    if BaseApplication is None:
+        from waitress import serve
+        print(f"gunicorn not available, serving with waitress (1 process, {request_threads} threads)")
+        init_worker(inference_threads)
+        serve(app, host=host, port=port, threads=request_threads)
+        return
+    
+    class ProductionApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', request_threads)
+            self.cfg.set('preload_app', True)
+            self.cfg.set('timeout', 120)
+            self.cfg.set('post_fork', lambda server, worker: init_worker(inference_threads))
+        
+        def load(self):
+            return app
+    
+    print(f"Serving with gunicorn ({workers} workers x {request_threads} threads, "
+          f"{inference_threads} inference threads each)")
+    ProductionApplication().run()
+
+
 if __name__ == '__main__':
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Dental X-Ray Detection Server")
+    parser.add_argument("--host", default="0.0.0.0", help="Bind address (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=5000, help="Port (default: 5000)")
+    parser.add_argument(
+        "--production",
+        action="store_true",
+        help="Serve with multiple worker processes instead of the Flask development server"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=2,
+        help="Worker processes in production mode (default: 2)"
+    )
+    parser.add_argument(
+        "--torch-threads",
+        type=int,
+        default=None,
+        help="Torch/ONNX Runtime intra-op threads per worker (default: CPUs / workers)"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=["ultralytics", "onnx"],
+        default=None,
+        help="Inference backend (default: INFERENCE_BACKEND or ultralytics)"
+    )
+    parser.add_argument(
+        "--model",
+        default=None,
+        help="Default model weights, .pt or .onnx (default: MODEL_PATH or runs/detect/train/weights/best.pt)"
+    )
+    parser.add_argument(
+        "--models",
+        default=None,
+        help="Additional models as name=path[,name=path] selectable per request (default: MODELS)"
+    )
+    parser.add_argument(
+        "--watch-models",
+        type=float,
+        default=None,
+        help="Reload models whose file changed, checking every N seconds (default: MODEL_WATCH_INTERVAL or off)"
+    )
+    parser.add_argument(
+        "--grayscale",
+        action="store_true",
+        help="Decode, filter and cache radiographs as one channel (default: GRAYSCALE_MODE)"
+    )
+    parser.add_argument(
+        "--preprocess-max-size",
+        type=int,
+        default=None,
+        help="Downscale uploads to this longer side before filtering, 0 to filter at full size; "
+             "changes the filter output, so only for models trained that way (default: PREPROCESS_MAX_SIZE or 0)"
+    )
+    parser.add_argument(
+        "--filter-threads",
+        type=int,
+        default=None,
+        help="Threads per image for the Contourlet filter, 1 for serial "
+             "(default: FILTER_THREADS or CPUs / workers, at most 4)"
+    )
+    parser.add_argument(
+        "--tiled",
+        action="store_true",
+        help="Split large images into overlapping tiles (default: TILED_INFERENCE)"
+    )
+    parser.add_argument(
+        "--tile-size",
+        type=int,
+        default=None,
+        help="Tile side in pixels (default: TILE_SIZE or 640)"
+    )
+    parser.add_argument(
+        "--tile-overlap",
+        type=float,
+        default=None,
+        help="Fraction of a tile shared with its neighbours (default: TILE_OVERLAP or 0.2)"
+    )
+    parser.add_argument(
+        "--tile-merge",
+        choices=MERGE_METHODS,
+        default=None,
+        help="How boxes from overlapping tiles are merged (default: TILE_MERGE or nms)"
+    )
+    parser.add_argument(
+        "--conf",
+        type=float,
+        default=None,
+        help="Minimum detection confidence (default: DETECT_CONF_THRESHOLD or 0.25)"
+    )
+    parser.add_argument(
+        "--max-det",
+        type=int,
+        default=None,
+        help="Max detections returned per image (default: DETECT_MAX_DETECTIONS or 300)"
+    )
+    parser.add_argument(
+        "--background-warmup",
+        action="store_true",
+        help="Start serving at once and load/warm up the model in a background thread (default: BACKGROUND_WARMUP)"
+    )
+    parser.add_argument(
+        "--no-jobs",
+        action="store_true",
+        help="Turn off the /jobs endpoints (always off with --production --workers > 1; default: ENABLE_JOBS)"
+    )
+    parser.add_argument(
+        "--max-pending",
+        type=int,
+        default=None,
+        help="Max in-flight detection requests per worker before returning 503 "
+             "(default: MAX_PENDING_REQUESTS, or 2x max batch size in production)"
+    )
+    args = parser.parse_args()
+    
+    if args.max_pending is not None:
+        max_pending_requests = args.max_pending
+    if args.backend is not None:
+        inference_backend = args.backend
+    if args.model is not None:
+        if args.backend is None:
+            inference_backend = backend_for_path(args.model)
+        if inference_backend == 'onnx':
+            onnx_model_path = args.model
+        else:
+            model_path = args.model
+    if args.models is not None:
+        extra_models = args.models
+    if args.watch_models is not None:
+        model_watch_interval = args.watch_models
+    if args.grayscale:
+        grayscale_mode = True
+    if args.preprocess_max_size is not None:
+        preprocess_max_size = args.preprocess_max_size
+    if args.filter_threads is not None:
+        filter_threads = args.filter_threads
+    if filter_threads <= 0:
+        # The filter is built here, before production workers fork, so split the CPUs now
+        processes = args.workers if args.production else 1
+        filter_threads = max(1, min(MAX_AUTO_FILTER_THREADS, (os.cpu_count() or 1) // max(1, processes)))
+    if args.tiled:
+        tiled_inference = True
+    if args.tile_size is not None:
+        tile_size = args.tile_size
+    if args.tile_overlap is not None:
+        tile_overlap = args.tile_overlap
+    if args.tile_merge is not None:
+        tile_merge = args.tile_merge
+    if args.conf is not None:
+        detect_conf_threshold = args.conf
+    if args.max_det is not None:
+        detect_max_detections = args.max_det
+    if args.background_warmup:
+        background_warmup = True
+    if args.no_jobs:
+        jobs_enabled = False
+    if args.production and args.workers > 1 and jobs_enabled:
+        # Each worker would only know its own jobs, so polls routed elsewhere would 404
+        jobs_enabled = False
+        print("⚠️  /jobs disabled: jobs are kept per process, run with --workers 1 to use them")
+    
     print("=" * 60)
     print("Dental X-Ray Detection Server")
     print("=" * 60)
     print("\nInitializing components...")
     
-    if load_model():
-        print(f"✓ Model loaded from: {model_path}")
+    if background_warmup:
+        print("  Model and filter will load in the background (/health reports 'warming' until ready)")
     else:
-        print("⚠️  Model loading deferred (will try on first request)")
-    
-    if use_filter and load_filter():
-        print("✓ Contourlet filter enabled")
-    else:
-        print("⚠️  Running without Contourlet filter")
+        for name, spec in get_model_registry().specs().items():
+            if args.production and spec.backend == 'onnx':
+                print(f"  Model '{name}' will be loaded in each worker process")
+            elif load_model(name):
+                print(f"✓ Model '{name}' loaded from: {spec.path}")
+            else:
+                print(f"⚠️  Model '{name}' loading deferred (will try on first request)")
+        
+        if use_filter and load_filter():
+            print("✓ Contourlet filter enabled")
+        else:
+            print("⚠️  Running without Contourlet filter")
     
-    print(f"\nServer configuration:")
-    print(f"  Host: 0.0.0.0")
-    print(f"  Port: 5000")
+    print("\nServer configuration:")
+    print(f"  Host: {args.host}")
+    print(f"  Port: {args.port}")
+    print(f"  Mode: {'production' if args.production else 'development'}")
+    print(f"  Backend: {inference_backend}")
+    print(f"  Models: {', '.join(get_model_registry().names())}")
+    if model_watch_interval > 0:
+        print(f"  Model hot reload: checking files every {model_watch_interval:g} s")
     print(f"  Filter enabled: {use_filter}")
-    print(f"\nServer starting...")
+    print(f"  Background warm-up: {background_warmup}")
+    print(f"  Grayscale mode: {grayscale_mode}")
+    if preprocess_size_limit():
+        print(f"  Filter resolution: longer side <= {preprocess_size_limit()}px")
+    print(f"  Filter threads: {filter_threads}")
+    if tiled_inference:
+        print(f"  Tiled inference: {tile_size}px tiles, {tile_overlap:.0%} overlap, {tile_merge} merge")
+    print(f"  Max batch size: {batch_max_size}")
+    print(f"  Max batch wait: {batch_max_wait_ms} ms")
+    print(f"  Confidence threshold: {detect_conf_threshold}")
+    print(f"  Max detections: {detect_max_detections}")
+    print("\nServer starting...")
     print("=" * 60)
     print("\nAPI Endpoints:")
     print("  GET  /health  - Health check")
+    print("  GET  /metrics - Prometheus metrics")
     print("  POST /detect  - Run detection on uploaded image")
+    print("  POST /detect/batch - Run detection on a list of images")
+    if jobs_enabled:
+        print("  POST /jobs    - Queue a study; poll /jobs/<id> or stream /jobs/<id>/events")
+    print("  GET  /models  - Registered models (pick one per request with ?model=<name>)")
+    print("  POST /models/<name>/reload - Hot-swap a model (needs MODEL_ADMIN_TOKEN)")
     print("\n" + "=" * 60)
     
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    if args.production:
+        serve_production(args.host, args.port, args.workers, args.torch_threads)
+    else:
+        start_model_watcher()
+        if background_warmup:
+            start_warmup()
+        # The reloader would import this module (and load the model) a second time
+        app.run(host=args.host, port=args.port, debug=True, use_reloader=False, threaded=True)
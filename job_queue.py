@@ -0,0 +1,177 @@
+import threading
+import time
+import uuid
+from queue import Queue
+
+
+class QueueFull(Exception):
+    """Raised when a job would not fit in the bounded item queue"""
+
+
+class Job:
+    """
+    One submitted study: a list of items processed independently
+    
+    `results[i]` is None until item i finishes. `completion_order` lists item
+    indices in the order they finished, which is what event streams replay.
+    """
+    
+    def __init__(self, total):
+        self.id = uuid.uuid4().hex
+        self.total = total
+        self.results = [None] * total
+        self.completion_order = []
+        self.created_at = time.time()
+        self.finished_at = None
+        self.cancelled = False
+        self.condition = threading.Condition()
+    
+    @property
+    def completed(self):
+        return len(self.completion_order)
+    
+    @property
+    def status(self):
+        if self.cancelled:
+            return "cancelled"
+        if self.completed == self.total:
+            return "done"
+        return "running" if self.completed else "queued"
+    
+    def snapshot(self):
+        with self.condition:
+            return {
+                "job_id": self.id,
+                "status": self.status,
+                "total": self.total,
+                "completed": self.completed,
+                "results": list(self.results),
+            }
+    
+    def wait_for_results(self, since, timeout):
+        """
+        Block until more than `since` items have finished, the job ends, or `timeout`
+        
+        Returns:
+            (list of (sequence number, item index, result) finished after `since`, job ended)
+        """
+        with self.condition:
+            self.condition.wait_for(
+                lambda: self.completed > since or self.cancelled or self.completed == self.total,
+                timeout=timeout
+            )
+            new = [
+                (sequence, index, self.results[index])
+                for sequence, index in enumerate(self.completion_order[since:], start=since)
+            ]
+            return new, self.cancelled or self.completed == self.total
+
+
+class JobManager:
+    """
+    In-process asynchronous job runner with a bounded item queue
+    
+    Each submitted job's items go onto one shared FIFO queue consumed by
+    `num_workers` threads calling `process_item(item)`, which returns the
+    item's result (exceptions become {"error": ...}). At most
+    `max_queued_items` items may be waiting at once; submissions beyond that
+    raise QueueFull instead of growing memory without bound. Finished jobs
+    are forgotten `ttl_seconds` after they complete.
+    """
+    
+    def __init__(self, process_item, num_workers=4, max_queued_items=256, ttl_seconds=3600.0):
+        self.process_item = process_item
+        self.max_queued_items = max_queued_items
+        self.ttl_seconds = ttl_seconds
+        self._jobs = {}
+        self._lock = threading.Lock()
+        self._queued = 0
+        self._queue = Queue()
+        self._workers = [
+            threading.Thread(target=self._run, name=f"job-worker-{idx}", daemon=True)
+            for idx in range(max(1, num_workers))
+        ]
+        for worker in self._workers:
+            worker.start()
+    
+    def submit(self, items):
+        """Queue a job over `items`, returning the Job"""
+        items = list(items)
+        job = Job(len(items))
+        with self._lock:
+            self._expire_locked()
+            if self._queued + len(items) > self.max_queued_items:
+                raise QueueFull(
+                    f"{self._queued} items queued, {len(items)} more would exceed {self.max_queued_items}"
+                )
+            self._queued += len(items)
+            self._jobs[job.id] = job
+        for index, item in enumerate(items):
+            self._queue.put((job, index, item))
+        return job
+    
+    def get(self, job_id):
+        with self._lock:
+            return self._jobs.get(job_id)
+    
+    def cancel(self, job_id):
+        """Skip the job's remaining items; returns False for unknown jobs"""
+        job = self.get(job_id)
+        if job is None:
+            return False
+        with job.condition:
+            if job.completed == job.total:
+                return True
+            job.cancelled = True
+            job.finished_at = time.time()
+            job.condition.notify_all()
+        return True
+    
+    def queued_items(self):
+        with self._lock:
+            return self._queued
+    
+    def stats(self):
+        with self._lock:
+            jobs = list(self._jobs.values())
+            queued = self._queued
+        return {
+            "jobs": len(jobs),
+            "active_jobs": sum(1 for job in jobs if job.status in ("queued", "running")),
+            "queued_items": queued,
+            "max_queued_items": self.max_queued_items,
+            "workers": len(self._workers),
+        }
+    
+    def _expire_locked(self):
+        if not self.ttl_seconds:
+            return
+        cutoff = time.time() - self.ttl_seconds
+        expired = [
+            job_id for job_id, job in self._jobs.items()
+            if job.finished_at is not None and job.finished_at < cutoff
+        ]
+        for job_id in expired:
+            del self._jobs[job_id]
+    
+    def _run(self):
+        while True:
+            job, index, item = self._queue.get()
+            try:
+                if job.cancelled:
+                    continue
+                try:
+                    result = self.process_item(item)
+                except Exception as e:
+                    result = {"error": str(e)}
+                with job.condition:
+                    if job.cancelled:
+                        continue
+                    job.results[index] = result
+                    job.completion_order.append(index)
+                    if job.completed == job.total:
+                        job.finished_at = time.time()
+                    job.condition.notify_all()
+            finally:
+                with self._lock:
+                    self._queued -= 1
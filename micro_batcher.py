@@ -0,0 +1,73 @@
+import threading
+import time
+from concurrent.futures import Future
+from queue import Queue, Empty
+
+
+class MicroBatcher:
+    """
+    Coalesce concurrent single-item requests into batched calls
+    
+    Callers submit items from any thread and get a Future back. A background
+    thread takes the first pending item, keeps collecting until either
+    `max_batch_size` items are pending or `max_wait_ms` has passed since that
+    first item arrived, then calls `process_batch(items)` once for the whole
+    group. `process_batch` must return one result per item, in order.
+    """
+    
+    def __init__(self, process_batch, max_batch_size=8, max_wait_ms=10.0, name="micro-batcher"):
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = Queue()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+    
+    def submit(self, item):
+        """Queue one item, returning a Future for its result"""
+        future = Future()
+        self._queue.put((item, future))
+        return future
+    
+    def submit_many(self, items):
+        """Queue several items at once so they can share a batch"""
+        return [self.submit(item) for item in items]
+    
+    def pending(self):
+        """Approximate number of items waiting for a batch"""
+        return self._queue.qsize()
+    
+    def _collect(self):
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except Empty:
+                break
+        return batch
+    
+    def _run(self):
+        while True:
+            batch = self._collect()
+            batch = [(item, future) for item, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+            
+            try:
+                results = self.process_batch([item for item, _ in batch])
+                if len(results) != len(batch):
+                    raise RuntimeError(
+                        f"process_batch returned {len(results)} results for {len(batch)} items"
+                    )
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+            
+            for (_, future), result in zip(batch, results):
+                future.set_result(result)
@@ -0,0 +1,265 @@
+import os
+import threading
+import time
+from collections import namedtuple
+
+from filter_cache import sha256_bytes
+
+
+# What a registry name points at: a weights file and the backend that runs it
+ModelSpec = namedtuple('ModelSpec', ['path', 'backend'])
+
+
+def backend_for_path(path):
+    """ONNX files go to ONNX Runtime, everything else (.pt) to ultralytics"""
+    return 'onnx' if str(path).lower().endswith('.onnx') else 'ultralytics'
+
+
+def _file_signature(path):
+    try:
+        stat = os.stat(path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+class ModelVersion:
+    """
+    One loaded model: the backend object plus what identifies it
+    
+    Requests hold on to the version they started with, so a hot swap never
+    changes the model under an in-flight request; the old version is freed
+    once the last of them finishes.
+    """
+    
+    def __init__(self, name, spec, model, checksum, signature=None):
+        self.name = name
+        self.path = spec.path
+        self.backend = spec.backend
+        self.model = model
+        self.checksum = checksum
+        self.signature = signature
+        self.loaded_at = time.time()
+    
+    def info(self):
+        return {
+            "path": self.path,
+            "backend": self.backend,
+            "checksum": self.checksum[:12],
+            "loaded_at": self.loaded_at,
+        }
+
+
+class ModelRegistry:
+    """
+    Named models served side by side, swappable without a restart
+    
+    Models are registered by name with a weights path and backend and loaded
+    on first use. Every version, first load or reload, is warmed up before
+    requests can see it, so only the thread loading it ever touches a model
+    that is not yet initialized. `reload` loads a new version (another path, or the same
+    file after it was replaced) in a background thread, warms it up and only
+    then swaps it in, so requests are never served by a half-loaded model and
+    a failed load leaves the current version in place. With `watch`, every
+    process polls its models' files and reloads any that change, which rolls
+    a new model out to all workers of a multi-process server.
+    
+    Args:
+        load_fn: load_fn(spec) -> backend model object
+        warm_up_fn: Optional warm_up_fn(version), run on every new version before it is published
+        default_name: Model used by requests that don't pick one
+    """
+    
+    def __init__(self, load_fn, warm_up_fn=None, default_name='default'):
+        self.load_fn = load_fn
+        self.warm_up_fn = warm_up_fn
+        self.default_name = default_name
+        self._specs = {}
+        self._versions = {}
+        self._reloads = {}
+        self._load_locks = {}
+        self._lock = threading.Lock()
+        self._watcher = None
+    
+    def register(self, name, path, backend=None):
+        """Add (or repoint, for the next load) a model name; nothing is loaded yet"""
+        with self._lock:
+            self._specs[name] = ModelSpec(str(path), backend or backend_for_path(path))
+            self._load_locks.setdefault(name, threading.Lock())
+    
+    def names(self):
+        with self._lock:
+            return list(self._specs)
+    
+    def specs(self):
+        with self._lock:
+            return dict(self._specs)
+    
+    def is_loaded(self, name=None):
+        with self._lock:
+            return (name or self.default_name) in self._versions
+    
+    def _spec(self, name):
+        with self._lock:
+            if name not in self._specs:
+                raise KeyError(f"Unknown model {name!r}; available: {', '.join(self._specs)}")
+            return self._specs[name]
+    
+    def _load_version(self, name, spec):
+        signature = _file_signature(spec.path)
+        model = self.load_fn(spec)
+        with open(spec.path, 'rb') as f:
+            checksum = sha256_bytes(f.read())
+        return ModelVersion(name, spec, model, checksum, signature)
+    
+    def get(self, name=None):
+        """
+        Current version of a model, loading and warming it up on first use
+        
+        Concurrent callers wait for the warm-up to finish. A failed warm-up is
+        reported but the model is still served (the next request retries the
+        lazy initialization). Raises KeyError for unknown names and the load
+        error if it fails.
+        """
+        name = name or self.default_name
+        with self._lock:
+            version = self._versions.get(name)
+        if version is not None:
+            return version
+        
+        spec = self._spec(name)
+        # Concurrent first requests wait for one load instead of each loading a copy
+        with self._load_locks[name]:
+            with self._lock:
+                version = self._versions.get(name)
+            if version is None:
+                version = self._load_version(name, spec)
+                if self.warm_up_fn is not None:
+                    try:
+                        self.warm_up_fn(version)
+                    except Exception as e:
+                        print(f"⚠️  Warm-up of model '{name}' failed: {e}")
+                with self._lock:
+                    self._versions[name] = version
+                print(f"✓ Model '{name}' loaded successfully ({spec.backend} backend)")
+        return version
+    
+    def reload(self, name, path=None, backend=None, wait=False):
+        """
+        Load a new version of `name` in the background and swap it in when warm
+        
+        Args:
+            name: Model to reload; a new name is registered if `path` is given
+            path: New weights file (default: the current one, e.g. after it was replaced)
+            backend: Backend for `path` (default: from its extension)
+            wait: Block until the swap (or failure) instead of returning at once
+        
+        Returns:
+            The reload thread
+        """
+        with self._lock:
+            if name not in self._specs and path is None:
+                raise KeyError(f"Unknown model {name!r}; available: {', '.join(self._specs)}")
+            current = self._specs.get(name)
+            spec = ModelSpec(
+                str(path) if path is not None else current.path,
+                backend or (backend_for_path(path) if path is not None else current.backend)
+            )
+            running = self._reloads.get(name)
+            if running is not None and running['state'] == 'loading':
+                raise RuntimeError(f"A reload of {name!r} is already in progress")
+            self._load_locks.setdefault(name, threading.Lock())
+            self._reloads[name] = {"state": "loading", "path": spec.path, "started_at": time.time()}
+        
+        thread = threading.Thread(target=self._reload, args=(name, spec), name=f"reload-{name}", daemon=True)
+        thread.start()
+        if wait:
+            thread.join()
+        return thread
+    
+    def _reload(self, name, spec):
+        start = time.perf_counter()
+        try:
+            version = self._load_version(name, spec)
+            if self.warm_up_fn is not None:
+                self.warm_up_fn(version)
+        except Exception as e:
+            with self._lock:
+                self._reloads[name].update(state="failed", error=str(e))
+            print(f"✗ Reload of model '{name}' from {spec.path} failed, keeping the current version: {e}")
+            return
+        
+        with self._lock:
+            previous = self._versions.get(name)
+            self._specs[name] = spec
+            self._versions[name] = version
+            self._reloads[name].update(state="done", finished_at=time.time())
+        replaced = f" (replacing {previous.checksum[:12]})" if previous is not None else ""
+        print(f"✓ Model '{name}' now serving {spec.path} [{version.checksum[:12]}]{replaced} "
+              f"after {time.perf_counter() - start:.1f} s")
+    
+    def check_for_updates(self):
+        """Start a reload for every loaded model whose weights file changed on disk"""
+        with self._lock:
+            versions = list(self._versions.values())
+            busy = {name for name, reload in self._reloads.items() if reload['state'] == 'loading'}
+            specs = dict(self._specs)
+        started = []
+        for version in versions:
+            spec = specs.get(version.name)
+            if spec is None or version.name in busy or spec.path != version.path:
+                continue
+            signature = _file_signature(spec.path)
+            if signature is not None and signature != version.signature:
+                try:
+                    self.reload(version.name)
+                    started.append(version.name)
+                except RuntimeError:
+                    pass
+        return started
+    
+    def watch(self, interval=10.0):
+        """Poll model files every `interval` seconds in a daemon thread (once per process)"""
+        with self._lock:
+            if self._watcher is not None:
+                return self._watcher
+            
+            def run():
+                while True:
+                    time.sleep(interval)
+                    try:
+                        self.check_for_updates()
+                    except Exception as e:
+                        print(f"⚠️  Model watcher error: {e}")
+            
+            self._watcher = threading.Thread(target=run, name="model-watcher", daemon=True)
+            self._watcher.start()
+            return self._watcher
+    
+    def reload_status(self, name):
+        """State of the last reload of `name` ('loading', 'done' or 'failed'), or None"""
+        with self._lock:
+            reload = self._reloads.get(name)
+            return dict(reload) if reload is not None else None
+    
+    def status(self):
+        """{name: spec, loaded version and last reload} for /models and /health"""
+        with self._lock:
+            specs = dict(self._specs)
+            versions = dict(self._versions)
+            reloads = {name: dict(reload) for name, reload in self._reloads.items()}
+        status = {}
+        for name, spec in specs.items():
+            version = versions.get(name)
+            entry = {
+                "path": spec.path,
+                "backend": spec.backend,
+                "default": name == self.default_name,
+                "loaded": version is not None,
+            }
+            if version is not None:
+                entry["version"] = version.info()
+            if name in reloads:
+                entry["reload"] = reloads[name]
+            status[name] = entry
+        return status
@@ -0,0 +1,166 @@
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+
+# Backend-neutral detections for one image, in original image pixel coordinates
+BoxArrays = namedtuple('BoxArrays', ['xyxy', 'conf', 'cls'])
+
+LETTERBOX_COLOR = (114, 114, 114)
+# Per-class NMS is done in one pass by offsetting each class by this much
+MAX_WH = 7680
+
+
+def letterbox(image, new_shape=640):
+    """
+    Resize keeping aspect ratio and pad to `new_shape`, like ultralytics' LetterBox
+    
+    Returns:
+        (padded image, gain, (pad_x, pad_y))
+    """
+    if isinstance(new_shape, int):
+        new_shape = (new_shape, new_shape)
+    height, width = image.shape[:2]
+    gain = min(new_shape[0] / height, new_shape[1] / width)
+    new_width, new_height = int(round(width * gain)), int(round(height * gain))
+    pad_x = (new_shape[1] - new_width) / 2
+    pad_y = (new_shape[0] - new_height) / 2
+    
+    if (width, height) != (new_width, new_height):
+        image = cv2.resize(image, (new_width, new_height), interpolation=cv2.INTER_LINEAR)
+    
+    top, bottom = int(round(pad_y - 0.1)), int(round(pad_y + 0.1))
+    left, right = int(round(pad_x - 0.1)), int(round(pad_x + 0.1))
+    image = cv2.copyMakeBorder(image, top, bottom, left, right, cv2.BORDER_CONSTANT, value=LETTERBOX_COLOR)
+    return image, gain, (left, top)
+
+
+def prepare_input(image, imgsz=640, channels=3):
+    """
+    BGR or grayscale uint8 image -> model input
+    
+    Grayscale images are letterboxed and scaled as one channel and only
+    expanded to `channels` at the end, so a 1-channel model gets them as-is.
+    
+    Returns:
+        (1xCxHxW float32 blob scaled to 0-1 (RGB when C is 3), gain, (pad_x, pad_y))
+    """
+    if image.ndim == 3 and channels == 1:
+        image = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+    padded, gain, pad = letterbox(image, imgsz)
+    if padded.ndim == 2:
+        blob = cv2.dnn.blobFromImage(padded, scalefactor=1 / 255.0)
+        if channels != 1:
+            blob = np.repeat(blob, channels, axis=1)
+    else:
+        blob = cv2.dnn.blobFromImage(padded, scalefactor=1 / 255.0, swapRB=True)
+    return blob, gain, pad
+
+
+def non_max_suppression(predictions, conf_threshold=0.25, iou_threshold=0.7, max_det=300):
+    """
+    Per-class NMS over raw YOLOv8 output for one image
+    
+    Args:
+        predictions: (4 + num_classes, num_anchors) array of cx, cy, w, h, class scores
+    
+    Returns:
+        BoxArrays in input (letterboxed) pixel coordinates
+    """
+    scores = predictions[4:]
+    cls = scores.argmax(axis=0)
+    conf = scores[cls, np.arange(scores.shape[1])]
+    keep = conf > conf_threshold
+    if not keep.any():
+        return BoxArrays(np.zeros((0, 4), np.float32), np.zeros(0, np.float32), np.zeros(0, np.int64))
+    
+    boxes = predictions[:4, keep].T
+    conf = conf[keep]
+    cls = cls[keep]
+    
+    xyxy = np.empty_like(boxes)
+    xyxy[:, 0] = boxes[:, 0] - boxes[:, 2] / 2
+    xyxy[:, 1] = boxes[:, 1] - boxes[:, 3] / 2
+    xyxy[:, 2] = boxes[:, 0] + boxes[:, 2] / 2
+    xyxy[:, 3] = boxes[:, 1] + boxes[:, 3] / 2
+    
+    # cv2.dnn.NMSBoxes takes x, y, w, h; offset classes so they never overlap
+    offset = cls[:, None].astype(np.float32) * MAX_WH
+    nms_boxes = np.concatenate([xyxy[:, :2] + offset, boxes[:, 2:]], axis=1)
+    indices = cv2.dnn.NMSBoxes(nms_boxes.tolist(), conf.tolist(), conf_threshold, iou_threshold)
+    indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+    indices = indices[np.argsort(-conf[indices], kind='stable')][:max_det]
+    
+    return BoxArrays(xyxy[indices], conf[indices], cls[indices])
+
+
+class OnnxDetector:
+    """
+    YOLOv8 detector served through ONNX Runtime
+    
+    Runs the model exported by train_yolo.py (`best.onnx`) with letterbox
+    preprocessing and NMS done here, so neither torch nor ultralytics is needed.
+    Static-batch exports are run one image at a time; dynamic-batch exports
+    get the whole batch in one call.
+    """
+    
+    def __init__(self, model_path, imgsz=640, conf_threshold=0.25, iou_threshold=0.7,
+                 max_det=300, num_threads=None, providers=None):
+        import onnxruntime as ort
+        
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if num_threads:
+            options.intra_op_num_threads = num_threads
+            options.inter_op_num_threads = 1
+        self.session = ort.InferenceSession(
+            str(model_path), sess_options=options, providers=providers or ['CPUExecutionProvider']
+        )
+        
+        model_input = self.session.get_inputs()[0]
+        self.input_name = model_input.name
+        input_shape = model_input.shape
+        self.dynamic_batch = not isinstance(input_shape[0], int)
+        self.channels = input_shape[1] if isinstance(input_shape[1], int) else 3
+        if isinstance(input_shape[2], int) and isinstance(input_shape[3], int):
+            self.imgsz = (input_shape[2], input_shape[3])
+        else:
+            self.imgsz = (imgsz, imgsz)
+        
+        self.conf_threshold = conf_threshold
+        self.iou_threshold = iou_threshold
+        self.max_det = max_det
+    
+    def preprocess(self, image):
+        """BGR or grayscale uint8 image -> (1xCxHxW float32 tensor, gain, pad)"""
+        return prepare_input(image, self.imgsz, self.channels)
+    
+    def postprocess(self, predictions, gain, pad, image_shape):
+        """Raw output for one image -> BoxArrays in original image coordinates"""
+        detections = non_max_suppression(
+            predictions, self.conf_threshold, self.iou_threshold, self.max_det
+        )
+        xyxy = detections.xyxy
+        xyxy[:, [0, 2]] -= pad[0]
+        xyxy[:, [1, 3]] -= pad[1]
+        xyxy /= gain
+        xyxy[:, [0, 2]] = xyxy[:, [0, 2]].clip(0, image_shape[1])
+        xyxy[:, [1, 3]] = xyxy[:, [1, 3]].clip(0, image_shape[0])
+        return detections
+    
+    def __call__(self, images):
+        """Detect on a list of BGR images, returning one BoxArrays per image"""
+        prepared = [self.preprocess(image) for image in images]
+        
+        if self.dynamic_batch and len(prepared) > 1:
+            batch = np.concatenate([blob for blob, _, _ in prepared], axis=0)
+            outputs = [self.session.run(None, {self.input_name: batch})[0]]
+        else:
+            outputs = [self.session.run(None, {self.input_name: blob})[0] for blob, _, _ in prepared]
+        predictions = np.concatenate(outputs, axis=0)
+        
+        return [
+            self.postprocess(predictions[idx], gain, pad, image.shape)
+            for idx, ((_, gain, pad), image) in enumerate(zip(prepared, images))
+        ]
@@ -1,27 +1,212 @@
 import os
 import cv2
 import numpy as np
+import json
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
-from contourlet_filter import ContourletTransform
+from contourlet_filter import CONTOURLET_VERSION, ContourletTransform
+from filter_cache import DEFAULT_MAX_BYTES, FilteredImageCache, atomic_write_bytes, decode_source, sha256_bytes
 import shutil
 
 
+MANIFEST_NAME = ".contourlet_manifest.json"
+# One small JSON file per written image, made durable before the image itself
+# is replaced and folded into the manifest on the next save, so a killed run
+# never leaves a filtered-in-place image without a record
+JOURNAL_DIR_NAME = ".contourlet_journal"
+
+# Manifest entries written before the kernel sigmas and the filter code version
+# were recorded were produced with these
+LEGACY_PARAM_DEFAULTS = {"sigma_x": 3.0, "sigma_y": 1.0, "version": "1"}
+
+# Per-worker-process filter instance, cache and journal, created once by _init_worker
+_worker_filter = None
+_worker_cache = None
+_worker_params = None
+_worker_journal_dir = None
+
+
+def load_manifest(manifest_path):
+    """Load a preprocessing manifest, returning an empty one if missing or unreadable"""
+    try:
+        with open(manifest_path, "r") as f:
+            manifest = json.load(f)
+        if isinstance(manifest.get("files"), dict):
+            return manifest
+    except (OSError, ValueError):
+        pass
+    return {"files": {}}
+
+
+def save_manifest(manifest_path, manifest):
+    """Atomically write a preprocessing manifest"""
+    atomic_write_bytes(manifest_path, json.dumps(manifest, indent=2, sort_keys=True).encode("utf-8"))
+
+
+def manifest_params(filter_params):
+    """Filter parameters as recorded in the manifest, tagged with the filter code version"""
+    return {**filter_params, "version": CONTOURLET_VERSION}
+
+
+def _entry_params(entry):
+    return {**LEGACY_PARAM_DEFAULTS, **entry.get("params", {})}
+
+
+def write_journal_entry(journal_dir, name, entry):
+    """Durably record the manifest entry of an output that is about to be written"""
+    journal_dir = Path(journal_dir)
+    journal_dir.mkdir(exist_ok=True)
+    atomic_write_bytes(journal_dir / f"{name}.json", json.dumps(entry, sort_keys=True).encode("utf-8"))
+
+
+def merge_journal(manifest, journal_dir):
+    """
+    Fold journal entries into the manifest
+    
+    Returns:
+        The journal files merged, to delete once the manifest is saved
+    """
+    merged = []
+    journal_dir = Path(journal_dir)
+    if not journal_dir.is_dir():
+        return merged
+    for journal_file in sorted(journal_dir.glob("*.json")):
+        try:
+            entry = json.loads(journal_file.read_text())
+        except (OSError, ValueError):
+            # Torn writes can't happen (atomic_write_bytes), so this is foreign; leave it
+            continue
+        manifest["files"][journal_file.name[:-len(".json")]] = entry
+        merged.append(journal_file)
+    return merged
+
+
+def save_manifest_with_journal(manifest_path, manifest, journal_dir):
+    """Merge the journal into the manifest, save it, then drop the merged journal files"""
+    merged = merge_journal(manifest, journal_dir)
+    save_manifest(manifest_path, manifest)
+    for journal_file in merged:
+        journal_file.unlink(missing_ok=True)
+
+
+def _init_worker(filter_params, cache_dir=None, cache_max_bytes=None, filter_threads=1, journal_dir=None):
+    global _worker_filter, _worker_cache, _worker_params, _worker_journal_dir
+    # filter_threads doesn't change the output, so it stays out of filter_params (the manifest)
+    _worker_filter = ContourletTransform(**filter_params, max_threads=filter_threads)
+    _worker_params = manifest_params(filter_params)
+    _worker_journal_dir = journal_dir
+    if cache_dir:
+        _worker_cache = FilteredImageCache(cache_dir, max_bytes=cache_max_bytes)
+    else:
+        _worker_cache = None
+
+
+def _process_image_file(task):
+    """
+    Filter one image and atomically write the result
+    
+    The image's manifest entry goes to the journal first: if the process dies
+    before the output is replaced, the entry's output hash doesn't match the
+    file and the image is simply processed again.
+    
+    Returns:
+        (name, input_sha256, output_sha256, error)
+    """
+    input_file, output_file = task
+    name = Path(input_file).name
+    try:
+        data = Path(input_file).read_bytes()
+        input_hash = sha256_bytes(data)
+        
+        if _worker_cache is None:
+            try:
+                image = decode_source(data, _worker_filter)
+            except ValueError:
+                return name, input_hash, None, "Failed to read"
+            filtered = _worker_filter.apply(image)
+        else:
+            filtered, _ = _worker_cache.get_or_apply(data, _worker_filter, source_hash=input_hash)
+        
+        ok, encoded = cv2.imencode(Path(output_file).suffix, filtered)
+        if not ok:
+            return name, input_hash, None, "Failed to encode"
+        encoded = encoded.tobytes()
+        output_hash = sha256_bytes(encoded)
+        
+        if _worker_journal_dir is not None:
+            write_journal_entry(_worker_journal_dir, name, {
+                "input_sha256": input_hash,
+                "output_sha256": output_hash,
+                "params": _worker_params
+            })
+        atomic_write_bytes(output_file, encoded)
+        return name, input_hash, output_hash, None
+    except Exception as e:
+        return name, None, None, str(e)
+
+
+def _is_up_to_date(entry, filter_params, input_file, output_file, in_place):
+    """Check a manifest entry against the files currently on disk"""
+    if not entry or _entry_params(entry) != manifest_params(filter_params):
+        return False
+    if not output_file.exists():
+        return False
+    if sha256_bytes(output_file.read_bytes()) != entry.get("output_sha256"):
+        return False
+    if in_place:
+        # The source has been replaced by the output, which we just verified
+        return True
+    return sha256_bytes(input_file.read_bytes()) == entry.get("input_sha256")
+
+
 def preprocess_images_with_contourlet(
     input_dir="dataset/images",
     output_dir="dataset/images_contourlet",
     num_levels=2,
     num_directions=8,
-    use_original=False
+    use_original=False,
+    filter_mode="auto",
+    kernel_size=15,
+    sigma_x=3.0,
+    sigma_y=1.0,
+    workers=1,
+    chunk_size=8,
+    force=False,
+    cache_dir=None,
+    cache_max_bytes=None,
+    grayscale=False
 ):
     """
     Apply Contourlet transform to all images in a directory
     
+    Progress is recorded in a manifest in the output directory (input hash,
+    output hash and filter parameters, including the filter code version, per
+    file) so an interrupted or repeated run skips files that are already
+    filtered with the same parameters. Every output file is written
+    atomically, and its entry is journaled before the write, so even a run
+    killed mid-way never filters an in-place image twice.
+    
     Args:
         input_dir: Directory containing original images
         output_dir: Directory to save filtered images
         num_levels: Number of pyramid levels for Contourlet
         num_directions: Number of directional filters
         use_original: If True, keep original; if False, replace with filtered
+        filter_mode: Directional filter engine: 'auto', 'spatial' or 'fft'
+        kernel_size: Size of the directional kernels
+        sigma_x, sigma_y: Gaussian envelope of the directional kernels
+        workers: Number of worker processes (1 = in-process, 0 = one per CPU). A
+            single in-process worker runs each image's directional filters on one
+            thread per CPU instead; pool workers filter serially, as the pool
+            already keeps every core busy
+        chunk_size: Number of images handed to a worker at a time
+        force: Reprocess every image, ignoring the manifest
+        cache_dir: Optional FilteredImageCache directory; filtered results are
+            looked up there before filtering and stored after, so parameter
+            sweeps only compute each (image, parameters) pair once
+        cache_max_bytes: Size budget of the filtered-image cache
+        grayscale: Decode and write single-channel images (a third of the size;
+            ultralytics expands them to 3 identical channels when loading)
     
     Returns:
         Dictionary with processing statistics
@@ -37,61 +222,116 @@ def preprocess_images_with_contourlet(
     if not input_path.exists():
         raise ValueError(f"Input directory does not exist: {input_dir}")
     
-    ct = ContourletTransform(num_levels=num_levels, num_directions=num_directions)
+    in_place = output_path.resolve() == input_path.resolve()
+    
+    filter_params = {
+        "num_levels": num_levels,
+        "num_directions": num_directions,
+        "kernel_size": kernel_size,
+        "sigma_x": float(sigma_x),
+        "sigma_y": float(sigma_y),
+        "filter_mode": filter_mode
+    }
+    if grayscale:
+        # Only present when set, so existing manifests stay valid
+        filter_params["grayscale"] = True
+    if cache_max_bytes is None:
+        cache_max_bytes = DEFAULT_MAX_BYTES
     
-    image_files = list(input_path.glob("*.jpg")) + list(input_path.glob("*.png")) + \
-                  list(input_path.glob("*.JPG")) + list(input_path.glob("*.PNG"))
+    image_files = sorted(set(
+        list(input_path.glob("*.jpg")) + list(input_path.glob("*.png")) +
+        list(input_path.glob("*.JPG")) + list(input_path.glob("*.PNG"))
+    ))
     
-    processed_count = 0
-    failed_count = 0
     stats = {
         'processed': 0,
+        'skipped': 0,
         'failed': 0,
         'failed_files': []
     }
     
-    print(f"Found {len(image_files)} images to process")
-    print(f"Processing with Contourlet Transform (levels={num_levels}, directions={num_directions})")
+    manifest_path = output_path / MANIFEST_NAME
+    journal_dir = output_path / JOURNAL_DIR_NAME
+    manifest = {"files": {}} if force else load_manifest(manifest_path)
+    # Entries of images written by a run that was killed before saving the manifest
+    save_manifest_with_journal(manifest_path, manifest, journal_dir)
+    params = manifest_params(filter_params)
+    
+    tasks = []
+    refiltered = 0
+    for image_file in image_files:
+        output_file = output_path / image_file.name
+        entry = manifest["files"].get(image_file.name)
+        if not force and _is_up_to_date(entry, filter_params, image_file, output_file, in_place):
+            stats['skipped'] += 1
+            continue
+        if in_place and entry and _entry_params(entry) != params:
+            refiltered += 1
+        tasks.append((str(image_file), str(output_file)))
+    
+    if workers == 0:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(tasks) or 1))
+    
+    print(f"Found {len(image_files)} images ({stats['skipped']} already up to date, {len(tasks)} to process)")
+    if refiltered:
+        print(f"⚠️  {refiltered} images were already filtered in place with different parameters "
+              f"and will be filtered again (restore from backup for a clean run)")
+    print(f"Processing with Contourlet Transform (levels={num_levels}, directions={num_directions}, "
+          f"kernel={kernel_size}, mode={filter_mode})")
     print(f"Output directory: {output_path}")
+    print(f"Workers: {workers}")
+    if cache_dir:
+        print(f"Filtered-image cache: {cache_dir}")
     
-    for idx, image_file in enumerate(image_files, 1):
-        try:
-            image = cv2.imread(str(image_file))
-            
-            if image is None:
-                print(f"  [{idx}/{len(image_files)}] ✗ Failed to read: {image_file.name}")
-                failed_count += 1
-                stats['failed_files'].append(str(image_file.name))
+    if workers == 1:
+        _init_worker(filter_params, cache_dir, cache_max_bytes, os.cpu_count() or 1, str(journal_dir))
+        results = map(_process_image_file, tasks)
+        executor = None
+    else:
+        executor = ProcessPoolExecutor(
+            max_workers=workers,
+            initializer=_init_worker,
+            initargs=(filter_params, cache_dir, cache_max_bytes, 1, str(journal_dir))
+        )
+        results = executor.map(_process_image_file, tasks, chunksize=max(1, chunk_size))
+    
+    try:
+        for idx, (name, input_hash, output_hash, error) in enumerate(results, 1):
+            if error is not None:
+                print(f"  [{idx}/{len(tasks)}] ✗ Error processing {name}: {error}")
+                stats['failed'] += 1
+                stats['failed_files'].append(name)
                 continue
             
-            filtered = ct.apply(image)
-            
-            output_file = output_path / image_file.name
-            cv2.imwrite(str(output_file), filtered)
-            
-            if (idx) % 10 == 0:
-                print(f"  [{idx}/{len(image_files)}] ✓ Processed: {image_file.name}")
+            manifest["files"][name] = {
+                "input_sha256": input_hash,
+                "output_sha256": output_hash,
+                "params": params
+            }
+            stats['processed'] += 1
             
-            processed_count += 1
-            
-        except Exception as e:
-            print(f"  [{idx}/{len(image_files)}] ✗ Error processing {image_file.name}: {str(e)}")
-            failed_count += 1
-            stats['failed_files'].append(str(image_file.name))
+            if idx % 10 == 0:
+                print(f"  [{idx}/{len(tasks)}] ✓ Processed: {name}")
+            if idx % max(1, chunk_size) == 0:
+                save_manifest_with_journal(manifest_path, manifest, journal_dir)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+        # After the shutdown, so images written but not yet reported are recorded too
+        save_manifest_with_journal(manifest_path, manifest, journal_dir)
     
     print(f"\n{'='*60}")
-    print(f"Processing complete!")
-    print(f"Successfully processed: {processed_count}/{len(image_files)}")
-    print(f"Failed: {failed_count}/{len(image_files)}")
+    print("Processing complete!")
+    print(f"Successfully processed: {stats['processed']}/{len(tasks)}")
+    print(f"Skipped (up to date): {stats['skipped']}")
+    print(f"Failed: {stats['failed']}/{len(tasks)}")
     
     if stats['failed_files']:
-        print(f"\nFailed files:")
+        print("\nFailed files:")
         for f in stats['failed_files']:
             print(f"  - {f}")
     
-    stats['processed'] = processed_count
-    stats['failed'] = failed_count
-    
     return stats
 
 
@@ -106,12 +346,12 @@ def backup_original_dataset(original_dir="dataset/images", backup_dir="dataset/i
         print(f"Backup already exists at {backup_dir}")
         return False
     
-    print(f"Creating backup of original images...")
+    print("Creating backup of original images...")
     backup_path.mkdir(parents=True, exist_ok=True)
     
     image_files = list(original_path.glob("*.*"))
     for image_file in image_files:
-        if image_file.is_file():
+        if image_file.is_file() and image_file.name != MANIFEST_NAME:
             shutil.copy2(image_file, backup_path / image_file.name)
     
     print(f"Backup created at {backup_dir}")
@@ -146,6 +386,51 @@ def main():
         default=8,
         help="Number of directional filters (default: 8)"
     )
+    parser.add_argument(
+        "--kernel-size",
+        type=int,
+        default=15,
+        help="Size of the directional kernels (default: 15)"
+    )
+    parser.add_argument(
+        "--filter-mode",
+        choices=["auto", "spatial", "fft"],
+        default="auto",
+        help="Directional filter engine: spatial convolution, FFT, or auto by image size (default: auto)"
+    )
+    parser.add_argument(
+        "--grayscale",
+        action="store_true",
+        help="Decode, filter and write single-channel images"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=1,
+        help="Number of worker processes, 0 for one per CPU (default: 1)"
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=8,
+        help="Images handed to a worker at a time (default: 8)"
+    )
+    parser.add_argument(
+        "--force",
+        action="store_true",
+        help="Reprocess all images even if the manifest says they are up to date"
+    )
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="Reuse/store filtered images in this content-addressed cache directory"
+    )
+    parser.add_argument(
+        "--cache-max-gb",
+        type=float,
+        default=2.0,
+        help="Size budget of the filtered-image cache in GB (default: 2)"
+    )
     parser.add_argument(
         "--no-replace",
         action="store_true",
@@ -161,7 +446,15 @@ def main():
         input_dir=args.input_dir,
         num_levels=args.levels,
         num_directions=args.directions,
-        use_original=args.no_replace
+        use_original=args.no_replace,
+        filter_mode=args.filter_mode,
+        kernel_size=args.kernel_size,
+        workers=args.workers,
+        chunk_size=args.chunk_size,
+        force=args.force,
+        cache_dir=args.cache_dir,
+        cache_max_bytes=int(args.cache_max_gb * 1024 ** 3),
+        grayscale=args.grayscale
     )
     
     if stats['processed'] > 0:
@@ -0,0 +1,402 @@
+import argparse
+import json
+import random
+import re
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+from dataset_paths import list_images, load_data_config
+from onnx_backend import OnnxDetector, prepare_input
+
+
+DEFAULT_CALIBRATION_FILE = 'calibration_image_sample_data_20x128x128x3_float32.npy'
+# Ops in the Detect head that decode boxes; quantizing them costs most of the accuracy
+HEAD_FLOAT_OPS = {'Concat', 'Split', 'Sigmoid', 'Softmax', 'Reshape', 'Transpose',
+                  'Mul', 'Add', 'Sub', 'Div', 'Slice', 'Shape', 'Gather', 'Unsqueeze'}
+
+
+def export_fp32_onnx(weights, imgsz=640):
+    """Export a trained .pt checkpoint to a static-shape FP32 ONNX model"""
+    from ultralytics import YOLO
+    
+    exported = YOLO(weights).export(format='onnx', imgsz=imgsz, dynamic=False, simplify=True)
+    return str(exported)
+
+
+def load_calibration_blobs(source, imgsz=640, num_images=100, apply_filter=False,
+                           num_levels=2, num_directions=8, seed=0):
+    """
+    Build model-input blobs for calibration
+    
+    Args:
+        source: The bundled NHWC float32 .npy sample (RGB, 0-1) or an image directory
+        imgsz: Model input size
+        num_images: Number of images to sample from a directory
+        apply_filter: Apply the Contourlet transform to directory images first
+            (use when the directory holds unfiltered images)
+        num_levels, num_directions: Contourlet parameters for apply_filter
+        seed: Sampling seed
+    
+    Returns:
+        List of 1x3xHxW float32 blobs
+    """
+    source = Path(source)
+    if source.suffix == '.npy':
+        samples = np.load(source)
+        blobs = []
+        for sample in samples:
+            bgr = cv2.cvtColor(np.clip(sample * 255.0, 0, 255).astype(np.uint8), cv2.COLOR_RGB2BGR)
+            blobs.append(prepare_input(bgr, imgsz)[0])
+        return blobs
+    
+    image_files = list_images(source)
+    random.Random(seed).shuffle(image_files)
+    image_files = image_files[:num_images]
+    
+    transform = None
+    if apply_filter:
+        from contourlet_filter import ContourletTransform
+        transform = ContourletTransform(num_levels=num_levels, num_directions=num_directions)
+    
+    blobs = []
+    for image_file in image_files:
+        image = cv2.imread(str(image_file))
+        if image is None:
+            continue
+        if transform is not None:
+            image = transform.apply(image)
+        blobs.append(prepare_input(image, imgsz)[0])
+    return blobs
+
+
+class BlobCalibrationReader:
+    """onnxruntime CalibrationDataReader over a list of precomputed blobs"""
+    
+    def __init__(self, input_name, blobs):
+        self.input_name = input_name
+        self._iter = iter(blobs)
+    
+    def get_next(self):
+        blob = next(self._iter, None)
+        return None if blob is None else {self.input_name: blob}
+    
+    def rewind(self):
+        pass
+
+
+def detect_head_nodes(model_path):
+    """Names of box-decoding nodes in the last (Detect) module, kept in float"""
+    import onnx
+    
+    graph = onnx.load(str(model_path)).graph
+    module_ids = [int(m.group(1)) for m in (re.match(r'/model\.(\d+)/', n.name) for n in graph.node) if m]
+    if not module_ids:
+        return []
+    head_prefix = f'/model.{max(module_ids)}/'
+    return [n.name for n in graph.node if n.name.startswith(head_prefix) and n.op_type in HEAD_FLOAT_OPS]
+
+
+def quantize_int8(fp32_model, int8_model, blobs, per_channel=True, keep_head_float=True):
+    """Static (calibrated) INT8 quantization of an ONNX model in QDQ format"""
+    import onnxruntime as ort
+    from onnxruntime.quantization import CalibrationMethod, QuantFormat, QuantType, quantize_static
+    from onnxruntime.quantization.shape_inference import quant_pre_process
+    
+    preprocessed = str(Path(int8_model).with_suffix('.prep.onnx'))
+    try:
+        quant_pre_process(str(fp32_model), preprocessed)
+    except ImportError:
+        # Symbolic shape inference needs sympy; ONNX shape inference is enough for YOLO
+        quant_pre_process(str(fp32_model), preprocessed, skip_symbolic_shape=True)
+    
+    input_name = ort.InferenceSession(preprocessed, providers=['CPUExecutionProvider']).get_inputs()[0].name
+    excluded = detect_head_nodes(preprocessed) if keep_head_float else []
+    
+    quantize_static(
+        preprocessed,
+        str(int8_model),
+        BlobCalibrationReader(input_name, blobs),
+        quant_format=QuantFormat.QDQ,
+        activation_type=QuantType.QUInt8,
+        weight_type=QuantType.QInt8,
+        per_channel=per_channel,
+        calibrate_method=CalibrationMethod.MinMax,
+        nodes_to_exclude=excluded
+    )
+    Path(preprocessed).unlink(missing_ok=True)
+    return excluded
+
+
+def load_ground_truth(label_file, image_shape):
+    """YOLO txt labels -> (classes, pixel xyxy boxes)"""
+    height, width = image_shape[:2]
+    if not Path(label_file).exists():
+        return np.zeros(0, np.int64), np.zeros((0, 4), np.float32)
+    rows = np.loadtxt(label_file, ndmin=2, dtype=np.float32)
+    if rows.size == 0:
+        return np.zeros(0, np.int64), np.zeros((0, 4), np.float32)
+    cx, cy, w, h = rows[:, 1] * width, rows[:, 2] * height, rows[:, 3] * width, rows[:, 4] * height
+    boxes = np.stack([cx - w / 2, cy - h / 2, cx + w / 2, cy + h / 2], axis=1)
+    return rows[:, 0].astype(np.int64), boxes
+
+
+def box_iou(box, boxes):
+    x1 = np.maximum(box[0], boxes[:, 0])
+    y1 = np.maximum(box[1], boxes[:, 1])
+    x2 = np.minimum(box[2], boxes[:, 2])
+    y2 = np.minimum(box[3], boxes[:, 3])
+    intersection = np.clip(x2 - x1, 0, None) * np.clip(y2 - y1, 0, None)
+    area = (box[2] - box[0]) * (box[3] - box[1])
+    areas = (boxes[:, 2] - boxes[:, 0]) * (boxes[:, 3] - boxes[:, 1])
+    return intersection / (area + areas - intersection + 1e-9)
+
+
+def average_precision(recall, precision):
+    """101-point interpolated AP (COCO style)"""
+    recall = np.concatenate([[0.0], recall, [1.0]])
+    precision = np.concatenate([[1.0], precision, [0.0]])
+    precision = np.flip(np.maximum.accumulate(np.flip(precision)))
+    points = np.linspace(0, 1, 101)
+    values = np.interp(points, recall, precision)
+    return float(np.sum((values[1:] + values[:-1]) / 2 * np.diff(points)))
+
+
+def map50(records, num_gt_per_class):
+    """mAP@0.5 from (class, confidence, is_true_positive) records"""
+    aps = {}
+    for cls, num_gt in num_gt_per_class.items():
+        if num_gt == 0:
+            continue
+        cls_records = sorted((r for r in records if r[0] == cls), key=lambda r: -r[1])
+        tp = np.array([r[2] for r in cls_records], dtype=np.float64)
+        if tp.size == 0:
+            aps[cls] = 0.0
+            continue
+        tp_cum = np.cumsum(tp)
+        fp_cum = np.cumsum(1 - tp)
+        recall = tp_cum / num_gt
+        precision = tp_cum / (tp_cum + fp_cum)
+        aps[cls] = average_precision(recall, precision)
+    return (float(np.mean(list(aps.values()))) if aps else 0.0), aps
+
+
+def evaluate_detector(model_path, image_files, labels_dir, imgsz=640, warmup=3):
+    """
+    mAP@0.5 and latency of an ONNX detector on a labelled image set
+    
+    Returns:
+        Dictionary with map50, per-class AP and latency statistics
+    """
+    detector = OnnxDetector(model_path, imgsz=imgsz, conf_threshold=0.001)
+    
+    images = [(f, cv2.imread(str(f))) for f in image_files]
+    images = [(f, im) for f, im in images if im is not None]
+    for _, image in images[:warmup]:
+        detector([image])
+    
+    records = []
+    num_gt_per_class = {}
+    latencies = []
+    for image_file, image in images:
+        start = time.perf_counter()
+        detections = detector([image])[0]
+        latencies.append((time.perf_counter() - start) * 1000)
+        
+        gt_cls, gt_boxes = load_ground_truth(Path(labels_dir) / f"{image_file.stem}.txt", image.shape)
+        for cls in gt_cls.tolist():
+            num_gt_per_class[cls] = num_gt_per_class.get(cls, 0) + 1
+        
+        matched = np.zeros(len(gt_cls), dtype=bool)
+        for box, conf, cls in zip(detections.xyxy, detections.conf, detections.cls):
+            candidates = np.where((gt_cls == cls) & ~matched)[0]
+            is_tp = False
+            if candidates.size:
+                ious = box_iou(box, gt_boxes[candidates])
+                best = int(ious.argmax())
+                if ious[best] >= 0.5:
+                    matched[candidates[best]] = True
+                    is_tp = True
+            records.append((int(cls), float(conf), is_tp))
+    
+    mean_ap, per_class_ap = map50(records, num_gt_per_class)
+    latencies = np.array(latencies)
+    return {
+        'model': str(model_path),
+        'size_mb': Path(model_path).stat().st_size / 1024 ** 2,
+        'images': len(images),
+        'map50': mean_ap,
+        'ap50_per_class': {str(k): v for k, v in sorted(per_class_ap.items())},
+        'latency_ms_mean': float(latencies.mean()) if latencies.size else None,
+        'latency_ms_p50': float(np.percentile(latencies, 50)) if latencies.size else None,
+        'latency_ms_p95': float(np.percentile(latencies, 95)) if latencies.size else None,
+    }
+
+
+def is_training_split(images_dir, data_config):
+    """Whether `images_dir` is the train split of `data_config` (False if the config can't be read)"""
+    try:
+        data, base_dir = load_data_config(data_config)
+    except (OSError, AttributeError):
+        return False
+    train = data.get('train') or []
+    splits = train if isinstance(train, list) else [train]
+    return any((base_dir / split).resolve() == Path(images_dir).resolve() for split in splits)
+
+
+def format_ms(value):
+    return f"{value:.1f}" if value is not None else "n/a"
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description="INT8 post-training quantization of the dental YOLO detector"
+    )
+    parser.add_argument(
+        "--weights",
+        default="runs/detect/train/weights/best.pt",
+        help="Trained checkpoint (default: runs/detect/train/weights/best.pt)"
+    )
+    parser.add_argument(
+        "--onnx",
+        default=None,
+        help="Existing FP32 ONNX export to quantize (default: export --weights)"
+    )
+    parser.add_argument(
+        "--output",
+        default=None,
+        help="INT8 model path (default: <fp32 model>_int8.onnx)"
+    )
+    parser.add_argument(
+        "--calibration",
+        default=DEFAULT_CALIBRATION_FILE,
+        help=f"Calibration .npy sample or image directory (default: {DEFAULT_CALIBRATION_FILE})"
+    )
+    parser.add_argument(
+        "--calib-images",
+        type=int,
+        default=100,
+        help="Images sampled from a calibration directory (default: 100)"
+    )
+    parser.add_argument(
+        "--filter",
+        action="store_true",
+        help="Apply the Contourlet filter to calibration/validation images (for unfiltered directories)"
+    )
+    parser.add_argument(
+        "--val-images",
+        default="dataset/images",
+        help="Validation images for the report (default: dataset/images)"
+    )
+    parser.add_argument(
+        "--val-labels",
+        default="dataset/labels",
+        help="Validation labels for the report (default: dataset/labels)"
+    )
+    parser.add_argument(
+        "--imgsz",
+        type=int,
+        default=640,
+        help="Model input size (default: 640)"
+    )
+    parser.add_argument(
+        "--quantize-head",
+        action="store_true",
+        help="Also quantize the box-decoding ops of the Detect head (faster, less accurate)"
+    )
+    parser.add_argument(
+        "--data",
+        default="data.yaml",
+        help="Dataset config, used to warn when --val-images is the training split (default: data.yaml)"
+    )
+    parser.add_argument(
+        "--report",
+        default="quantization_report.json",
+        help="Where to write the FP32 vs INT8 report (default: quantization_report.json)"
+    )
+    args = parser.parse_args()
+    
+    print("=" * 60)
+    print("INT8 Post-Training Quantization")
+    print("=" * 60)
+    
+    fp32_model = args.onnx
+    if fp32_model is None:
+        print(f"\nExporting {args.weights} to ONNX...")
+        fp32_model = export_fp32_onnx(args.weights, args.imgsz)
+    print(f"✓ FP32 model: {fp32_model}")
+    
+    int8_model = args.output or str(Path(fp32_model).with_name(Path(fp32_model).stem + '_int8.onnx'))
+    
+    print(f"\nLoading calibration data from {args.calibration}...")
+    blobs = load_calibration_blobs(
+        args.calibration, args.imgsz, args.calib_images, apply_filter=args.filter
+    )
+    print(f"✓ {len(blobs)} calibration images")
+    
+    print("\nQuantizing...")
+    excluded = quantize_int8(fp32_model, int8_model, blobs, keep_head_float=not args.quantize_head)
+    print(f"✓ INT8 model: {int8_model} ({len(excluded)} head nodes kept in float)")
+    
+    val_is_train = is_training_split(args.val_images, args.data)
+    if val_is_train:
+        print(f"⚠️  {args.val_images} is the training split in {args.data}: the accuracy below is measured on "
+              "training data; pass a held-out split with --val-images/--val-labels")
+    
+    val_files = list_images(args.val_images)
+    filtered_dir = None
+    try:
+        if args.filter:
+            from contourlet_filter import ContourletTransform
+            transform = ContourletTransform()
+            filtered_dir = Path(tempfile.mkdtemp(prefix="quant_val_"))
+            for image_file in val_files:
+                image = cv2.imread(str(image_file))
+                if image is not None:
+                    cv2.imwrite(str(filtered_dir / f"{image_file.stem}.png"), transform.apply(image))
+            val_files = list_images(filtered_dir)
+        
+        print(f"\nEvaluating on {len(val_files)} validation images...")
+        fp32_report = evaluate_detector(fp32_model, val_files, args.val_labels, args.imgsz)
+        int8_report = evaluate_detector(int8_model, val_files, args.val_labels, args.imgsz)
+    finally:
+        if filtered_dir is not None:
+            shutil.rmtree(filtered_dir, ignore_errors=True)
+    
+    report = {
+        'fp32': fp32_report,
+        'int8': int8_report,
+        'map50_delta': int8_report['map50'] - fp32_report['map50'],
+        'speedup': (fp32_report['latency_ms_mean'] / int8_report['latency_ms_mean']
+                    if int8_report['latency_ms_mean'] else None),
+        'calibration': {'source': str(args.calibration), 'images': len(blobs)},
+        'validation': {
+            'images': str(args.val_images),
+            'count': len(val_files),
+            'filtered': args.filter,
+            'is_training_split': val_is_train,
+        },
+    }
+    if Path(args.calibration).suffix != '.npy':
+        # The bundled .npy tensors are used as they are; --filter only applies to image directories
+        report['calibration']['filtered'] = args.filter
+    with open(args.report, 'w') as f:
+        json.dump(report, f, indent=2)
+    
+    print(f"\n{'Model':<8}{'mAP50':>10}{'mean ms':>12}{'p95 ms':>12}{'size MB':>10}")
+    for name, r in (('FP32', fp32_report), ('INT8', int8_report)):
+        print(f"{name:<8}{r['map50']:>10.4f}{format_ms(r['latency_ms_mean']):>12}"
+              f"{format_ms(r['latency_ms_p95']):>12}{r['size_mb']:>10.1f}")
+    speedup = f"{report['speedup']:.2f}x" if report['speedup'] is not None else "n/a"
+    print(f"\nmAP50 change: {report['map50_delta']:+.4f}, speedup: {speedup}")
+    print(f"✓ Report written to {args.report}")
+    print("\nServe the INT8 model with:")
+    print(f"  INFERENCE_BACKEND=onnx ONNX_MODEL_PATH={int8_model} python inference_server.py")
+
+
+if __name__ == "__main__":
+    main()
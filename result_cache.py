@@ -0,0 +1,80 @@
+import json
+import threading
+import time
+from collections import OrderedDict
+
+
+class ResultCache:
+    """
+    In-memory LRU cache of detection results with a byte budget and TTL
+    
+    Sizes are estimated from the JSON encoding of each value, which is what
+    the server returns anyway. Entries older than `ttl_seconds` are treated
+    as misses and dropped. Thread-safe.
+    """
+    
+    def __init__(self, max_bytes=64 * 1024 * 1024, ttl_seconds=3600.0):
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+    
+    def get(self, key):
+        """Return the cached value for `key`, or None"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                value, size, stored_at = entry
+                if self.ttl_seconds and now - stored_at > self.ttl_seconds:
+                    del self._entries[key]
+                    self.bytes -= size
+                    entry = None
+                else:
+                    self._entries.move_to_end(key)
+            
+            if entry is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return value
+    
+    def put(self, key, value):
+        """Store `value` under `key`, evicting least recently used entries over budget"""
+        size = len(key) + len(json.dumps(value))
+        if size > self.max_bytes:
+            return
+        
+        with self._lock:
+            previous = self._entries.pop(key, None)
+            if previous is not None:
+                self.bytes -= previous[1]
+            self._entries[key] = (value, size, time.monotonic())
+            self.bytes += size
+            while self.bytes > self.max_bytes:
+                _, (_, evicted_size, _) = self._entries.popitem(last=False)
+                self.bytes -= evicted_size
+                self.evictions += 1
+    
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.bytes = 0
+    
+    def stats(self):
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self.bytes,
+                "max_bytes": self.max_bytes,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+            }
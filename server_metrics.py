@@ -0,0 +1,228 @@
+import math
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+
+# Seconds; covers sub-millisecond decode up to multi-second CPU forward passes
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+BATCH_SIZE_BUCKETS = (1, 2, 4, 8, 16, 32, 64)
+
+
+def _format_value(value):
+    if value == math.inf:
+        return "+Inf"
+    if float(value).is_integer():
+        return str(int(value))
+    return repr(float(value))
+
+
+def _escape_label_value(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(labels):
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label_value(value)}"' for name, value in labels) + "}"
+
+
+class _Metric:
+    metric_type = None
+    
+    def __init__(self, name, documentation, labelnames=()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._lock = threading.Lock()
+    
+    def _key(self, labels):
+        if set(labels) != set(self.labelnames):
+            raise ValueError(f"{self.name} expects labels {self.labelnames}, got {tuple(labels)}")
+        return tuple(str(labels[name]) for name in self.labelnames)
+    
+    def samples(self):
+        """Yield (suffix, label pairs, value)"""
+        raise NotImplementedError
+    
+    def render(self):
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.metric_type}"]
+        for suffix, labels, value in self.samples():
+            lines.append(f"{self.name}{suffix}{_format_labels(labels)} {_format_value(value)}")
+        return "\n".join(lines)
+
+
+class Counter(_Metric):
+    metric_type = "counter"
+    
+    def __init__(self, name, documentation, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self._values = {}
+    
+    def inc(self, amount=1, **labels):
+        key = self._key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+    
+    def samples(self):
+        with self._lock:
+            values = sorted(self._values.items())
+        for key, value in values:
+            yield "", list(zip(self.labelnames, key)), value
+
+
+class Histogram(_Metric):
+    metric_type = "histogram"
+    
+    def __init__(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        super().__init__(name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+        self._values = {}
+    
+    def observe(self, value, **labels):
+        key = self._key(labels)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0, 0.0]
+            counts = entry[0]
+            for idx, bound in enumerate(self.buckets):
+                if value <= bound:
+                    counts[idx] += 1
+                    break
+            entry[1] += 1
+            entry[2] += value
+    
+    def samples(self):
+        with self._lock:
+            values = sorted((key, (list(counts), count, total)) for key, (counts, count, total) in self._values.items())
+        for key, (counts, count, total) in values:
+            labels = list(zip(self.labelnames, key))
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                yield "_bucket", labels + [("le", _format_value(bound))], cumulative
+            yield "_bucket", labels + [("le", "+Inf")], count
+            yield "_count", labels, count
+            yield "_sum", labels, total
+
+
+class Gauge(_Metric):
+    """
+    Gauge read from a callback at scrape time
+    
+    `read` returns a number, a {label tuple: number} dict for labelled
+    gauges, or None to skip the metric (e.g. a disabled cache).
+    """
+    metric_type = "gauge"
+    
+    def __init__(self, name, documentation, read, labelnames=()):
+        super().__init__(name, documentation, labelnames)
+        self.read = read
+    
+    def samples(self):
+        value = self.read()
+        if value is None:
+            return
+        if not self.labelnames:
+            yield "", [], value
+            return
+        for key, item in sorted(value.items()):
+            key = key if isinstance(key, tuple) else (key,)
+            yield "", list(zip(self.labelnames, key)), item
+
+
+class CounterFunction(Gauge):
+    """Counter read from a callback, for totals another object already keeps (e.g. cache hits)"""
+    metric_type = "counter"
+
+
+class MetricsRegistry:
+    """
+    Minimal Prometheus text-format registry
+    
+    Metrics live in process memory, so with several worker processes each
+    scrape reports only the worker that answered it.
+    """
+    
+    def __init__(self):
+        self._metrics = []
+        self._lock = threading.Lock()
+    
+    def register(self, metric):
+        with self._lock:
+            self._metrics.append(metric)
+        return metric
+    
+    def counter(self, name, documentation, labelnames=()):
+        return self.register(Counter(name, documentation, labelnames))
+    
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self.register(Histogram(name, documentation, labelnames, buckets))
+    
+    def gauge(self, name, documentation, read, labelnames=()):
+        return self.register(Gauge(name, documentation, read, labelnames))
+    
+    def counter_function(self, name, documentation, read, labelnames=()):
+        return self.register(CounterFunction(name, documentation, read, labelnames))
+    
+    def render(self):
+        with self._lock:
+            metrics = list(self._metrics)
+        blocks = []
+        for metric in metrics:
+            try:
+                blocks.append(metric.render())
+            except Exception as e:
+                blocks.append(f"# {metric.name} unavailable: {e}")
+        return "\n".join(blocks) + "\n"
+
+
+def process_memory_bytes():
+    """Resident set size of this process in bytes, or None if unavailable"""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    try:
+        import psutil
+        return psutil.Process().memory_info().rss
+    except ImportError:
+        return None
+
+
+class StageTimer:
+    """
+    Per-request stage timings, for histograms and a Server-Timing header
+    
+    Repeated stages (e.g. one decode per image of a batch request) are summed
+    for the header and observed individually in `histogram`.
+    
+    Usage:
+        timer = StageTimer(histogram)
+        with timer.stage("decode"):
+            ...
+        timer.header()  # 'decode;dur=1.23'
+    """
+    
+    def __init__(self, histogram=None):
+        self.histogram = histogram
+        self.stages = {}
+    
+    @contextmanager
+    def stage(self, name):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - start)
+    
+    def add(self, name, seconds):
+        self.stages[name] = self.stages.get(name, 0.0) + seconds
+        if self.histogram is not None:
+            self.histogram.observe(seconds, stage=name)
+    
+    def header(self):
+        return ", ".join(f"{name};dur={seconds * 1000:.2f}" for name, seconds in self.stages.items())
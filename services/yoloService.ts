@@ -36,25 +36,77 @@ export interface YoloDetection {
 
 const classNames = ['No Endodontic Treatment', 'Incomplete Endodontic Treatment', 'Complete Endodontic Treatment', 'Total Endodontic Failure'];
 
-export const detectObjects = async (imageElement: HTMLImageElement): Promise<YoloDetection[]> => {
+export interface StudyResult {
+  index: number;
+  detections?: YoloDetection[];
+  error?: string;
+}
+
+// Submit a multi-image study as a background job and stream per-image results
+// as they finish. Resolves with the job ID once the server accepts the job;
+// onResult fires once per image (in completion order) and onDone at the end.
+export const detectStudy = async (
+  images: Blob[],
+  onResult: (result: StudyResult) => void,
+  onDone?: (status: string) => void
+): Promise<string> => {
+  const form = new FormData();
+  images.forEach((image, idx) => form.append('images', image, `image-${idx}.jpg`));
+
+  const response = await fetch('http://localhost:5000/jobs', {
+    method: 'POST',
+    body: form,
+  });
+  if (!response.ok) {
+    throw new Error(`Job submission failed: ${response.status} ${response.statusText}`);
+  }
+  const job = await response.json();
+
+  // EventSource reconnects on its own and resumes from the last event ID
+  const events = new EventSource(`http://localhost:5000${job.events_url}`);
+  events.addEventListener('result', (event) => {
+    const result: StudyResult = JSON.parse((event as MessageEvent).data);
+    if (result.detections) {
+      result.detections = result.detections.filter(
+        (det) => det.class !== 'No Endodontic Treatment'
+      );
+    }
+    onResult(result);
+  });
+  events.addEventListener('done', (event) => {
+    events.close();
+    onDone?.(JSON.parse((event as MessageEvent).data).status);
+  });
+
+  return job.job_id;
+};
+
+// `model` selects one of the server's registered models (see GET /models); the default otherwise
+export const detectObjects = async (imageElement: HTMLImageElement, model?: string): Promise<YoloDetection[]> => {
   try {
-    // Convert image to base64 for server
+    // Encode image as a binary JPEG for the server (no base64/JSON wrapping)
     const canvas = document.createElement('canvas');
     const ctx = canvas.getContext('2d')!;
     canvas.width = imageElement.naturalWidth;
     canvas.height = imageElement.naturalHeight;
     ctx.drawImage(imageElement, 0, 0);
 
-    const base64Image = canvas.toDataURL('image/jpeg');
+    const imageBlob = await new Promise<Blob | null>((resolve) =>
+      canvas.toBlob(resolve, 'image/jpeg')
+    );
+    if (!imageBlob) {
+      throw new Error('Could not encode image');
+    }
 
     // Call server-side inference
     console.log('Calling server-side YOLO inference...');
-    const response = await fetch('http://localhost:5000/detect', {
+    const query = model ? `?model=${encodeURIComponent(model)}` : '';
+    const response = await fetch(`http://localhost:5000/detect${query}`, {
       method: 'POST',
       headers: {
-        'Content-Type': 'application/json',
+        'Content-Type': 'application/octet-stream',
       },
-      body: JSON.stringify({ image: base64Image }),
+      body: imageBlob,
     });
 
     if (response.ok) {
@@ -0,0 +1,81 @@
+import cv2
+from ultralytics.data import YOLODataset
+from ultralytics.models.yolo.detect import DetectionTrainer
+
+from contourlet_dataset import detection_dataset_kwargs
+from image_shards import ImageShard
+
+
+class ShardYOLODataset(YOLODataset):
+    """
+    YOLODataset reading pre-decoded images and labels from an ImageShard
+    
+    `img_path` is a shard directory written by image_shards.py. Images come
+    out of the memory-mapped shard already at the training resolution, so the
+    hot loop does no JPEG decoding or resizing, and labels come from the shard
+    index instead of the label files and labels.cache.
+    """
+    
+    def __init__(self, *args, **kwargs):
+        # get_img_files runs inside YOLODataset.__init__
+        self.shard = None
+        super().__init__(*args, **kwargs)
+    
+    def _open_shard(self, img_path):
+        if self.shard is None:
+            self.shard = ImageShard(img_path)
+            if self.shard.imgsz != self.imgsz:
+                raise ValueError(
+                    f"{img_path} was packed at imgsz={self.shard.imgsz}, training uses {self.imgsz}; "
+                    f"repack with: python image_shards.py --imgsz {self.imgsz}"
+                )
+        return self.shard
+    
+    def get_img_files(self, img_path):
+        im_files = self._open_shard(img_path).im_files
+        if self.fraction < 1:
+            im_files = im_files[: round(len(im_files) * self.fraction)]
+        return im_files
+    
+    def get_labels(self):
+        labels = []
+        for i, im_file in enumerate(self.im_files):
+            cls, bboxes = self.shard.image_labels(i)
+            labels.append(dict(
+                im_file=im_file,
+                shape=self.shard.image(i)[1],
+                cls=cls,
+                bboxes=bboxes,
+                segments=[],
+                keypoints=None,
+                normalized=True,
+                bbox_format="xywh",
+            ))
+        return labels
+    
+    def load_image(self, i, rect_mode=True):
+        im, hw_original = self.shard.image(i)
+        if im.shape[2] == 1:
+            im = cv2.cvtColor(im, cv2.COLOR_GRAY2BGR)
+        if not rect_mode:
+            im = cv2.resize(im, (self.imgsz, self.imgsz), interpolation=cv2.INTER_LINEAR)
+        
+        # Same mosaic buffer bookkeeping as BaseDataset.load_image; the
+        # buffered entries are views into the shard, not copies
+        if self.augment:
+            self.ims[i], self.im_hw0[i], self.im_hw[i] = im, hw_original, im.shape[:2]
+            self.buffer.append(i)
+            if 1 < len(self.buffer) >= self.max_buffer_length:
+                j = self.buffer.pop(0)
+                self.ims[j], self.im_hw0[j], self.im_hw[j] = None, None, None
+        return im, hw_original, im.shape[:2]
+
+
+class ShardDetectionTrainer(DetectionTrainer):
+    """DetectionTrainer whose train/val datasets read from image shards"""
+    
+    def build_dataset(self, img_path, mode="train", batch=None):
+        kwargs = detection_dataset_kwargs(self, img_path, mode, batch)
+        # The shard already is a decoded-image cache
+        kwargs['cache'] = None
+        return ShardYOLODataset(**kwargs)
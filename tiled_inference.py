@@ -0,0 +1,175 @@
+from collections import namedtuple
+
+import cv2
+import numpy as np
+
+from onnx_backend import BoxArrays, MAX_WH
+
+
+# Top-left corner of a tile in the full image, and the tile itself (a view, not a copy)
+Tile = namedtuple('Tile', ['x', 'y', 'image'])
+
+MERGE_METHODS = ('nms', 'wbf')
+
+
+def tile_starts(length, tile_size, overlap):
+    """Start offsets of overlapping tiles covering [0, length); the last tile ends exactly at `length`"""
+    if length <= tile_size:
+        return [0]
+    stride = max(1, int(tile_size * (1.0 - overlap)))
+    starts = list(range(0, length - tile_size, stride))
+    starts.append(length - tile_size)
+    return starts
+
+
+def needs_tiling(shape, tile_size, min_scale=1.5):
+    """Only images noticeably larger than one tile are worth splitting"""
+    return max(shape[:2]) > tile_size * min_scale
+
+
+def make_tiles(image, tile_size=640, overlap=0.2):
+    """
+    Split an image into overlapping `tile_size` squares
+    
+    Args:
+        image: HxW or HxWxC array
+        tile_size: Tile side in pixels (the model input size is the natural choice)
+        overlap: Fraction of a tile shared with its neighbour; objects smaller than
+            overlap * tile_size are always fully inside at least one tile
+    
+    Returns:
+        List of Tile, row by row
+    """
+    height, width = image.shape[:2]
+    return [
+        Tile(x, y, image[y:y + tile_size, x:x + tile_size])
+        for y in tile_starts(height, tile_size, overlap)
+        for x in tile_starts(width, tile_size, overlap)
+    ]
+
+
+def _box_iou(box, boxes):
+    """IoU of one xyxy box against an (n, 4) array"""
+    top_left = np.maximum(box[:2], boxes[:, :2])
+    bottom_right = np.minimum(box[2:], boxes[:, 2:])
+    inter = np.clip(bottom_right - top_left, 0, None).prod(axis=1)
+    area = (box[2:] - box[:2]).prod()
+    areas = (boxes[:, 2:] - boxes[:, :2]).prod(axis=1)
+    return inter / (area + areas - inter + 1e-9)
+
+
+def _nms(xyxy, conf, cls, iou_threshold):
+    # cv2.dnn.NMSBoxes takes x, y, w, h; offset classes so they never overlap
+    offset = cls[:, None].astype(np.float32) * MAX_WH
+    xywh = np.concatenate([xyxy[:, :2] + offset, xyxy[:, 2:] - xyxy[:, :2]], axis=1)
+    indices = cv2.dnn.NMSBoxes(xywh.tolist(), conf.tolist(), 0.0, iou_threshold)
+    indices = np.asarray(indices, dtype=np.int64).reshape(-1)
+    indices = indices[np.argsort(-conf[indices], kind='stable')]
+    return BoxArrays(xyxy[indices], conf[indices], cls[indices])
+
+
+def _weighted_box_fusion(xyxy, conf, cls, iou_threshold):
+    """
+    Weighted box fusion within each class
+    
+    Boxes are visited by decreasing confidence and join the first cluster whose
+    fused box they overlap by `iou_threshold`; a cluster's box is the
+    confidence-weighted mean of its members and its score their mean
+    confidence. Unlike multi-model WBF the score is not rescaled by the number
+    of sources, since an object is only visible in the tiles that cover it.
+    """
+    fused_boxes, fused_conf, fused_cls = [], [], []
+    for class_id in np.unique(cls):
+        members = np.flatnonzero(cls == class_id)
+        members = members[np.argsort(-conf[members], kind='stable')]
+        clusters = []
+        cluster_boxes = np.zeros((0, 4), dtype=np.float64)
+        for idx in members:
+            if len(clusters):
+                overlap = _box_iou(xyxy[idx], cluster_boxes)
+                best = int(overlap.argmax())
+                if overlap[best] >= iou_threshold:
+                    clusters[best].append(idx)
+                    weights = conf[clusters[best]]
+                    cluster_boxes[best] = (xyxy[clusters[best]] * weights[:, None]).sum(axis=0) / weights.sum()
+                    continue
+            clusters.append([idx])
+            cluster_boxes = np.vstack([cluster_boxes, xyxy[idx]])
+        
+        fused_boxes.append(cluster_boxes)
+        fused_conf.extend(conf[cluster].mean() for cluster in clusters)
+        fused_cls.extend([class_id] * len(clusters))
+    
+    fused_conf = np.asarray(fused_conf, dtype=np.float32)
+    order = np.argsort(-fused_conf, kind='stable')
+    return BoxArrays(
+        np.concatenate(fused_boxes).astype(np.float32)[order],
+        fused_conf[order],
+        np.asarray(fused_cls, dtype=np.int64)[order]
+    )
+
+
+def _cut_by_tile_edge(xyxy, tile, image_width, image_height, edge_margin):
+    """Boxes touching a tile edge that is not also an image edge (i.e. likely truncated)"""
+    tile_height, tile_width = tile.image.shape[:2]
+    cut = np.zeros(len(xyxy), dtype=bool)
+    if tile.x > 0:
+        cut |= xyxy[:, 0] <= edge_margin
+    if tile.y > 0:
+        cut |= xyxy[:, 1] <= edge_margin
+    if tile.x + tile_width < image_width:
+        cut |= xyxy[:, 2] >= tile_width - edge_margin
+    if tile.y + tile_height < image_height:
+        cut |= xyxy[:, 3] >= tile_height - edge_margin
+    return cut
+
+
+def merge_tile_detections(tile_detections, tiles, full_image_detections=None, iou_threshold=0.5,
+                          method='nms', edge_margin=2):
+    """
+    Map per-tile detections back to full-image coordinates and merge duplicates
+    
+    Boxes cut off by an inner tile edge are dropped first: the neighbouring
+    tile (for objects smaller than the overlap) or the whole-image pass sees
+    those objects complete, and the truncated part would otherwise survive
+    NMS as a second, smaller box.
+    
+    Args:
+        tile_detections: One BoxArrays per tile, in tile pixel coordinates
+        tiles: The Tiles they came from
+        full_image_detections: Optional BoxArrays from a pass over the whole
+            (downscaled) image, which catches objects larger than a tile
+        iou_threshold: Overlap above which two same-class boxes are the same object
+        method: 'nms' keeps the most confident box, 'wbf' averages them
+        edge_margin: Distance in pixels from an inner tile edge that counts as cut off
+    
+    Returns:
+        BoxArrays in full-image pixel coordinates, most confident first
+    """
+    if method not in MERGE_METHODS:
+        raise ValueError(f"method must be one of {MERGE_METHODS}, got {method!r}")
+    
+    image_width = max((tile.x + tile.image.shape[1] for tile in tiles), default=0)
+    image_height = max((tile.y + tile.image.shape[0] for tile in tiles), default=0)
+    
+    xyxy, conf, cls = [], [], []
+    for tile, detections in zip(tiles, tile_detections):
+        tile_xyxy = np.asarray(detections.xyxy, dtype=np.float32).reshape(-1, 4)
+        keep = ~_cut_by_tile_edge(tile_xyxy, tile, image_width, image_height, edge_margin)
+        xyxy.append(tile_xyxy[keep] + np.array([tile.x, tile.y, tile.x, tile.y], dtype=np.float32))
+        conf.append(np.asarray(detections.conf, dtype=np.float32).reshape(-1)[keep])
+        cls.append(np.asarray(detections.cls).astype(np.int64).reshape(-1)[keep])
+    if full_image_detections is not None:
+        xyxy.append(np.asarray(full_image_detections.xyxy, dtype=np.float32).reshape(-1, 4))
+        conf.append(np.asarray(full_image_detections.conf, dtype=np.float32).reshape(-1))
+        cls.append(np.asarray(full_image_detections.cls).astype(np.int64).reshape(-1))
+    
+    xyxy = np.concatenate(xyxy) if xyxy else np.zeros((0, 4), np.float32)
+    conf = np.concatenate(conf) if conf else np.zeros(0, np.float32)
+    cls = np.concatenate(cls) if cls else np.zeros(0, np.int64)
+    if not len(conf):
+        return BoxArrays(xyxy, conf, cls)
+    
+    if method == 'wbf':
+        return _weighted_box_fusion(xyxy, conf, cls, iou_threshold)
+    return _nms(xyxy, conf, cls, iou_threshold)
@@ -1,7 +1,105 @@
 from ultralytics import YOLO
 import argparse
 import os
+import shutil
+from pathlib import Path
 import torch
+import yaml
+
+from dataset_paths import labels_dir_for, list_images, load_data_config
+
+
+def _link_or_copy(src, dst):
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copy2(src, dst)
+
+
+def prepare_cached_filtered_dataset(
+    data_config='data.yaml',
+    cache_dir='.contourlet_cache',
+    output_root='dataset/filtered_views',
+    source_images=None,
+    num_levels=2,
+    num_directions=8,
+    cache_max_bytes=None
+):
+    """
+    Build a Contourlet-filtered copy of a dataset from the filtered-image cache
+    
+    Every image referenced by `data_config` is looked up in (or added to) the
+    FilteredImageCache and hard-linked into a per-parameter dataset view next
+    to a copy of its labels, so the original images are never overwritten and
+    training with already-seen parameters does not refilter anything.
+    
+    Args:
+        data_config: Path to data.yaml configuration
+        cache_dir: FilteredImageCache directory
+        output_root: Directory holding the generated dataset views
+        source_images: Directory with the unfiltered images to use instead of the
+            image directories in `data_config` (e.g. dataset/images_original when
+            dataset/images was filtered in place); labels still come from `data_config`
+        num_levels: Number of pyramid levels for Contourlet
+        num_directions: Number of directional filters
+        cache_max_bytes: Size budget of the filtered-image cache
+    
+    Returns:
+        Path to the generated data yaml
+    """
+    from contourlet_filter import ContourletTransform
+    from filter_cache import DEFAULT_MAX_BYTES, FilteredImageCache, filter_cache_key
+    
+    data, base_dir = load_data_config(data_config)
+    
+    transform = ContourletTransform(num_levels=num_levels, num_directions=num_directions)
+    cache = FilteredImageCache(cache_dir, max_bytes=cache_max_bytes or DEFAULT_MAX_BYTES)
+    view_root = Path(output_root) / filter_cache_key('view', transform.get_params())[:12]
+    
+    generated = dict(data)
+    generated['path'] = str(view_root.resolve())
+    split_dirs = {}
+    for split in ('train', 'val', 'test'):
+        if not data.get(split):
+            continue
+        images_dir = (base_dir / data[split]).resolve()
+        if images_dir in split_dirs:
+            generated[split] = split_dirs[images_dir]
+            continue
+        
+        view_images = view_root / 'images' / split
+        view_labels = view_root / 'labels' / split
+        view_images.mkdir(parents=True, exist_ok=True)
+        view_labels.mkdir(parents=True, exist_ok=True)
+        
+        label_dir = labels_dir_for(images_dir)
+        image_source = Path(source_images) if source_images else images_dir
+        image_files = list_images(image_source)
+        
+        reused = 0
+        for image_file in image_files:
+            hits_before = cache.hits
+            cached_path = cache.ensure_path(image_file.read_bytes(), transform)
+            reused += cache.hits - hits_before
+            
+            view_image = view_images / f"{image_file.stem}.png"
+            if view_image.exists():
+                view_image.unlink()
+            _link_or_copy(cached_path, view_image)
+            
+            label_file = label_dir / f"{image_file.stem}.txt"
+            if label_file.exists():
+                shutil.copy2(label_file, view_labels / label_file.name)
+        
+        print(f"  {split}: {len(image_files)} images ({reused} from cache) -> {view_images}")
+        generated[split] = str(Path('images') / split)
+        split_dirs[images_dir] = generated[split]
+    
+    generated_config = view_root / 'data.yaml'
+    with open(generated_config, 'w') as f:
+        yaml.safe_dump(generated, f, sort_keys=False)
+    
+    return str(generated_config)
 
 
 def train_yolo(
@@ -14,7 +112,21 @@ def train_yolo(
     batch_size=16,
     device=0,
     patience=20,
-    resume=False
+    resume=False,
+    filter_cache=None,
+    filter_source=None,
+    filter_on_the_fly=False,
+    num_levels=2,
+    num_directions=8,
+    cache=False,
+    workers=8,
+    teacher=None,
+    teacher_imgsz=640,
+    teacher_cache='.teacher_cache',
+    distill_conf=0.5,
+    distill_weight=1.0,
+    distill_temperature=2.0,
+    shards=None
 ):
     """
     Train YOLO model for dental X-ray analysis
@@ -30,18 +142,81 @@ def train_yolo(
         device: GPU device index (0 for first GPU) or 'cpu'
         patience: Early stopping patience
         resume: Resume training from checkpoint
+        filter_cache: With use_filtered, build the filtered dataset from this
+            FilteredImageCache directory instead of using pre-filtered images
+        filter_source: Unfiltered image directory for the cached view
+        filter_on_the_fly: With use_filtered, apply the Contourlet transform inside
+            the dataloader workers instead of reading pre-filtered images
+        num_levels: Contourlet pyramid levels (cached view / on-the-fly filtering)
+        num_directions: Contourlet directional filters (cached view / on-the-fly filtering)
+        cache: Ultralytics image cache: False, 'ram' (with on-the-fly filtering this
+            holds the filtered images) or 'disk'
+        workers: Dataloader worker processes
+        teacher: Trained (larger) model to distill from; `model_path`/`imgsz` then
+            describe the student, e.g. yolov8n.pt at 416
+        teacher_imgsz: Image size the teacher predicts at
+        teacher_cache: Directory where teacher predictions are cached
+        distill_conf: Minimum teacher confidence for a box to join the labels as a pseudo-label
+        distill_weight: Weight of the soft-target loss against the teacher's outputs
+            (0 = pseudo-labels only)
+        distill_temperature: Softening temperature of that loss
+        shards: Directory written by image_shards.py; images are read pre-decoded
+            (and pre-filtered, if packed with --filtered) from its memory-mapped shards
     """
     
     print("=" * 60)
     print("YOLO Dental Detection Model Training")
     print("=" * 60)
     
-    if use_filtered:
+    trainer = None
+    if shards:
+        if teacher:
+            print("\n✗ --shards cannot be combined with --teacher")
+            return False
+        from shard_dataset import ShardDetectionTrainer
+        trainer = ShardDetectionTrainer
+        data_config = str(Path(shards) / 'data.yaml')
+        print(f"\n✓ Reading pre-decoded images from shards: {shards}")
+        if use_filtered:
+            print("    Filtering is fixed when the shards are packed (image_shards.py --filtered)")
+    elif use_filtered and filter_on_the_fly:
+        from contourlet_dataset import make_contourlet_trainer
+        trainer = make_contourlet_trainer(num_levels=num_levels, num_directions=num_directions)
+        print("\n✓ Applying Contourlet filter on the fly in the dataloader workers")
+        print(f"    {data_config} must point at unfiltered images")
+    elif use_filtered and filter_cache:
+        print(f"\n✓ Building Contourlet-filtered dataset from cache: {filter_cache}")
+        data_config = prepare_cached_filtered_dataset(
+            data_config=data_config,
+            cache_dir=filter_cache,
+            source_images=filter_source,
+            num_levels=num_levels,
+            num_directions=num_directions
+        )
+        print(f"  Data config: {data_config}")
+    elif use_filtered:
         print("\n⚠️  Using Contourlet-filtered images for training")
         print("    Make sure you've run: python preprocess_dataset.py")
     else:
         print("\n✓ Training with raw images")
     
+    if teacher:
+        # Replaces the on-the-fly Contourlet trainer, filtering with the same parameters
+        from distillation import make_distillation_trainer
+        contourlet_params = None
+        if use_filtered and filter_on_the_fly:
+            contourlet_params = {'num_levels': num_levels, 'num_directions': num_directions}
+        trainer = make_distillation_trainer(
+            teacher,
+            cache_dir=teacher_cache,
+            teacher_imgsz=teacher_imgsz,
+            distill_conf=distill_conf,
+            contourlet_params=contourlet_params,
+            distill_weight=distill_weight,
+            distill_temperature=distill_temperature
+        )
+        print(f"\n✓ Distilling from teacher: {teacher} (pseudo-labels cached in {teacher_cache})")
+    
     # Auto-detect device if needed
     if device == "auto":
         if torch.cuda.is_available():
@@ -64,11 +239,16 @@ def train_yolo(
     else:
         print(f"\n✓ Using device: {device}")
     
-    print(f"\nConfiguration:")
+    print("\nConfiguration:")
     print(f"  Model: {model_path}")
+    if teacher:
+        print(f"  Teacher: {teacher}, soft-target loss weight {distill_weight} (T={distill_temperature}), "
+              f"pseudo-labels @ {teacher_imgsz} with conf >= {distill_conf}")
     print(f"  Epochs: {epochs}")
     print(f"  Image size: {imgsz}x{imgsz}")
     print(f"  Batch size: {batch_size}")
+    print(f"  Workers: {workers}")
+    print(f"  Image cache: {cache or 'none'}")
     print(f"  Device: {device}")
     print(f"  Data config: {data_config}")
     print(f"  Output model: {output_model}")
@@ -92,7 +272,10 @@ def train_yolo(
             patience=patience,
             resume=resume,
             save=True,
-            verbose=True
+            verbose=True,
+            cache=cache,
+            workers=workers,
+            trainer=trainer
         )
         
         print("\n✓ Training completed successfully")
@@ -110,9 +293,9 @@ def train_yolo(
         return False
     
     try:
-        print(f"\nExporting to ONNX format...")
+        print("\nExporting to ONNX format...")
         model.export(format='onnx')
-        print(f"✓ ONNX export completed")
+        print("✓ ONNX export completed")
     except Exception as e:
         print(f"⚠️  ONNX export warning: {e}")
     
@@ -132,6 +315,84 @@ if __name__ == "__main__":
         action="store_true",
         help="Use Contourlet-filtered images (requires preprocessing)"
     )
+    parser.add_argument(
+        "--filter-cache",
+        default=None,
+        help="With --filtered, build the filtered dataset from this filtered-image cache directory"
+    )
+    parser.add_argument(
+        "--filter-source",
+        default=None,
+        help="Unfiltered images for --filter-cache (e.g. dataset/images_original)"
+    )
+    parser.add_argument(
+        "--filter-on-the-fly",
+        action="store_true",
+        help="With --filtered, run the Contourlet filter inside the dataloader workers"
+    )
+    parser.add_argument(
+        "--levels",
+        type=int,
+        default=2,
+        help="Contourlet pyramid levels for --filter-cache/--filter-on-the-fly (default: 2)"
+    )
+    parser.add_argument(
+        "--directions",
+        type=int,
+        default=8,
+        help="Contourlet directional filters for --filter-cache/--filter-on-the-fly (default: 8)"
+    )
+    parser.add_argument(
+        "--cache",
+        choices=["none", "ram", "disk"],
+        default="none",
+        help="Cache loaded images; with --filter-on-the-fly 'ram' keeps filtered images (default: none)"
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=8,
+        help="Dataloader worker processes (default: 8)"
+    )
+    parser.add_argument(
+        "--shards",
+        default=None,
+        help="Train from memory-mapped shards written by image_shards.py (directory with data.yaml)"
+    )
+    parser.add_argument(
+        "--teacher",
+        default=None,
+        help="Trained teacher model to distill from; --model/--imgsz then set the student"
+    )
+    parser.add_argument(
+        "--teacher-imgsz",
+        type=int,
+        default=640,
+        help="Image size the teacher predicts at (default: 640)"
+    )
+    parser.add_argument(
+        "--teacher-cache",
+        default=".teacher_cache",
+        help="Directory for cached teacher predictions (default: .teacher_cache)"
+    )
+    parser.add_argument(
+        "--distill-conf",
+        type=float,
+        default=0.5,
+        help="Minimum teacher confidence for a box to be added to the labels as a pseudo-label (default: 0.5)"
+    )
+    parser.add_argument(
+        "--distill-weight",
+        type=float,
+        default=1.0,
+        help="Weight of the soft-target loss against the teacher's outputs, 0 for pseudo-labels only (default: 1.0)"
+    )
+    parser.add_argument(
+        "--distill-temperature",
+        type=float,
+        default=2.0,
+        help="Softening temperature of the soft-target loss (default: 2.0)"
+    )
     parser.add_argument(
         "--epochs",
         type=int,
@@ -188,7 +449,21 @@ if __name__ == "__main__":
         batch_size=args.batch_size,
         device=args.device,
         patience=args.patience,
-        resume=args.resume
+        resume=args.resume,
+        filter_cache=args.filter_cache,
+        filter_source=args.filter_source,
+        filter_on_the_fly=args.filter_on_the_fly,
+        num_levels=args.levels,
+        num_directions=args.directions,
+        cache=False if args.cache == "none" else args.cache,
+        workers=args.workers,
+        teacher=args.teacher,
+        teacher_imgsz=args.teacher_imgsz,
+        teacher_cache=args.teacher_cache,
+        distill_conf=args.distill_conf,
+        distill_weight=args.distill_weight,
+        distill_temperature=args.distill_temperature,
+        shards=args.shards
     )
     
     exit(0 if success else 1)
\ No newline at end of file
@@ -3,34 +3,90 @@ from ultralytics import YOLO
 import cv2
 import numpy as np
 import base64
-from PIL import Image
-import io
+import binascii
+import os
+import threading
 
 app = Flask(__name__)
 
-# Load the trained model
+# Load the trained model (before any worker fork, so workers share it copy-on-write)
 print("Loading YOLO model...")
 model = YOLO('runs/detect/train/weights/best.pt')
 print("Model loaded successfully")
 
+# Ultralytics predictors are not thread-safe, so inference is serialized per
+# process; at most max_pending_requests requests wait for it before new ones
+# get an immediate 503. 0 = unlimited.
+max_pending_requests = int(os.environ.get('MAX_PENDING_REQUESTS', 4))
+pending_requests = 0
+pending_lock = threading.Lock()
+inference_lock = threading.Lock()
+
+def init_worker(num_threads):
+    """Per-worker-process setup after fork"""
+    import torch
+    torch.set_num_threads(num_threads)
+
 @app.route('/detect', methods=['POST'])
 def detect():
+    global pending_requests
+    with pending_lock:
+        if max_pending_requests > 0 and pending_requests >= max_pending_requests:
+            response = jsonify({'error': 'Server busy, retry later'})
+            response.headers['Retry-After'] = '1'
+            return response, 503
+        pending_requests += 1
     try:
-        data = request.get_json()
+        return run_detection()
+    finally:
+        with pending_lock:
+            pending_requests -= 1
+
+def read_image():
+    """Decode the request's image into a BGR numpy array, raising ValueError for bad input"""
+    if request.mimetype == 'multipart/form-data':
+        # File upload
+        upload = request.files.get('image') or next(iter(request.files.values()), None)
+        image_bytes = upload.read() if upload else b''
+    elif request.mimetype == 'application/json':
+        data = request.get_json(silent=True)
+        if not isinstance(data, dict) or not isinstance(data.get('image'), str):
+            raise ValueError('No image provided')
         image_data = data['image']
 
-        # Decode base64 image
-        image_data = image_data.split(',')[1]  # Remove data:image/jpeg;base64,
-        image_bytes = base64.b64decode(image_data)
+        # Decode base64 image, with or without the data:image/jpeg;base64, prefix
+        if ',' in image_data:
+            image_data = image_data.split(',', 1)[1]
+        try:
+            image_bytes = base64.b64decode(image_data, validate=True)
+        except binascii.Error as e:
+            raise ValueError(f'Invalid base64 image data: {e}') from e
+    else:
+        # Raw binary body (application/octet-stream or image/*)
+        image_bytes = request.get_data(cache=False)
+
+    if not image_bytes:
+        raise ValueError('Empty image')
 
-        # Convert to PIL Image
-        image = Image.open(io.BytesIO(image_bytes))
+    # Decode straight into a BGR numpy array
+    try:
+        image_np = cv2.imdecode(np.frombuffer(image_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+    except cv2.error as e:
+        raise ValueError(f'Could not decode image: {e}') from e
+    if image_np is None:
+        raise ValueError('Could not decode image')
+    return image_np
 
-        # Convert to numpy array
-        image_np = np.array(image)
+def run_detection():
+    try:
+        try:
+            image_np = read_image()
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
         # Run inference
-        results = model(image_np)
+        with inference_lock:
+            results = model(image_np)
 
         # Process results
         detections = []
@@ -70,5 +126,62 @@ def detect():
         print(f"Error in detection: {e}")
         return jsonify({'error': str(e)}), 500
 
+def serve_production(host='0.0.0.0', port=5000, workers=2):
+    """
+    Serve with multiple worker processes
+    
+    Uses gunicorn where available, forking the workers after the model has
+    been loaded; falls back to a single waitress process (e.g. on Windows).
+    Each worker gets an equal share of the cores for torch.
+    """
+    inference_threads = max(1, (os.cpu_count() or 1) // max(1, workers))
+    request_threads = max(1, max_pending_requests) + 2
+    
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        BaseApplication = None
+    
+    if BaseApplication is None:
+        from waitress import serve
+        print(f"gunicorn not available, serving with waitress (1 process, {request_threads} threads)")
+        init_worker(inference_threads)
+        serve(app, host=host, port=port, threads=request_threads)
+        return
+    
+    class ProductionApplication(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f'{host}:{port}')
+            self.cfg.set('workers', workers)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', request_threads)
+            self.cfg.set('preload_app', True)
+            self.cfg.set('timeout', 120)
+            self.cfg.set('post_fork', lambda server, worker: init_worker(inference_threads))
+        
+        def load(self):
+            return app
+    
+    print(f"Serving with gunicorn ({workers} workers x {request_threads} threads, "
+          f"{inference_threads} inference threads each)")
+    ProductionApplication().run()
+
 if __name__ == '__main__':
-    app.run(host='0.0.0.0', port=5000, debug=True)
\ No newline at end of file
+    import argparse
+    
+    parser = argparse.ArgumentParser(description="Dental X-Ray Detection Server (minimal)")
+    parser.add_argument("--host", default="0.0.0.0", help="Bind address (default: 0.0.0.0)")
+    parser.add_argument("--port", type=int, default=5000, help="Port (default: 5000)")
+    parser.add_argument(
+        "--production",
+        action="store_true",
+        help="Serve with multiple worker processes instead of the Flask development server"
+    )
+    parser.add_argument("--workers", type=int, default=2, help="Worker processes in --production mode (default: 2)")
+    args = parser.parse_args()
+    
+    if args.production:
+        serve_production(host=args.host, port=args.port, workers=args.workers)
+    else:
+        # Development server: no debugger or reloader (the reloader loads the model twice)
+        app.run(host=args.host, port=args.port, threaded=True)
\ No newline at end of file